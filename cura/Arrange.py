@@ -28,12 +28,37 @@ class Arrange:
         self.shape = (x, y)
         self._priority = numpy.zeros((x, y), dtype=numpy.int32)
         self._priority_unique_values = []
-        self._occupied = numpy.zeros((x, y), dtype=numpy.int32)
+        # Occupied cells, 8 cells per byte along the second axis. See _occupied for the unpacked grid.
+        self._occupied_bits = numpy.zeros((x, (y + 7) // 8), dtype=numpy.uint8)
         self._scale = scale  # convert input coordinates to arrange coordinates
         self._offset_x = offset_x
         self._offset_y = offset_y
         self._last_priority = 0
 
+    ##  Grid with 1 for occupied cells and 0 for free cells, unpacked from the bitset
+    #   Every read unpacks the whole grid, so read it once and keep the result. Changing the
+    #   returned array has no effect, assign a new grid instead.
+    @property
+    def _occupied(self):
+        return numpy.unpackbits(self._occupied_bits, axis=1, count=self.shape[1])
+
+    @_occupied.setter
+    def _occupied(self, occupied):
+        self._occupied_bits = numpy.packbits(numpy.asarray(occupied) != 0, axis=1)
+
+    ##  Return the occupied cells in rows y0:y1 and columns x0:x1 as uint8 array
+    #   Only the bytes that cover the columns are unpacked.
+    def _occupiedRegion(self, y0, y1, x0, x1):
+        first_byte = x0 // 8
+        bits = numpy.unpackbits(self._occupied_bits[y0:y1, first_byte:(x1 + 7) // 8], axis=1)
+        return bits[:, x0 - first_byte * 8:x1 - first_byte * 8]
+
+    ##  Return whether any cell in rows y0:y1 and columns x0:x1 may be occupied, without unpacking
+    #   The check is done on the packed bytes, which also cover up to 7 cells left and right of the
+    #   columns: False means that all cells are free, True that the cells have to be checked.
+    def _mayBeOccupied(self, y0, y1, x0, x1):
+        return bool(numpy.any(self._occupied_bits[y0:y1, x0 // 8:(x1 + 7) // 8]))
+
     ##  Helper to create an Arranger instance
     #
     #   Either fill in scene_root and create will find all sliceable nodes by itself,
@@ -45,7 +70,13 @@ class Arrange:
         global_stack = Application.getInstance().getGlobalContainerStack()
         machine_width = int(global_stack.getProperty("machine_width", "value"))
         machine_depth = int(global_stack.getProperty("machine_depth", "value"))
-        arranger = Arrange(machine_depth, machine_width, int(machine_width/2), int(machine_depth/2), scale = scale)
+        grid_width = machine_width
+        # In mirror and duplication mode only the left part of the build plate is modelled, the
+        # twins of the objects (DuplicatedNode) on the other half are not arranged themselves.
+        printable_max_x = cls._printableMaxX(global_stack)
+        if printable_max_x is not None:
+            grid_width = min(machine_width, max(int(machine_width/2 + printable_max_x), 1))
+        arranger = cls(machine_depth, grid_width, int(machine_width/2), int(machine_depth/2), scale = scale)
         arranger.centerFirst()
 
         if fixed_nodes is None:
@@ -57,26 +88,87 @@ class Arrange:
 
         # Place all objects fixed nodes
         for fixed_node in fixed_nodes:
-            arrange_align = Preferences.getInstance().getValue("mesh/arrange_align")
-            if arrange_align:
-                bb = fixed_node.getBoundingBox()
-                points = numpy.array([[bb.right, bb.back], [bb.left, bb.back], [bb.left, bb.front], [bb.right, bb.front]], dtype=numpy.float32)
-            else:
-                vertices = fixed_node.callDecoration("getConvexHull")
-                points = copy.deepcopy(vertices._points)
-
-            shape_arr = ShapeArray.fromPolygon(points, scale = scale)
+            shape_arr = ShapeArray.fromPolygon(cls.fixedNodePoints(fixed_node), scale = scale)
             arranger.place(0, 0, shape_arr)
 
         # If a build volume was set, add the disallowed areas
-        if Arrange.build_volume:
+        if Arrange.build_volume and scale == 1:
+            # The build volume keeps a raster of the disallowed areas at the resolution of the arranger
+            disallowed = Arrange.build_volume.getDisallowedAreasMask(machine_width, machine_depth)[:, :grid_width]
+            arranger.setGrid(arranger._occupied | disallowed, numpy.where(disallowed, 999, arranger._priority))
+        elif Arrange.build_volume:
             disallowed_areas = Arrange.build_volume.getDisallowedAreas()
             for area in disallowed_areas:
                 points = copy.deepcopy(area._points)
+                if printable_max_x is not None and numpy.amin(points[:, 0]) >= printable_max_x:
+                    continue  # on the half of the build plate that is not modelled
                 shape_arr = ShapeArray.fromPolygon(points, scale = scale)
                 arranger.place(0, 0, shape_arr)
         return arranger
 
+    ##  Return the x-coordinate where the printable part of the build plate ends
+    #   In mirror and duplication mode the second head prints a twin of every object on the right
+    #   side, so objects can only be placed left of this coordinate (see
+    #   BuildVolume._updateDisallowedAreas, which blocks the other side).
+    #   \return x-coordinate, or None when the whole build plate can be used
+    @classmethod
+    def _printableMaxX(cls, global_stack):
+        print_mode = global_stack.getProperty("print_mode", "value")
+        if print_mode not in ("mirror", "duplication"):
+            return None
+        printable_max_x = -Arrange.build_volume.margin if Arrange.build_volume else 0
+        if print_mode == "mirror":
+            machine_head_with_fans_polygon = global_stack.getProperty("machine_head_with_fans_polygon", "value")
+            printable_max_x -= abs(machine_head_with_fans_polygon[0][0] - machine_head_with_fans_polygon[2][0]) / 2
+        return printable_max_x
+
+    ##  Return the points of the area that a node on the build plate takes, in scene coordinates
+    #   This is the convex hull of the node, or its bounding box with mesh/arrange_align.
+    #   \param node scene node with a convex hull
+    @staticmethod
+    def fixedNodePoints(node):
+        arrange_align = Preferences.getInstance().getValue("mesh/arrange_align")
+        if arrange_align:
+            bb = node.getBoundingBox()
+            return numpy.array([[bb.right, bb.back], [bb.left, bb.back], [bb.left, bb.front], [bb.right, bb.front]], dtype=numpy.float32)
+        vertices = node.callDecoration("getConvexHull")
+        return copy.deepcopy(vertices._points)
+
+    ##  Create an arranger with the same grid, priorities and placed objects as this one
+    #   \param arranger_class class of the new arranger, the class of this arranger by default
+    def copy(self, arranger_class = None):
+        if arranger_class is None:
+            arranger_class = type(self)
+        arranger = arranger_class(self.shape[0], self.shape[1], self._offset_x, self._offset_y, scale = self._scale)
+        arranger._priority = self._priority.copy()
+        arranger._priority_unique_values = self._priority_unique_values
+        arranger._occupied_bits = self._occupied_bits.copy()
+        return arranger
+
+    ##  Replace the occupied cells and the priorities, for example to remove placed objects again
+    #   The priorities that bestSpot tries out stay the same.
+    #   \param occupied grid with the shape of the arranger, nonzero for occupied cells
+    #   \param priority grid with the shape of the arranger
+    def setGrid(self, occupied, priority):
+        self._occupied = occupied
+        self._priority = numpy.asarray(priority, dtype=numpy.int32)
+
+    ##  Replace the occupied cells and the priorities in a part of the grid
+    #   Only the packed rows of the part are unpacked and packed again.
+    #   \param y0, x0 first row and column of the part
+    #   \param occupied grid with the shape of the part, nonzero for occupied cells
+    #   \param priority grid with the shape of the part
+    def setGridRegion(self, y0, x0, occupied, priority):
+        occupied = numpy.asarray(occupied) != 0
+        priority = numpy.asarray(priority, dtype=numpy.int32)
+        y1 = y0 + occupied.shape[0]
+        x1 = x0 + occupied.shape[1]
+
+        occupied_rows = numpy.unpackbits(self._occupied_bits[y0:y1], axis=1, count=self.shape[1])
+        occupied_rows[:, x0:x1] = occupied
+        self._occupied_bits[y0:y1] = numpy.packbits(occupied_rows, axis=1)
+        self._priority[y0:y1, x0:x1] = priority
+
     ##  Find placement for a node (using offset shape) and place it (using hull shape)
     #   return the nodes that should be placed
     #   \param node
@@ -108,6 +200,78 @@ class Arrange:
             new_node.setPosition(Vector(200, center_y, 100))
         return new_node, found_spot
 
+    ##  Find placements for count copies of the same object and place them, in one pass over the grid
+    #   The result is the same as calling findNodePlacement count times, but the fit map is only
+    #   computed once and then updated around every placed copy. No nodes are created.
+    #   \param offset_shape_arr ShapeArray with offset, used to find locations
+    #   \param hull_shape_arr ShapeArray without offset, for placing the shapes
+    #   \param count number of copies to place
+    #   \return numpy array of (x, y) per copy that could be placed, at most count rows
+    def placeMany(self, offset_shape_arr, hull_shape_arr, count, step = 1):
+        result = numpy.zeros((0, 2), dtype = numpy.int64)
+        if count <= 0:
+            return result
+        fits = self.fitMap(offset_shape_arr)
+        grid_y, grid_x = self._priority.shape
+        corner_y = self._cornerIndices(grid_y, self._offset_y, offset_shape_arr.offset_y)
+        corner_x = self._cornerIndices(grid_x, self._offset_x, offset_shape_arr.offset_x)
+        shape_mask = (offset_shape_arr.arr == 1).astype(numpy.float64)
+
+        # Index of the priority of every cell in the unique priority values, -1 if it is not one of them.
+        priority_index = self._priorityIndices(self._priority)
+
+        spots = []
+        for _ in range(count):
+            start_idx_list = numpy.where(self._priority_unique_values == self._last_priority)[0]
+            start_idx = start_idx_list[0] if len(start_idx_list) else 0
+            candidates = fits & (priority_index >= start_idx) & ((priority_index - start_idx) % step == 0)
+            if not numpy.any(candidates):
+                Logger.log("d", "Could not find spot!")
+                self._last_priority = self._priority_unique_values[start_idx::step][-1]
+                break
+            masked_priority = self._priority.astype(numpy.int64)
+            masked_priority[~candidates] = numpy.iinfo(numpy.int64).max
+            y, x = numpy.unravel_index(numpy.argmin(masked_priority), masked_priority.shape)
+            self._last_priority = self._priority[y][x]
+            projected_x = x - self._offset_x
+            projected_y = y - self._offset_y
+            spots.append((projected_x, projected_y))
+            self.place(projected_x, projected_y, hull_shape_arr)
+
+            # Only the cells where the shape overlaps the placed hull do not fit anymore.
+            hull_y0 = int(self._scale * projected_y) + self._offset_y + hull_shape_arr.offset_y
+            hull_x0 = int(self._scale * projected_x) + self._offset_x + hull_shape_arr.offset_x
+            hull_y1 = hull_y0 + hull_shape_arr.arr.shape[0]
+            hull_x1 = hull_x0 + hull_shape_arr.arr.shape[1]
+            placed = numpy.zeros((hull_shape_arr.arr.shape[0] + 2 * (shape_mask.shape[0] - 1),
+                                  hull_shape_arr.arr.shape[1] + 2 * (shape_mask.shape[1] - 1)), dtype = numpy.float64)
+            placed[shape_mask.shape[0] - 1:shape_mask.shape[0] - 1 + hull_shape_arr.arr.shape[0],
+                   shape_mask.shape[1] - 1:shape_mask.shape[1] - 1 + hull_shape_arr.arr.shape[1]] = hull_shape_arr.arr == 1
+            overlap = self._correlate(placed, shape_mask) > 0.5  # per upper left corner of the shape
+            rows = numpy.nonzero((corner_y > hull_y0 - shape_mask.shape[0]) & (corner_y < hull_y1))[0]
+            columns = numpy.nonzero((corner_x > hull_x0 - shape_mask.shape[1]) & (corner_x < hull_x1))[0]
+            if len(rows) and len(columns):
+                local_overlap = overlap[corner_y[rows] - hull_y0 + shape_mask.shape[0] - 1][:, corner_x[columns] - hull_x0 + shape_mask.shape[1] - 1]
+                fits[numpy.ix_(rows, columns)] &= ~local_overlap
+
+            # place() changed the priority of the cells below the hull
+            y0, y1 = max(hull_y0, 0), min(hull_y1, grid_y)
+            x0, x1 = max(hull_x0, 0), min(hull_x1, grid_x)
+            priority_index[y0:y1, x0:x1] = self._priorityIndices(self._priority[y0:y1, x0:x1])
+
+        if spots:
+            result = numpy.array(spots, dtype = numpy.int64)
+        return result
+
+    ##  Return the index of every priority in the sorted unique priority values, -1 if it is not one of them
+    def _priorityIndices(self, priority):
+        unique_values = numpy.asarray(self._priority_unique_values)
+        if len(unique_values) == 0:
+            return numpy.full(priority.shape, -1, dtype = numpy.int64)
+        indices = numpy.searchsorted(unique_values, priority)
+        clipped = numpy.minimum(indices, len(unique_values) - 1)
+        return numpy.where(unique_values[clipped] == priority, clipped, -1)
+
     ##  Fill priority, center is best. Lower value is better
     #   This is a strategy for the arranger.
     def centerFirst(self):
@@ -135,6 +299,8 @@ class Arrange:
 
     ##  Return the amount of "penalty points" for polygon, which is the sum of priority
     #   None if occupied
+    #   The packed rows under the bounding box of the shape are checked first, only when they
+    #   contain occupied cells the cells of the shape itself are unpacked and checked.
     #   \param x x-coordinate to check shape
     #   \param y y-coordinate
     #   \param shape_arr the ShapeArray object to place
@@ -143,18 +309,58 @@ class Arrange:
         y = int(self._scale * y)
         offset_x = x + self._offset_x + shape_arr.offset_x
         offset_y = y + self._offset_y + shape_arr.offset_y
-        occupied_slice = self._occupied[
-            offset_y:offset_y + shape_arr.arr.shape[0],
-            offset_x:offset_x + shape_arr.arr.shape[1]]
-        try:
-            if numpy.any(occupied_slice[numpy.where(shape_arr.arr == 1)]):
-                return None
-        except IndexError:  # out of bounds if you try to place an object outside
+        shape_mask = shape_arr.arr == 1
+        shape_cell_count = numpy.count_nonzero(shape_mask)
+        if shape_cell_count == 0:
+            return 0
+        if offset_x < 0 or offset_y < 0:  # out of bounds if you try to place an object outside
             return None
-        prio_slice = self._priority[
-            offset_y:offset_y + shape_arr.arr.shape[0],
-            offset_x:offset_x + shape_arr.arr.shape[1]]
-        return numpy.sum(prio_slice[numpy.where(shape_arr.arr == 1)])
+        max_y = min(offset_y + shape_mask.shape[0], self.shape[0])
+        max_x = min(offset_x + shape_mask.shape[1], self.shape[1])
+        if max_y <= offset_y or max_x <= offset_x:
+            return None
+        inside_mask = shape_mask[:max_y - offset_y, :max_x - offset_x]
+        if numpy.count_nonzero(inside_mask) != shape_cell_count:  # part of the shape is outside
+            return None
+
+        if self._mayBeOccupied(offset_y, max_y, offset_x, max_x):
+            if numpy.any(self._occupiedRegion(offset_y, max_y, offset_x, max_x)[inside_mask]):
+                return None
+        prio_slice = self._priority[offset_y:max_y, offset_x:max_x]
+        return numpy.sum(prio_slice[inside_mask])
+
+    ##  Compute for every cell of the grid whether the ShapeArray fits when it is placed on that cell
+    #   The collisions with occupied cells are calculated for all cells at once by correlating the
+    #   occupied map with the shape (using FFT), instead of calling checkShape per cell.
+    #   Cells where the shape would (partially) end up outside of the grid do not fit, just like
+    #   checkShape does not allow the upper left corner of the shape array to be outside of the grid.
+    #   \param shape_arr ShapeArray object
+    #   \return boolean numpy array with the shape of the grid, True where the shape fits
+    def fitMap(self, shape_arr):
+        shape_mask = shape_arr.arr == 1
+        if not numpy.any(shape_mask):
+            return numpy.ones(self.shape, dtype=bool)
+        shape_y, shape_x = shape_mask.shape
+        grid_y, grid_x = self.shape
+
+        # Everything outside the grid counts as occupied: pad with a border that is as large as the shape
+        blocked = numpy.ones((grid_y + 2 * shape_y, grid_x + 2 * shape_x), dtype=numpy.float64)
+        blocked[shape_y:shape_y + grid_y, shape_x:shape_x + grid_x] = self._occupied
+        collisions = self._correlate(blocked, shape_mask.astype(numpy.float64))
+        free = collisions < 0.5  # the FFT introduces tiny rounding errors, the real values are integers
+
+        # Map every grid cell to the upper left corner of the shape, the same way checkShape does
+        corner_y = self._cornerIndices(grid_y, self._offset_y, shape_arr.offset_y) + shape_y
+        corner_x = self._cornerIndices(grid_x, self._offset_x, shape_arr.offset_x) + shape_x
+        valid_y = (corner_y >= shape_y) & (corner_y < free.shape[0])
+        valid_x = (corner_x >= shape_x) & (corner_x < free.shape[1])
+        fits = free[numpy.clip(corner_y, 0, free.shape[0] - 1)][:, numpy.clip(corner_x, 0, free.shape[1] - 1)]
+        return fits & valid_y[:, numpy.newaxis] & valid_x[numpy.newaxis, :]
+
+    ##  Return the array coordinate of the upper left corner of a shape, for every cell along one axis
+    def _cornerIndices(self, size, offset, shape_offset):
+        projected = numpy.arange(size) - offset
+        return (self._scale * projected).astype(numpy.int64) + offset + shape_offset
 
     ##  Find "best" spot for ShapeArray
     #   Return namedtuple with properties x, y, penalty_points, priority
@@ -162,24 +368,78 @@ class Arrange:
     #   \param start_prio Start with this priority value (and skip the ones before)
     #   \param step Slicing value, higher = more skips = faster but less accurate
     def bestSpot(self, shape_arr, start_prio = 0, step = 1):
+        priorities = self._triedPriorities(start_prio, step)
+
+        # Only try out the cells with one of the priorities above and where the shape fits.
+        # Of those, the lowest priority wins. argmin returns the first one in case of a tie,
+        # which is the same cell that trying out the cells one by one would find.
+        candidates = numpy.isin(self._priority, priorities) & self.fitMap(shape_arr)
+        if numpy.any(candidates):
+            masked_priority = self._priority.astype(numpy.int64)
+            masked_priority[~candidates] = numpy.iinfo(numpy.int64).max
+            y, x = numpy.unravel_index(numpy.argmin(masked_priority), masked_priority.shape)
+            projected_x = x - self._offset_x
+            projected_y = y - self._offset_y
+
+            # array to "world" coordinates
+            penalty_points = self.checkShape(projected_x, projected_y, shape_arr)
+            return LocationSuggestion(x = projected_x, y = projected_y, penalty_points = penalty_points, priority = self._priority[y][x])
+        return LocationSuggestion(x = None, y = None, penalty_points = None, priority = priorities[-1])  # No suitable location found :-(
+
+    ##  Find the best spot for an object that may be rotated
+    #   Every rotation is scored with bestSpot, the rotation with the lowest penalty points wins.
+    #   bestSpot only reads the grid, so the rotations can be scored at the same time.
+    #   \param rotated_shapes list of (angle, offset_shape_arr, hull_shape_arr), one per rotation
+    #   \param start_prio Start with this priority value (and skip the ones before)
+    #   \param step Slicing value, higher = more skips = faster but less accurate
+    #   \param executor concurrent.futures.Executor to score the rotations with, None to score them one by one
+    #   \return (angle, LocationSuggestion, hull_shape_arr) of the best rotation, or of the first
+    #   rotation if the object does not fit in any rotation
+    def bestRotatedSpot(self, rotated_shapes, start_prio = 0, step = 1, executor = None):
+        def score(rotated_shape):
+            return self.bestSpot(rotated_shape[1], start_prio = start_prio, step = step)
+
+        if executor is not None:
+            spots = list(executor.map(score, rotated_shapes))
+        else:
+            spots = [score(rotated_shape) for rotated_shape in rotated_shapes]
+
+        best = None
+        for (angle, offset_shape_arr, hull_shape_arr), spot in zip(rotated_shapes, spots):
+            if spot.x is None:
+                continue
+            if best is None or spot.penalty_points < best[1].penalty_points:
+                best = (angle, spot, hull_shape_arr)
+        if best is None:
+            angle, offset_shape_arr, hull_shape_arr = rotated_shapes[0]
+            best = (angle, spots[0], hull_shape_arr)
+        return best
+
+    ##  Return the priority values that bestSpot tries out, in order
+    #   \param start_prio Start with this priority value (and skip the ones before)
+    #   \param step Slicing value, higher = more skips
+    def _triedPriorities(self, start_prio, step):
         start_idx_list = numpy.where(self._priority_unique_values == start_prio)
         if start_idx_list:
             start_idx = start_idx_list[0][0]
         else:
             start_idx = 0
-        for priority in self._priority_unique_values[start_idx::step]:
-            tryout_idx = numpy.where(self._priority == priority)
-            for idx in range(len(tryout_idx[0])):
-                y = tryout_idx[0][idx]
-                x = tryout_idx[1][idx]
-                projected_x = x - self._offset_x
-                projected_y = y - self._offset_y
-
-                # array to "world" coordinates
-                penalty_points = self.checkShape(projected_x, projected_y, shape_arr)
-                if penalty_points is not None:
-                    return LocationSuggestion(x = projected_x, y = projected_y, penalty_points = penalty_points, priority = priority)
-        return LocationSuggestion(x = None, y = None, penalty_points = None, priority = priority)  # No suitable location found :-(
+        return self._priority_unique_values[start_idx::step]
+
+    ##  Correlate grid with kernel, only where the kernel fits completely inside the grid
+    #   ("valid" mode), using FFT.
+    #   result[i][j] = sum(grid[i:i + kernel_y, j:j + kernel_x] * kernel)
+    #   \param grid 2D numpy array
+    #   \param kernel 2D numpy array, not larger than grid
+    @staticmethod
+    def _correlate(grid, kernel):
+        kernel_y, kernel_x = kernel.shape
+        # A circular convolution with the size of the grid is enough: the wrapped around
+        # values all end up outside the valid part of the result.
+        fft_shape = grid.shape
+        result = numpy.fft.irfft2(
+            numpy.fft.rfft2(grid, fft_shape) * numpy.fft.rfft2(kernel[::-1, ::-1], fft_shape), fft_shape)
+        return result[kernel_y - 1:, kernel_x - 1:]
 
     ##  Place the object.
     #   Marks the locations in self._occupied and self._priority
@@ -187,22 +447,35 @@ class Arrange:
     #   \param y y-coordinate
     #   \param shape_arr ShapeArray object
     def place(self, x, y, shape_arr):
+        min_y, max_y, min_x, max_x, shape_slice = self.placedArea(x, y, shape_arr)
+        if shape_slice.size == 0:
+            return
+
+        # we use a slice of shape because it can be out of bounds
+        occupied_rows = numpy.unpackbits(self._occupied_bits[min_y:max_y], axis=1, count=self.shape[1])
+        occupied_rows[:, min_x:max_x][shape_slice] = 1
+        self._occupied_bits[min_y:max_y] = numpy.packbits(occupied_rows, axis=1)
+
+        # Set priority to low (= high number), so it won't get picked at trying out.
+        prio_slice = self._priority[min_y:max_y, min_x:max_x]
+        prio_slice[shape_slice] = 999
+
+    ##  Return the cells that place() marks for the object
+    #   \param x x-coordinate
+    #   \param y y-coordinate
+    #   \param shape_arr ShapeArray object
+    #   \return (min_y, max_y, min_x, max_x, mask) where mask is True for the cells of the object in
+    #   grid[min_y:max_y, min_x:max_x]
+    def placedArea(self, x, y, shape_arr):
         x = int(self._scale * x)
         y = int(self._scale * y)
         offset_x = x + self._offset_x + shape_arr.offset_x
         offset_y = y + self._offset_y + shape_arr.offset_y
-        shape_y, shape_x = self._occupied.shape
+        shape_y, shape_x = self.shape
 
         min_x = min(max(offset_x, 0), shape_x - 1)
         min_y = min(max(offset_y, 0), shape_y - 1)
         max_x = min(max(offset_x + shape_arr.arr.shape[1], 0), shape_x - 1)
         max_y = min(max(offset_y + shape_arr.arr.shape[0], 0), shape_y - 1)
-        occupied_slice = self._occupied[min_y:max_y, min_x:max_x]
-        # we use a slice of shape because it can be out of bounds
-        occupied_slice[numpy.where(shape_arr.arr[
-            min_y - offset_y:max_y - offset_y, min_x - offset_x:max_x - offset_x] == 1)] = 1
-
-        # Set priority to low (= high number), so it won't get picked at trying out.
-        prio_slice = self._priority[min_y:max_y, min_x:max_x]
-        prio_slice[numpy.where(shape_arr.arr[
-            min_y - offset_y:max_y - offset_y, min_x - offset_x:max_x - offset_x] == 1)] = 999
+        shape_slice = shape_arr.arr[min_y - offset_y:max_y - offset_y, min_x - offset_x:max_x - offset_x] == 1
+        return min_y, max_y, min_x, max_x, shape_slice
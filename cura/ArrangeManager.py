@@ -0,0 +1,151 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from UM.Application import Application
+from UM.Preferences import Preferences
+from UM.Scene.Iterator.DepthFirstIterator import DepthFirstIterator
+
+from cura.Arrange import Arrange
+from cura.ConvexHullNode import ConvexHullNode
+from cura.DuplicatedNode import DuplicatedNode
+from cura.ShapeArray import ShapeArray
+
+import numpy
+import threading
+
+
+##  Keeps an arranger with all objects on the build plate up to date between arrange calls.
+#
+#   Arrange.create(scene_root = ...) computes the priorities, adds the disallowed areas and
+#   rasterizes every object in the scene each time it is called. This manager keeps that state
+#   instead: changes in the scene only mark the nodes they came from, and when an arranger is
+#   requested only the objects that were added, removed or marked are rasterized again, and only
+#   the cells under them are updated. The whole grid is only built again when the machine, the
+#   print mode or the disallowed areas change.
+class ArrangeManager:
+    ##  Settings of the global stack that change the grid of the arranger
+    _rebuild_settings = {"machine_width", "machine_depth", "print_mode", "machine_head_with_fans_polygon"}
+
+    def __init__(self, scene, build_volume):
+        self._scene = scene
+        self._build_volume = build_volume
+
+        # Scene changes arrive on the main thread, arranger requests also come from jobs.
+        self._lock = threading.Lock()
+        self._rebuild_needed = True
+        self._dirty_nodes = set()  # sources of scene changes since the last update
+
+        self._arranger = None  # Arrange with all objects on the build plate
+        self._base_occupied = None  # occupied cells without any objects, so only the disallowed areas
+        self._base_priority = None  # priorities without any objects
+        self._coverage = None  # number of objects on every cell
+        self._footprints = {}  # node -> (points, (min_y, max_y, min_x, max_x, mask)) as placed in the arranger
+
+        self._global_container_stack = None
+        Application.getInstance().globalContainerStackChanged.connect(self._onGlobalContainerStackChanged)
+        self._onGlobalContainerStackChanged()
+
+        self._scene.sceneChanged.connect(self._onSceneChanged)
+        self._build_volume.disallowedAreasChanged.connect(self._onRebuildNeeded)
+        Preferences.getInstance().preferenceChanged.connect(self._onPreferenceChanged)
+
+    ##  Return a new arranger with all objects on the build plate placed in it
+    #   The arranger can be used and changed freely, it is not shared with anything.
+    #   \param arranger_class Arrange or a subclass of it
+    def getArranger(self, arranger_class = Arrange):
+        with self._lock:
+            if self._rebuild_needed:
+                self._rebuild()
+            else:
+                self._update()
+            return self._arranger.copy(arranger_class)
+
+    ##  Build the grid from scratch: priorities, disallowed areas and all objects
+    def _rebuild(self):
+        self._rebuild_needed = False
+        self._arranger = Arrange.create(fixed_nodes = [])
+        self._base_occupied = self._arranger._occupied != 0
+        self._base_priority = self._arranger._priority.copy()
+        self._coverage = numpy.zeros(self._arranger.shape, dtype = numpy.int32)
+        self._footprints = {}
+        self._update()
+
+    ##  Bring the objects in the arranger up to date with the scene
+    #   Only the nodes that are new, gone or that changed since the last update are rasterized again.
+    def _update(self):
+        dirty_nodes = self._dirty_nodes
+        self._dirty_nodes = set()
+
+        nodes = set()
+        for node in DepthFirstIterator(self._scene.getRoot()):
+            # Only count sliceable objects, like Arrange.create does
+            if node.callDecoration("isSliceable") and not isinstance(node, DuplicatedNode) and node.callDecoration("getConvexHull"):
+                nodes.add(node)
+
+        # A change of a group moves all nodes in it.
+        for node in list(dirty_nodes):
+            dirty_nodes.update(node.getAllChildren())
+
+        changed_areas = []
+        for node in list(self._footprints.keys()):
+            if node not in nodes:
+                changed_areas.append(self._removeFootprint(node))
+        for node in nodes:
+            footprint = self._footprints.get(node)
+            if footprint is not None and node not in dirty_nodes:
+                continue
+            points = Arrange.fixedNodePoints(node)
+            if footprint is not None:
+                if numpy.array_equal(footprint[0], points):
+                    continue
+                changed_areas.append(self._removeFootprint(node))
+            changed_areas.append(self._addFootprint(node, points))
+
+        for min_y, max_y, min_x, max_x, _ in changed_areas:
+            covered = self._coverage[min_y:max_y, min_x:max_x] > 0
+            occupied = self._base_occupied[min_y:max_y, min_x:max_x] | covered
+            priority = numpy.where(covered, 999, self._base_priority[min_y:max_y, min_x:max_x])
+            self._arranger.setGridRegion(min_y, min_x, occupied, priority)
+
+    def _addFootprint(self, node, points):
+        min_y, max_y, min_x, max_x, mask = self._arranger.placedArea(0, 0, ShapeArray.fromPolygon(points))
+        self._coverage[min_y:max_y, min_x:max_x] += mask
+        self._footprints[node] = (points, (min_y, max_y, min_x, max_x, mask))
+        return min_y, max_y, min_x, max_x, mask
+
+    def _removeFootprint(self, node):
+        points, area = self._footprints.pop(node)
+        min_y, max_y, min_x, max_x, mask = area
+        self._coverage[min_y:max_y, min_x:max_x] -= mask
+        return area
+
+    def _onSceneChanged(self, source):
+        # A new convex hull of a node changes its footprint.
+        if isinstance(source, ConvexHullNode):
+            source = source.getWatchedNode()
+        # Nodes that are added or removed are found by comparing with the footprints.
+        if source is None or source is self._scene.getRoot():
+            return
+        with self._lock:
+            self._dirty_nodes.add(source)
+
+    def _onRebuildNeeded(self, *args):
+        self._rebuild_needed = True
+
+    def _onPreferenceChanged(self, preference):
+        if preference == "mesh/arrange_align":
+            self._rebuild_needed = True
+
+    def _onGlobalContainerStackChanged(self):
+        if self._global_container_stack:
+            self._global_container_stack.propertyChanged.disconnect(self._onSettingPropertyChanged)
+
+        self._global_container_stack = Application.getInstance().getGlobalContainerStack()
+
+        if self._global_container_stack:
+            self._global_container_stack.propertyChanged.connect(self._onSettingPropertyChanged)
+        self._rebuild_needed = True
+
+    def _onSettingPropertyChanged(self, setting_key, property_name):
+        if property_name == "value" and setting_key in self._rebuild_settings:
+            self._rebuild_needed = True
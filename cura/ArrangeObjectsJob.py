@@ -4,22 +4,33 @@
 from UM.Job import Job
 from UM.Scene.SceneNode import SceneNode
 from UM.Math.Vector import Vector
+from UM.Math.Quaternion import Quaternion
 from UM.Operations.SetTransformOperation import SetTransformOperation
 from UM.Operations.TranslateOperation import TranslateOperation
 from UM.Operations.GroupedOperation import GroupedOperation
 from UM.Logger import Logger
 from UM.Message import Message
+from UM.Preferences import Preferences
 from UM.i18n import i18nCatalog
 i18n_catalog = i18nCatalog("cura")
 
 from cura.ZOffsetDecorator import ZOffsetDecorator
 from cura.Arrange import Arrange
+from cura.HierarchicalArrange import HierarchicalArrange
 from cura.ShapeArray import ShapeArray
 
 from typing import List
 
+from concurrent.futures import ThreadPoolExecutor
+import math
+import os
+
 
 class ArrangeObjectsJob(Job):
+    ##  Number of rotations (evenly spread over a full turn) that are tried per object
+    #   when the mesh/arrange_rotate preference is set.
+    rotation_count = 8
+
     def __init__(self, nodes: List[SceneNode], fixed_nodes: List[SceneNode], min_offset = 4):
         super().__init__()
         self._nodes = nodes
@@ -29,13 +40,26 @@ class ArrangeObjectsJob(Job):
     def run(self):
         status_message = Message(i18n_catalog.i18nc("@info:status", "Finding new location for objects"), lifetime = 0, dismissable=False, progress = 0)
         status_message.show()
-        arranger = Arrange.create(fixed_nodes = self._fixed_nodes)
+        # Searching coarse to fine pays off when there are many objects to place
+        if len(self._nodes) > int(Preferences.getInstance().getValue("mesh/arrange_hierarchical_threshold")):
+            arranger = HierarchicalArrange.create(fixed_nodes = self._fixed_nodes)
+        else:
+            arranger = Arrange.create(fixed_nodes = self._fixed_nodes)
+
+        if Preferences.getInstance().getValue("mesh/arrange_rotate"):
+            angles = [2 * math.pi * i / self.rotation_count for i in range(self.rotation_count)]
+        else:
+            angles = [0]
 
         # Collect nodes to be placed
-        nodes_arr = []  # fill with (size, node, offset_shape_arr, hull_shape_arr)
+        nodes_arr = []  # fill with (size, node, rotated_shapes), rotated_shapes is a list of (angle, offset_shape_arr, hull_shape_arr)
         for node in self._nodes:
-            offset_shape_arr, hull_shape_arr = ShapeArray.fromNode(node, min_offset = self._min_offset)
-            nodes_arr.append((offset_shape_arr.arr.shape[0] * offset_shape_arr.arr.shape[1], node, offset_shape_arr, hull_shape_arr))
+            rotated_shapes = []
+            for angle in angles:
+                offset_shape_arr, hull_shape_arr = ShapeArray.fromNode(node, min_offset = self._min_offset, angle = angle)
+                rotated_shapes.append((angle, offset_shape_arr, hull_shape_arr))
+            offset_shape_arr = rotated_shapes[0][1]
+            nodes_arr.append((offset_shape_arr.arr.shape[0] * offset_shape_arr.arr.shape[1], node, rotated_shapes))
 
         # Sort the nodes with the biggest area first.
         nodes_arr.sort(key=lambda item: item[0])
@@ -47,36 +71,45 @@ class ArrangeObjectsJob(Job):
         last_size = None
         grouped_operation = GroupedOperation()
         found_solution_for_all = True
-        for idx, (size, node, offset_shape_arr, hull_shape_arr) in enumerate(nodes_arr):
-            # For performance reasons, we assume that when a location does not fit,
-            # it will also not fit for the next object (while what can be untrue).
-            # We also skip possibilities by slicing through the possibilities (step = 10)
-            if last_size == size:  # This optimization works if many of the objects have the same size
-                start_priority = last_priority
-            else:
-                start_priority = 0
-            best_spot = arranger.bestSpot(offset_shape_arr, start_prio=start_priority, step=1)
-            x, y = best_spot.x, best_spot.y
-            node.removeDecorator(ZOffsetDecorator)
-            if node.getBoundingBox():
-                center_y = node.getWorldPosition().y - node.getBoundingBox().bottom
-            else:
-                center_y = 0
-            if x is not None:  # We could find a place
-                last_size = size
-                last_priority = best_spot.priority
-
-                arranger.place(x, y, hull_shape_arr)  # take place before the next one
-
-                grouped_operation.addOperation(TranslateOperation(node, Vector(x, center_y, y), set_position = True))
-            else:
-                Logger.log("d", "Arrange all: could not find spot!")
-                found_solution_for_all = False
-                grouped_operation.addOperation(TranslateOperation(node, Vector(200, center_y, - idx * 20), set_position = True))
-
-            status_message.setProgress((idx + 1) / len(nodes_arr) * 100)
-            Job.yieldThread()
+        # The rotations of an object are scored in parallel; numpy releases the GIL for the heavy work.
+        executor = ThreadPoolExecutor(max_workers = min(len(angles), os.cpu_count() or 1)) if len(angles) > 1 else None
+        try:
+            for idx, (size, node, rotated_shapes) in enumerate(nodes_arr):
+                # For performance reasons, we assume that when a location does not fit,
+                # it will also not fit for the next object (while what can be untrue).
+                # We also skip possibilities by slicing through the possibilities (step = 10)
+                if last_size == size:  # This optimization works if many of the objects have the same size
+                    start_priority = last_priority
+                else:
+                    start_priority = 0
+                angle, best_spot, hull_shape_arr = arranger.bestRotatedSpot(rotated_shapes, start_prio = start_priority, step = 1, executor = executor)
+                x, y = best_spot.x, best_spot.y
+                node.removeDecorator(ZOffsetDecorator)
+                if node.getBoundingBox():
+                    center_y = node.getWorldPosition().y - node.getBoundingBox().bottom
+                else:
+                    center_y = 0
+                if x is not None:  # We could find a place
+                    last_size = size
+                    last_priority = best_spot.priority
+
+                    arranger.place(x, y, hull_shape_arr)  # take place before the next one
+
+                    if angle:
+                        orientation = Quaternion.fromAngleAxis(angle, Vector.Unit_Y) * node.getOrientation()
+                        grouped_operation.addOperation(SetTransformOperation(node, Vector(x, center_y, y), orientation))
+                    else:
+                        grouped_operation.addOperation(TranslateOperation(node, Vector(x, center_y, y), set_position = True))
+                else:
+                    Logger.log("d", "Arrange all: could not find spot!")
+                    found_solution_for_all = False
+                    grouped_operation.addOperation(TranslateOperation(node, Vector(200, center_y, - idx * 20), set_position = True))
 
+                status_message.setProgress((idx + 1) / len(nodes_arr) * 100)
+                Job.yieldThread()
+        finally:
+            if executor is not None:
+                executor.shutdown()
         grouped_operation.push()
 
         status_message.hide()
@@ -0,0 +1,84 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import math
+
+
+##  Uniform grid over axis aligned bounding boxes, to find the items that can overlap a box.
+#
+#   Every item is registered in all cells that its box touches. A query only looks at the cells of
+#   the query box and returns the items whose boxes overlap it, so exact (and expensive) overlap
+#   tests are only needed for those. Items can be moved or removed at any time.
+class BroadPhaseGrid:
+    ##  \param cell_size Size of the (square) cells, in the units of the boxes
+    def __init__(self, cell_size = 20.0):
+        self._cell_size = cell_size
+        self._cells = {}  # (column, row) -> set of items
+        self._boxes = {}  # item -> (min_x, min_y, max_x, max_y)
+
+    ##  Add an item, or move it if it is already in the grid
+    #   \param box (min_x, min_y, max_x, max_y)
+    def insert(self, item, box):
+        if item in self._boxes:
+            self.remove(item)
+        self._boxes[item] = box
+        for cell in self._cellsOf(box):
+            self._cells.setdefault(cell, set()).add(item)
+
+    def remove(self, item):
+        box = self._boxes.pop(item, None)
+        if box is None:
+            return
+        for cell in self._cellsOf(box):
+            items = self._cells[cell]
+            items.discard(item)
+            if not items:
+                del self._cells[cell]
+
+    def __contains__(self, item):
+        return item in self._boxes
+
+    def __len__(self):
+        return len(self._boxes)
+
+    def getBox(self, item):
+        return self._boxes.get(item)
+
+    ##  Return the set of items whose boxes overlap the box
+    #   \param box (min_x, min_y, max_x, max_y)
+    def query(self, box):
+        candidates = set()
+        for cell in self._cellsOf(box):
+            candidates.update(self._cells.get(cell, ()))
+        return {item for item in candidates if self._overlaps(self._boxes[item], box)}
+
+    def _cellsOf(self, box):
+        min_column = math.floor(box[0] / self._cell_size)
+        min_row = math.floor(box[1] / self._cell_size)
+        max_column = math.floor(box[2] / self._cell_size)
+        max_row = math.floor(box[3] / self._cell_size)
+        for column in range(min_column, max_column + 1):
+            for row in range(min_row, max_row + 1):
+                yield (column, row)
+
+    @staticmethod
+    def _overlaps(a, b):
+        return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+    ##  Return the bounding box of a number of polygons, or None if there are none
+    #   \param polygons Polygon or None values, the None values are ignored
+    @staticmethod
+    def boxOfPolygons(*polygons):
+        box = None
+        for polygon in polygons:
+            if polygon is None:
+                continue
+            points = polygon.getPoints()
+            if len(points) == 0:
+                continue
+            polygon_box = (float(points[:, 0].min()), float(points[:, 1].min()), float(points[:, 0].max()), float(points[:, 1].max()))
+            if box is None:
+                box = polygon_box
+            else:
+                box = (min(box[0], polygon_box[0]), min(box[1], polygon_box[1]), max(box[2], polygon_box[2]), max(box[3], polygon_box[3]))
+        return box
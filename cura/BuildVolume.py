@@ -1,8 +1,11 @@
 # Copyright (c) 2016 Ultimaker B.V.
 # Cura is released under the terms of the AGPLv3 or higher.
 
+from cura.BroadPhaseGrid import BroadPhaseGrid
+from cura.DuplicatedNode import DuplicatedNode
 from cura.PrintModeManager import PrintModeManager
 from cura.Settings.ExtruderManager import ExtruderManager
+from cura.ShapeArray import ShapeArray
 
 from UM.Settings.ContainerRegistry import ContainerRegistry
 from UM.i18n import i18nCatalog
@@ -26,6 +29,8 @@ catalog = i18nCatalog("cura")
 
 import numpy
 import math
+import weakref
+from collections import OrderedDict
 
 from typing import List
 
@@ -36,6 +41,7 @@ PRIME_CLEARANCE = 6.5
 ##  Build volume is a special kind of node that is responsible for rendering the printable area & disallowed areas.
 class BuildVolume(SceneNode):
     raftThicknessChanged = Signal()
+    disallowedAreasChanged = Signal()
 
     def __init__(self, parent = None):
         super().__init__(parent)
@@ -65,6 +71,14 @@ class BuildVolume(SceneNode):
 
         self._disallowed_areas = []
         self._disallowed_area_mesh = None
+        self._disallowed_areas_version = 0  # increases every time the disallowed areas change
+        self._disallowed_areas_fingerprint = None  # fingerprint of the settings of the current disallowed areas
+        self._disallowed_areas_cache = OrderedDict()  # fingerprint -> (disallowed areas, error areas, margin)
+        self._disallowed_area_grid = None  # BroadPhaseGrid with the indices of the disallowed areas
+        self._boundary_check_cache = weakref.WeakKeyDictionary()  # node -> (key, outside build area), see _isOutsideBuildArea
+        self._disallowed_areas_masks = {}  # (machine width, machine depth) -> raster of the disallowed areas
+        self._disallowed_areas_precheck = None  # (offset_x, offset_y, summed-area table of the grown areas)
+        self.disallowedAreasChanged.connect(self._onDisallowedAreasChanged)
 
         self._error_areas = []
         self._error_mesh = None
@@ -164,6 +178,8 @@ class BuildVolume(SceneNode):
 
     def setDisallowedAreas(self, areas: List[Polygon]):
         self._disallowed_areas = areas
+        self._disallowed_areas_fingerprint = None  # These areas were not computed from the settings.
+        self.disallowedAreasChanged.emit()
 
     def render(self, renderer):
         if not self.getMeshData():
@@ -190,9 +206,14 @@ class BuildVolume(SceneNode):
 
     ##  For every sliceable node, update node._outside_buildarea
     #
-    def updateNodeBoundaryCheck(self):
-        root = Application.getInstance().getController().getScene().getRoot()
-        nodes = list(BreadthFirstIterator(root))
+    #   \param nodes Only update these nodes and the groups they are in. All nodes in the scene are
+    #   updated if this is None.
+    def updateNodeBoundaryCheck(self, nodes = None):
+        if nodes is None:
+            root = Application.getInstance().getController().getScene().getRoot()
+            nodes = list(BreadthFirstIterator(root))
+        else:
+            nodes = self._getNodesToCheck(nodes)
         group_nodes = []
 
         build_volume_bounding_box = self.getBoundingBox()
@@ -204,43 +225,154 @@ class BuildVolume(SceneNode):
             # In that situation there is a model, but no machine (and therefore no build volume.
             return
 
+        print_mode = self._global_container_stack.getProperty("print_mode", "value")
+
         for node in nodes:
             # Need to check group nodes later
             if node.callDecoration("isGroup"):
                 group_nodes.append(node)  # Keep list of affected group_nodes
 
-            if node.callDecoration("isSliceable") or node.callDecoration("isGroup"):
-                node._outside_buildarea = False
-                bbox = node.getBoundingBox()
-
-                # Mark the node as outside the build volume if the bounding box test fails.
-                if build_volume_bounding_box.intersectsBox(bbox) != AxisAlignedBox.IntersectionResult.FullIntersection:
-                    node._outside_buildarea = True
-                    continue
+            # The twins take over the result of their source node below
+            if print_mode != "regular" and isinstance(node, DuplicatedNode):
+                continue
 
-                convex_hull = node.callDecoration("getConvexHull")
-                if convex_hull:
-                    if not convex_hull.isValid():
-                        return
-                    # Check for collisions between disallowed areas and the object
-                    for area in self.getDisallowedAreas():
-                        overlap = convex_hull.intersectsPolygon(area)
-                        if overlap is None:
-                            continue
-                        node._outside_buildarea = True
-                        continue
+            if node.callDecoration("isSliceable") or node.callDecoration("isGroup"):
+                outside_buildarea = self._isOutsideBuildArea(node, build_volume_bounding_box)
+                if outside_buildarea is None:
+                    return
+                node._outside_buildarea = outside_buildarea
 
-        print_mode = self._global_container_stack.getProperty("print_mode", "value")
         if print_mode != "regular":
+            checked_nodes = set(nodes)
             duplicated_nodes = PrintModeManager.getInstance().getDuplicatedNodes()
             for node_dup in duplicated_nodes:
-                node_dup._outside_buildarea = node_dup.node._outside_buildarea
+                if node_dup.node in checked_nodes:
+                    node_dup._outside_buildarea = node_dup.node._outside_buildarea
 
         # Group nodes should override the _outside_buildarea property of their children.
         for group_node in group_nodes:
             for child_node in group_node.getAllChildren():
                 child_node._outside_buildarea = group_node._outside_buildarea
 
+    ##  Return whether the node is outside the build volume or overlaps a disallowed area
+    #   The result is kept per node until its hull or bounding box, the build volume or the
+    #   disallowed areas change.
+    #   \return True if the node is outside, None if its convex hull is not valid
+    def _isOutsideBuildArea(self, node, build_volume_bounding_box):
+        bbox = node.getBoundingBox()
+        convex_hull = node.callDecoration("getConvexHull")
+        key = (self._getHullKey(convex_hull), self._getBoxKey(bbox), self._getBoxKey(build_volume_bounding_box), self._disallowed_areas_version)
+        cached = self._boundary_check_cache.get(node)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        outside_buildarea = False
+        # Mark the node as outside the build volume if the bounding box test fails.
+        if build_volume_bounding_box.intersectsBox(bbox) != AxisAlignedBox.IntersectionResult.FullIntersection:
+            outside_buildarea = True
+        elif convex_hull:
+            if not convex_hull.isValid():
+                return None
+            # Check for collisions between disallowed areas and the object. The raster of the areas
+            # rules out most objects without testing any polygons.
+            if self._mayOverlapDisallowedAreas(convex_hull):
+                for area in self._getDisallowedAreasNear(convex_hull):
+                    if convex_hull.intersectsPolygon(area) is not None:
+                        outside_buildarea = True
+                        break
+
+        self._boundary_check_cache[node] = (key, outside_buildarea)
+        return outside_buildarea
+
+    ##  Return the disallowed areas whose bounding boxes overlap the bounding box of the polygon
+    def _getDisallowedAreasNear(self, polygon):
+        if self._disallowed_area_grid is None:
+            self._disallowed_area_grid = BroadPhaseGrid()
+            for index, area in enumerate(self._disallowed_areas):
+                box = BroadPhaseGrid.boxOfPolygons(area)
+                if box is not None:
+                    self._disallowed_area_grid.insert(index, box)
+
+        box = BroadPhaseGrid.boxOfPolygons(polygon)
+        if box is None:
+            return []
+        return [self._disallowed_areas[index] for index in sorted(self._disallowed_area_grid.query(box))]
+
+    ##  Return the points of a hull as a hashable value
+    #   The hull is compared by its points and not by identity: when printing one at a time,
+    #   getConvexHull returns a new polygon every time, with the same points if the node did not change.
+    @staticmethod
+    def _getHullKey(convex_hull):
+        if convex_hull is None:
+            return None
+        points = numpy.asarray(convex_hull.getPoints())
+        return (points.dtype.str, points.shape, points.tobytes())
+
+    @staticmethod
+    def _getBoxKey(bbox):
+        if bbox is None:
+            return None
+        return (bbox.left, bbox.right, bbox.bottom, bbox.top, bbox.back, bbox.front)
+
+    def _onDisallowedAreasChanged(self):
+        self._disallowed_areas_version += 1
+        self._disallowed_area_grid = None
+        self._disallowed_areas_masks = {}
+        self._disallowed_areas_precheck = None
+
+    ##  Return a raster of the disallowed areas at the resolution of the arranger (1 cell per mm)
+    #   The raster uses the grid of Arrange.create: cell (row, column) is at x = column - int(width / 2)
+    #   and y = row - int(depth / 2). It is only computed again when the disallowed areas change.
+    #   \param machine_width, machine_depth size of the build plate in mm, as integers
+    #   \return boolean numpy array (machine_depth, machine_width), True where the plate is not printable
+    def getDisallowedAreasMask(self, machine_width, machine_depth):
+        key = (machine_width, machine_depth)
+        if key not in self._disallowed_areas_masks:
+            self._disallowed_areas_masks[key] = ShapeArray.rasterize(
+                [area.getPoints() for area in self._disallowed_areas], (machine_depth, machine_width), int(machine_width / 2), int(machine_depth / 2))
+        return self._disallowed_areas_masks[key]
+
+    ##  Return whether the polygon can overlap a disallowed area, according to a raster of the areas
+    #   The raster only marks cells whose corner is inside an area, so it is made from the areas grown
+    #   by one cell. If none of its cells is within the bounding box of the polygon, the polygon can not
+    #   overlap an area. Otherwise it may, and the exact test decides.
+    def _mayOverlapDisallowedAreas(self, polygon):
+        if self._disallowed_areas_precheck is None:
+            width = int(self._width)
+            depth = int(self._depth)
+            offset_x, offset_y = int(width / 2), int(depth / 2)
+            grow = Polygon(numpy.array([[-1, -1], [-1, 1], [1, 1], [1, -1]], numpy.float32))
+            grown_areas = [area.getMinkowskiHull(grow).getPoints() for area in self._disallowed_areas]
+            grid = ShapeArray.rasterize(grown_areas, (depth, width), offset_x, offset_y)
+            table = numpy.zeros((depth + 1, width + 1), dtype = numpy.int32)
+            numpy.cumsum(numpy.cumsum(grid, axis = 0, dtype = numpy.int32), axis = 1, out = table[1:, 1:])
+            self._disallowed_areas_precheck = (offset_x, offset_y, table)
+
+        offset_x, offset_y, table = self._disallowed_areas_precheck
+        box = BroadPhaseGrid.boxOfPolygons(polygon)
+        if box is None:
+            return True
+        x0, y0 = int(math.floor(box[0])) + offset_x - 1, int(math.floor(box[1])) + offset_y - 1
+        x1, y1 = int(math.floor(box[2])) + offset_x + 2, int(math.floor(box[3])) + offset_y + 2
+        if x0 < 0 or y0 < 0 or x1 >= table.shape[1] or y1 >= table.shape[0]:
+            return True  # Partly outside the raster, it can not tell.
+        return table[y1, x1] - table[y0, x1] - table[y1, x0] + table[y0, x0] > 0
+
+    ##  Return the nodes to check again when the given nodes changed
+    #   A group decides for all of its children, so the outermost group of a node is checked with
+    #   all of its children. Parents come before their children.
+    def _getNodesToCheck(self, nodes):
+        result = []
+        seen = set()
+        for node in nodes:
+            while node.getParent() is not None and node.getParent().callDecoration("isGroup"):
+                node = node.getParent()
+            for checked_node in [node] + node.getAllChildren():
+                if checked_node not in seen:
+                    seen.add(checked_node)
+                    result.append(checked_node)
+        return result
+
     ##  Recalculates the build volume & disallowed areas.
     def rebuild(self):
         if not self._width or not self._height or not self._depth:
@@ -569,11 +701,8 @@ class BuildVolume(SceneNode):
         if not self._global_container_stack:
             return
 
-        self._error_areas = []
-
         extruder_manager = ExtruderManager.getInstance()
         used_extruders = extruder_manager.getUsedExtruderStacks()
-        disallowed_border_size = self._getEdgeDisallowedSize()
 
         if not used_extruders:
             # If no extruder is used, assume that the active extruder is used (else nothing is drawn)
@@ -582,6 +711,47 @@ class BuildVolume(SceneNode):
             else:
                 used_extruders = [self._global_container_stack]
 
+        # The areas only depend on the settings in the fingerprint, so if those did not change there
+        # is nothing to do, and if they were seen recently the areas of that time can be used again.
+        fingerprint = self._getDisallowedAreasFingerprint(used_extruders)
+        if fingerprint == self._disallowed_areas_fingerprint:
+            return
+
+        cached = self._disallowed_areas_cache.get(fingerprint)
+        if cached is not None:
+            self._disallowed_areas_cache.move_to_end(fingerprint)
+            disallowed_areas, error_areas, self.margin = cached
+            self._disallowed_areas = list(disallowed_areas)
+            self._error_areas = list(error_areas)
+            self._has_errors = len(self._error_areas) > 0
+        else:
+            self._computeDisallowedAreas(used_extruders)
+            self._disallowed_areas_cache[fingerprint] = (list(self._disallowed_areas), list(self._error_areas), self.margin)
+            if len(self._disallowed_areas_cache) > self._disallowed_areas_cache_size:
+                self._disallowed_areas_cache.popitem(last = False)
+        self._disallowed_areas_fingerprint = fingerprint
+
+        self.disallowedAreasChanged.emit()
+
+    ##  Return everything that the disallowed areas are computed from, as a hashable value
+    #   This includes the settings of all extruders of the machine, since the adhesion and support
+    #   settings can be taken from extruders that are not used by any object.
+    def _getDisallowedAreasFingerprint(self, used_extruders):
+        stacks = [self._global_container_stack] + list(ExtruderManager.getInstance().getMachineExtruders(self._global_container_stack.getId()))
+        return (
+            tuple(stack.getId() for stack in stacks),
+            tuple(extruder.getId() for extruder in used_extruders),
+            tuple(tuple(repr(stack.getProperty(setting_key, "value")) for setting_key in self._disallowed_areas_settings) for stack in stacks),
+            repr(self._global_container_stack.getMetaDataEntry("nozzle_offsetting_for_disallowed_areas", True)),
+            self._width, self._depth, self._shape
+        )
+
+    ##  Compute the disallowed areas and the error areas for the used extruders
+    def _computeDisallowedAreas(self, used_extruders):
+        self._error_areas = []
+
+        disallowed_border_size = self._getEdgeDisallowedSize()
+
         result_areas = self._computeDisallowedAreasStatic(disallowed_border_size, used_extruders) #Normal machine disallowed areas can always be added.
         prime_areas = self._computeDisallowedAreasPrimeBlob(disallowed_border_size, used_extruders)
         prime_disallowed_areas = self._computeDisallowedAreasStatic(0, used_extruders) #Where the priming is not allowed to happen. This is not added to the result, just for collision checking.
@@ -1025,3 +1195,9 @@ class BuildVolume(SceneNode):
     _distance_settings = ["infill_wipe_dist", "travel_avoid_distance", "support_offset", "support_enable", "travel_avoid_other_parts"]
     _extruder_settings = ["support_enable", "support_bottom_enable", "support_roof_enable", "support_infill_extruder_nr", "support_extruder_nr_layer_0", "support_bottom_extruder_nr", "support_roof_extruder_nr", "brim_line_count", "adhesion_extruder_nr", "adhesion_type"] #Settings that can affect which extruders are used.
     _limit_to_extruder_settings = ["wall_extruder_nr", "wall_0_extruder_nr", "wall_x_extruder_nr", "top_bottom_extruder_nr", "infill_extruder_nr", "support_infill_extruder_nr", "support_extruder_nr_layer_0", "support_bottom_extruder_nr", "support_roof_extruder_nr", "adhesion_extruder_nr"]
+
+    ##  Settings that the disallowed areas are computed from, see _getDisallowedAreasFingerprint
+    _disallowed_areas_settings = sorted(set(_skirt_settings + _prime_settings + _tower_settings + _ooze_shield_settings + _distance_settings + _extruder_settings + _limit_to_extruder_settings + [
+        "print_mode", "print_sequence", "machine_width", "machine_depth", "machine_center_is_zero", "machine_disallowed_areas", "nozzle_disallowed_areas",
+        "machine_nozzle_offset_x", "machine_nozzle_offset_y", "machine_head_with_fans_polygon", "machine_extruder_count"]))
+    _disallowed_areas_cache_size = 8
@@ -6,11 +6,32 @@ from UM.Math.Polygon import Polygon
 from UM.Scene.SceneNodeDecorator import SceneNodeDecorator
 from UM.Settings.ContainerRegistry import ContainerRegistry
 
+from cura.ConvexHullScheduler import ConvexHullScheduler
+from cura.DuplicatedNode import DuplicatedNode
 from cura.Settings.ExtruderManager import ExtruderManager
+from cura.ShapeArray import ShapeArray
 from . import ConvexHullNode
 
 import numpy
 
+
+##  What ConvexHullDecorator.computeConvexHull needs to compute the hull of a node.
+#   It is taken on the main thread, so that the hull can be computed on another thread without
+#   looking at the node or the settings.
+class ConvexHullSnapshot:
+    def __init__(self):
+        self.hull = None  # 2D hull of a node without mesh
+        self.mesh = None  # MeshData of a node of which the hull is computed from the mesh
+        self.world_transform = None  # Matrix of that node
+        self.mesh_cache = None  # see ConvexHullDecorator._cachedMeshHull
+        self.hull_offset = 0  # see ConvexHullDecorator._getHullOffset
+        self.children = None  # snapshots of the children of a group, of which the hull is put together
+        self.source = None  # snapshot of the source node of a twin, of which the hull is moved
+        self.print_mode = None  # print mode that moves the hull of the source node, see DuplicatedNode.transformHull
+        self.machine_width = 0
+        self.head = None  # Polygon of the head when printing one at a time
+        self.adhesion_margin = 0  # see ConvexHullDecorator._getAdhesionMargin
+
 ##  The convex hull decorator is a scene node decorator that adds the convex hull functionality to a scene node.
 #   If a scene node has a convex hull decorator, it will have a shadow in which other objects can not be printed.
 class ConvexHullDecorator(SceneNodeDecorator):
@@ -18,7 +39,12 @@ class ConvexHullDecorator(SceneNodeDecorator):
         super().__init__()
 
         self._convex_hull_node = None
+        self._convex_hull = None  # the hull that was published last, see setConvexHull
         self._init2DConvexHullCache()
+        self._2d_convex_hull_mesh_cache = None
+        # Set when a setting changed the hull: the mesh cache is kept for the hulls that are asked for
+        # until the new hull is published, but the job does not use it.
+        self._2d_convex_hull_mesh_cache_outdated = False
 
         self._global_stack = None
 
@@ -42,8 +68,9 @@ class ConvexHullDecorator(SceneNodeDecorator):
 
         super().setNode(node)
 
-        self._node.transformationChanged.connect(self._onChanged)
-        self._node.parentChanged.connect(self._onChanged)
+        if self._node is not None:
+            self._node.transformationChanged.connect(self._onChanged)
+            self._node.parentChanged.connect(self._onChanged)
 
         self._onChanged()
 
@@ -52,10 +79,18 @@ class ConvexHullDecorator(SceneNodeDecorator):
         return ConvexHullDecorator()
 
     ##  Get the unmodified 2D projected convex hull of the node
+    #   This is the hull that was published last with setConvexHull. When the node or the settings
+    #   change it stays the same until the ConvexHullScheduler publishes the new hull, so it is not
+    #   computed again on the main thread. Only a node that has no hull yet computes it right away.
     def getConvexHull(self):
         if self._node is None:
             return None
+        if self._convex_hull is not None:
+            return self._convex_hull
+        return self._computeConvexHull()
 
+    ##  Compute the hull that getConvexHull returns, on the main thread
+    def _computeConvexHull(self):
         hull = self._compute2DConvexHull()
 
         if self._global_stack and self._node:
@@ -65,6 +100,95 @@ class ConvexHullDecorator(SceneNodeDecorator):
                 hull = self._add2DAdhesionMargin(hull)
         return hull
 
+    ##  Take what computeConvexHull needs to compute the hull that getConvexHull returns
+    #
+    #   This runs on the main thread. The hulls of groups and twins are put together from the hulls
+    #   of other nodes, those are taken as they are now. Only the hull of a mesh is left to compute.
+    #   \return ConvexHullSnapshot
+    def takeConvexHullSnapshot(self):
+        snapshot = self._takeHullSnapshot()
+        if self._node is None:
+            return snapshot
+
+        if self._global_stack:
+            if self._global_stack.getProperty("print_sequence", "value") == "one_at_a_time" and (self._node.getParent() is None or not self._node.getParent().callDecoration("isGroup")):
+                snapshot.head = Polygon(numpy.array(self._global_stack.getProperty("machine_head_polygon", "value"), numpy.float32))
+                snapshot.adhesion_margin = self._getAdhesionMargin()
+        return snapshot
+
+    ##  Take what _computeSnapshotHull needs to compute the hull that _compute2DConvexHull returns
+    #   The hulls of the children of a group and of the source node of a twin are not taken as they
+    #   are now, their snapshots are taken instead. So no hull of a mesh is computed here.
+    #   \return ConvexHullSnapshot without the head
+    def _takeHullSnapshot(self):
+        snapshot = ConvexHullSnapshot()
+        if self._node is None:
+            return snapshot
+
+        if isinstance(self._node, DuplicatedNode) and self._global_stack:
+            snapshot.source = self._node.node.callDecoration("_takeHullSnapshot")
+            snapshot.print_mode = self._global_stack.getProperty("print_mode", "value")
+            snapshot.machine_width = self._global_stack.getProperty("machine_width", "value")
+
+        if self._node.callDecoration("isGroup"):
+            snapshot.children = []
+            for child in self._node.getChildren():
+                child_snapshot = child.callDecoration("_takeHullSnapshot")
+                if child_snapshot is not None:
+                    snapshot.children.append(child_snapshot)
+            snapshot.hull_offset = self._getHullOffset()
+            return snapshot
+
+        mesh = self._node.getMeshData()
+        if mesh:
+            snapshot.mesh = mesh
+            snapshot.world_transform = self._node.getWorldTransformation()
+            if not self._2d_convex_hull_mesh_cache_outdated:
+                snapshot.mesh_cache = self._2d_convex_hull_mesh_cache
+            snapshot.hull_offset = self._getHullOffset()
+        else:
+            snapshot.hull = Polygon([])
+        return snapshot
+
+    ##  Compute the hull of a snapshot taken by takeConvexHullSnapshot
+    #
+    #   This only uses the snapshot, so the ConvexHullScheduler runs it on its worker thread.
+    #   \return (hull, mesh cache), pass both to setConvexHull
+    @classmethod
+    def computeConvexHull(cls, snapshot):
+        hull, mesh_cache = cls._computeSnapshotHull(snapshot)
+        if hull is not None and snapshot.head is not None:
+            hull = cls._addAdhesionMargin(hull.getMinkowskiHull(snapshot.head), snapshot.adhesion_margin)
+        return hull, mesh_cache
+
+    ##  Compute the hull of a snapshot taken by _takeHullSnapshot, like _compute2DConvexHull does
+    #   \return (hull, mesh cache), the mesh cache is None unless the hull is computed from the mesh
+    @classmethod
+    def _computeSnapshotHull(cls, snapshot):
+        if snapshot.source is not None:
+            source_hull = cls._computeSnapshotHull(snapshot.source)[0]
+            if source_hull is not None:
+                twin_hull = DuplicatedNode.transformHull(source_hull, snapshot.print_mode, snapshot.machine_width)
+                if twin_hull is not None:
+                    return twin_hull, None
+
+        if snapshot.children is not None:
+            points = numpy.zeros((0, 2), dtype=numpy.int32)
+            for child_snapshot in snapshot.children:
+                child_hull = cls._computeSnapshotHull(child_snapshot)[0]
+                if child_hull:
+                    points = numpy.append(points, child_hull.getPoints(), axis = 0)
+            if points.size < 3:
+                return None, None
+            return cls._offsetHullBy(Polygon(points).getConvexHull(), snapshot.hull_offset), None
+
+        if snapshot.mesh is not None:
+            result = cls._cachedMeshHull(snapshot.mesh, snapshot.world_transform, snapshot.mesh_cache)
+            if result is None:
+                result = cls._computeMeshHull(snapshot.mesh, snapshot.world_transform, snapshot.hull_offset)
+            return result
+        return snapshot.hull, None
+
     ##  Get the convex hull of the node with the full head size
     def getConvexHullHeadFull(self):
         if self._node is None:
@@ -81,11 +205,16 @@ class ConvexHullDecorator(SceneNodeDecorator):
 
         if self._global_stack:
             if self._global_stack.getProperty("print_sequence", "value") == "one_at_a_time" and (self._node.getParent() is None or not self._node.getParent().callDecoration("isGroup")):
-                head_with_fans = self._compute2DConvexHeadMin()
-                head_with_fans_with_adhesion_margin = self._add2DAdhesionMargin(head_with_fans)
-                return head_with_fans_with_adhesion_margin
+                return self.addConvexHullHead(self._compute2DConvexHull())
         return None
 
+    ##  Add the head and the adhesion margin of getConvexHullHead around another hull of the node
+    #   The arranger turns the node, but the head does not turn with it. So it turns the hull of the
+    #   node only, and adds the head around that.
+    #   \param convex_hull Polygon, for instance getConvexHullBoundary turned around the node
+    def addConvexHullHead(self, convex_hull):
+        return self._add2DAdhesionMargin(convex_hull.getMinkowskiHull(self._getMinHeadAndFans()))
+
     ##  Get convex hull of the node
     #   In case of printing all at once this is the same as the convex hull.
     #   For one at the time this is the area without the head.
@@ -100,6 +229,20 @@ class ConvexHullDecorator(SceneNodeDecorator):
         return None
 
     def recomputeConvexHull(self):
+        # The arranger should not use the ShapeArrays of the old hull anymore
+        ShapeArray.invalidateNode(self._node)
+        self.setConvexHull(self._computeConvexHull())
+
+    ##  Show the convex hull of the node in the scene, or remove it if the node should not have one
+    #   \param convex_hull Polygon as returned by getConvexHull or computeConvexHull
+    #   \param mesh_cache The mesh cache returned by computeConvexHull, if any
+    def setConvexHull(self, convex_hull, mesh_cache = None):
+        self._convex_hull = convex_hull
+        if mesh_cache is not None and self._node is not None:
+            # The job computed it with the current settings
+            self._2d_convex_hull_mesh_cache = mesh_cache
+            self._2d_convex_hull_mesh_cache_outdated = False
+
         controller = Application.getInstance().getController()
         root = controller.getScene().getRoot()
         if self._node is None or controller.isToolOperationActive() or not self.__isDescendant(root, self._node):
@@ -108,7 +251,6 @@ class ConvexHullDecorator(SceneNodeDecorator):
                 self._convex_hull_node = None
             return
 
-        convex_hull = self.getConvexHull()
         if self._convex_hull_node:
             self._convex_hull_node.setParent(None)
         hull_node = ConvexHullNode.ConvexHullNode(self._node, convex_hull, self._raft_thickness, root)
@@ -122,19 +264,35 @@ class ConvexHullDecorator(SceneNodeDecorator):
             self._onChanged()
         if key in self._influencing_settings:
             self._init2DConvexHullCache() #Invalidate the cache.
+            # The hull of the mesh is computed again by the job, until then the old one is used.
+            self._2d_convex_hull_mesh_cache_outdated = True
             self._onChanged()
 
+    ##  Reset the caches of the hulls that are put together from other hulls
+    #   The cache for the mesh code path in _compute2DConvexHull(), see _computeMeshHull(), is
+    #   _2d_convex_hull_mesh_cache. It is one tuple so that it is replaced at once, hulls are also
+    #   computed by jobs.
     def _init2DConvexHullCache(self):
         # Cache for the group code path in _compute2DConvexHull()
         self._2d_convex_hull_group_child_polygon = None
         self._2d_convex_hull_group_result = None
 
-        # Cache for the mesh code path in _compute2DConvexHull()
-        self._2d_convex_hull_mesh = None
-        self._2d_convex_hull_mesh_world_transform = None
-        self._2d_convex_hull_mesh_result = None
+        # Cache for _compute2DConvexHeadFull()
+        self._2d_convex_head_full_hull = None
+        self._2d_convex_head_full_head_and_fans = None
+        self._2d_convex_head_full_result = None
 
     def _compute2DConvexHull(self):
+        if isinstance(self._node, DuplicatedNode):
+            # The twin of a node in mirror or duplication mode reuses the hull of that node. That hull
+            # already has the offset of _offsetHull, computed from the settings of the source node and
+            # not from those of the twin: the twin prints the same object, so it gets the same offset.
+            source_hull = self._node.node.callDecoration("_compute2DConvexHull")
+            if source_hull is not None:
+                twin_hull = self._node.transformSourceHull(source_hull)
+                if twin_hull is not None:
+                    return twin_hull
+
         if self._node.callDecoration("isGroup"):
             points = numpy.zeros((0, 2), dtype=numpy.int32)
             for child in self._node.getChildren():
@@ -160,74 +318,126 @@ class ConvexHullDecorator(SceneNodeDecorator):
             return offset_hull
 
         else:
-            offset_hull = None
-            mesh = None
-            world_transform = None
-            if self._node.getMeshData():
-                mesh = self._node.getMeshData()
-                world_transform = self._node.getWorldTransformation()
-
-                # Check the cache
-                if mesh is self._2d_convex_hull_mesh and world_transform == self._2d_convex_hull_mesh_world_transform:
-                    return self._2d_convex_hull_mesh_result
-
-                vertex_data = mesh.getConvexHullTransformedVertices(world_transform)
-                # Don't use data below 0.
-                # TODO; We need a better check for this as this gives poor results for meshes with long edges.
-                # Do not throw away vertices: the convex hull may be too small and objects can collide.
-                # vertex_data = vertex_data[vertex_data[:,1] >= -0.01]
-
-                if len(vertex_data) >= 4:
-                    # Round the vertex data to 1/10th of a mm, then remove all duplicate vertices
-                    # This is done to greatly speed up further convex hull calculations as the convex hull
-                    # becomes much less complex when dealing with highly detailed models.
-                    vertex_data = numpy.round(vertex_data, 1)
-
-                    vertex_data = vertex_data[:, [0, 2]]  # Drop the Y components to project to 2D.
-
-                    # Grab the set of unique points.
-                    #
-                    # This basically finds the unique rows in the array by treating them as opaque groups of bytes
-                    # which are as long as the 2 float64s in each row, and giving this view to numpy.unique() to munch.
-                    # See http://stackoverflow.com/questions/16970982/find-unique-rows-in-numpy-array
-                    vertex_byte_view = numpy.ascontiguousarray(vertex_data).view(
-                        numpy.dtype((numpy.void, vertex_data.dtype.itemsize * vertex_data.shape[1])))
-                    _, idx = numpy.unique(vertex_byte_view, return_index=True)
-                    vertex_data = vertex_data[idx]  # Select the unique rows by index.
-
-                    hull = Polygon(vertex_data)
-
-                    if len(vertex_data) >= 3:
-                        convex_hull = hull.getConvexHull()
-                        offset_hull = self._offsetHull(convex_hull)
-            else:
+            mesh = self._node.getMeshData()
+            if not mesh:
                 return Polygon([])  # Node has no mesh data, so just return an empty Polygon.
+            world_transform = self._node.getWorldTransformation()
 
-            # Store the result in the cache
-            self._2d_convex_hull_mesh = mesh
-            self._2d_convex_hull_mesh_world_transform = world_transform
-            self._2d_convex_hull_mesh_result = offset_hull
-
+            # Check the cache
+            result = self._cachedMeshHull(mesh, world_transform, self._2d_convex_hull_mesh_cache)
+            if result is None:
+                result = self._computeMeshHull(mesh, world_transform, self._getHullOffset())
+            offset_hull, self._2d_convex_hull_mesh_cache = result
             return offset_hull
 
+    ##  Look up the hull of a mesh in the cache of _computeMeshHull
+    #
+    #   If the node was only moved since the hull was computed, the hull only moves along with it.
+    #   It is moved from where it was computed and rounded like the vertices in _computeMeshHull, so
+    #   the rounding does not add up when the node is moved many times.
+    #   \param mesh MeshData of the node
+    #   \param world_transform Matrix of the node
+    #   \param cache The cache entry returned by _computeMeshHull, or None
+    #   \return (hull, new cache entry), or None if the hull has to be computed
+    @classmethod
+    def _cachedMeshHull(cls, mesh, world_transform, cache):
+        if cache is None or cache[0] is not mesh:
+            return None
+        _, computed_transform, computed_hull, cached_transform, cached_hull = cache
+        if world_transform == cached_transform:
+            return cached_hull, cache
+        if computed_hull is None or not cls._isTranslation(computed_transform, world_transform):
+            return None
+
+        translation = world_transform.getData()[[0, 2], 3] - computed_transform.getData()[[0, 2], 3]
+        offset_hull = Polygon(numpy.round(computed_hull.getPoints() + translation, 1))
+        return offset_hull, (mesh, computed_transform, computed_hull, world_transform, offset_hull)
+
+    ##  Compute the 2D hull of a mesh, with the offset of the settings
+    #
+    #   This only uses its arguments, so it can run on any thread.
+    #   \param mesh MeshData of the node
+    #   \param world_transform Matrix of the node
+    #   \param hull_offset The offset of _getHullOffset
+    #   \return (hull, cache entry for _cachedMeshHull)
+    @classmethod
+    def _computeMeshHull(cls, mesh, world_transform, hull_offset):
+        offset_hull = None
+
+        # The mesh computes the 3D convex hull in local space once and caches it, so only
+        # the vertices of that hull are transformed here.
+        vertex_data = mesh.getConvexHullTransformedVertices(world_transform)
+        # Don't use data below 0.
+        # TODO; We need a better check for this as this gives poor results for meshes with long edges.
+        # Do not throw away vertices: the convex hull may be too small and objects can collide.
+        # vertex_data = vertex_data[vertex_data[:,1] >= -0.01]
+
+        if len(vertex_data) >= 4:
+            # Round the vertex data to 1/10th of a mm, then remove all duplicate vertices
+            # This is done to greatly speed up further convex hull calculations as the convex hull
+            # becomes much less complex when dealing with highly detailed models.
+            vertex_data = numpy.round(vertex_data, 1)
+
+            vertex_data = vertex_data[:, [0, 2]]  # Drop the Y components to project to 2D.
+
+            # Grab the set of unique points.
+            #
+            # This basically finds the unique rows in the array by treating them as opaque groups of bytes
+            # which are as long as the 2 float64s in each row, and giving this view to numpy.unique() to munch.
+            # See http://stackoverflow.com/questions/16970982/find-unique-rows-in-numpy-array
+            vertex_byte_view = numpy.ascontiguousarray(vertex_data).view(
+                numpy.dtype((numpy.void, vertex_data.dtype.itemsize * vertex_data.shape[1])))
+            _, idx = numpy.unique(vertex_byte_view, return_index=True)
+            vertex_data = vertex_data[idx]  # Select the unique rows by index.
+
+            hull = Polygon(vertex_data)
+
+            if len(vertex_data) >= 3:
+                convex_hull = hull.getConvexHull()
+                offset_hull = cls._offsetHullBy(convex_hull, hull_offset)
+
+        return offset_hull, (mesh, world_transform, offset_hull, world_transform, offset_hull)
+
+    ##  Return whether two transformations only differ in their translation
+    #   \param previous_transform Matrix
+    #   \param transform Matrix
+    @staticmethod
+    def _isTranslation(previous_transform, transform):
+        return numpy.array_equal(previous_transform.getData()[:, :3], transform.getData()[:, :3]) and numpy.array_equal(previous_transform.getData()[3], transform.getData()[3])
+
     def _getHeadAndFans(self):
         return Polygon(numpy.array(self._global_stack.getProperty("machine_head_with_fans_polygon", "value"), numpy.float32))
 
     def _compute2DConvexHeadFull(self):
-        return self._compute2DConvexHull().getMinkowskiHull(self._getHeadAndFans())
+        convex_hull = self._compute2DConvexHull()
+        head_and_fans = self._global_stack.getProperty("machine_head_with_fans_polygon", "value")
+
+        # Check the cache, _compute2DConvexHull() returns the same hull as long as the node is not changed
+        if convex_hull is self._2d_convex_head_full_hull and head_and_fans == self._2d_convex_head_full_head_and_fans:
+            return self._2d_convex_head_full_result
+
+        head_full = convex_hull.getMinkowskiHull(Polygon(numpy.array(head_and_fans, numpy.float32)))
+
+        # Store the result in the cache
+        self._2d_convex_head_full_hull = convex_hull
+        self._2d_convex_head_full_head_and_fans = head_and_fans
+        self._2d_convex_head_full_result = head_full
+        return head_full
 
-    def _compute2DConvexHeadMin(self):
+    ##  The part of the head and fans that is around the node whichever way the head moves
+    #   Min head hull is used for the push free
+    def _getMinHeadAndFans(self):
         headAndFans = self._getHeadAndFans()
         mirrored = headAndFans.mirror([0, 0], [0, 1]).mirror([0, 0], [1, 0])  # Mirror horizontally & vertically.
-        head_and_fans = self._getHeadAndFans().intersectionConvexHulls(mirrored)
-
-        # Min head hull is used for the push free
-        min_head_hull = self._compute2DConvexHull().getMinkowskiHull(head_and_fans)
-        return min_head_hull
+        return headAndFans.intersectionConvexHulls(mirrored)
 
     ##  Compensate given 2D polygon with adhesion margin
     #   \return 2D polygon with added margin
     def _add2DAdhesionMargin(self, poly):
+        return self._addAdhesionMargin(poly, self._getAdhesionMargin())
+
+    ##  Return the margin that the adhesion type adds around the node
+    def _getAdhesionMargin(self):
         # Compensate for raft/skirt/brim
         # Add extra margin depending on adhesion type
         adhesion_type = self._global_stack.getProperty("adhesion_type", "value")
@@ -244,7 +454,11 @@ class ConvexHullDecorator(SceneNodeDecorator):
                    self._getSettingProperty("skirt_line_count", "value") * self._getSettingProperty("skirt_brim_line_width", "value"))
         else:
             raise Exception("Unknown bed adhesion type. Did you forget to update the convex hull calculations for your new bed adhesion type?")
+        return extra_margin
 
+    ##  Grow a 2D polygon by the result of _getAdhesionMargin
+    @staticmethod
+    def _addAdhesionMargin(poly, extra_margin):
         # adjust head_and_fans with extra margin
         if extra_margin > 0:
             extra_margin_polygon = Polygon.approximatedCircle(extra_margin)
@@ -257,6 +471,10 @@ class ConvexHullDecorator(SceneNodeDecorator):
     #   \return New Polygon instance that is offset with everything that
     #   influences the collision area.
     def _offsetHull(self, convex_hull):
+        return self._offsetHullBy(convex_hull, self._getHullOffset())
+
+    ##  Return by how much the settings grow the collision area on every side
+    def _getHullOffset(self):
         horizontal_expansion = max(
             self._getSettingProperty("xy_offset", "value"),
             self._getSettingProperty("xy_offset_layer_0", "value")
@@ -265,7 +483,11 @@ class ConvexHullDecorator(SceneNodeDecorator):
         mold_width = 0
         if self._getSettingProperty("mold_enabled", "value"):
             mold_width = self._getSettingProperty("mold_width", "value")
-        hull_offset = horizontal_expansion + mold_width
+        return horizontal_expansion + mold_width
+
+    ##  Offset the convex hull by the result of _getHullOffset
+    @staticmethod
+    def _offsetHullBy(convex_hull, hull_offset):
         if hull_offset != 0:
             expansion_polygon = Polygon(numpy.array([
                 [-hull_offset, -hull_offset],
@@ -279,7 +501,14 @@ class ConvexHullDecorator(SceneNodeDecorator):
 
     def _onChanged(self, *args):
         self._raft_thickness = self._build_volume.getRaftThickness()
-        self.recomputeConvexHull()
+        # The arranger should not use the ShapeArrays of the old hull anymore
+        ShapeArray.invalidateNode(self._node)
+        if self._node is None or self._node.getParent() is None:
+            # Not in the scene (anymore), so the node does not need a hull
+            ConvexHullScheduler.getInstance().cancel(self)
+            self.setConvexHull(None)
+        else:
+            ConvexHullScheduler.getInstance().schedule(self)
 
     def _onGlobalStackChanged(self):
         if self._global_stack:
@@ -0,0 +1,106 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from PyQt5.QtCore import QTimer
+
+from UM.Job import Job
+from UM.Logger import Logger
+
+
+##  Computes the convex hulls of a batch of nodes on a worker thread.
+#   The hulls are computed from snapshots of the nodes, the job does not look at the nodes or their
+#   decorators themselves. The results are a list of (decorator, generation, hull, mesh cache), see
+#   ConvexHullScheduler.
+class ConvexHullJob(Job):
+    def __init__(self, requests):
+        super().__init__()
+        self._requests = requests  # list of (decorator, generation, snapshot)
+        self._results = []
+
+    def run(self):
+        for decorator, generation, snapshot in self._requests:
+            try:
+                hull, mesh_cache = decorator.computeConvexHull(snapshot)
+            except Exception:
+                Logger.logException("e", "Failed to compute the convex hull of a node")
+                continue
+            self._results.append((decorator, generation, hull, mesh_cache))
+            Job.yieldThread()
+
+    def getResult(self):
+        return self._results
+
+
+##  Collects the convex hull decorators that need a new hull and recomputes them in the background.
+#
+#   Changing a setting or the material makes every ConvexHullDecorator in the scene ask for a new
+#   hull at once. Instead of computing all of them on the UI thread, the decorators are collected
+#   until control returns to the event loop and then computed in one ConvexHullJob. Asking again for
+#   a decorator that is already waiting costs nothing. When the job starts, the decorators take a
+#   snapshot of what they need from their nodes and the settings, still on the main thread. The new
+#   hulls are published to the scene in one batch when the job is finished; hulls of decorators that
+#   changed again in the meantime are dropped, they are already waiting for the next job.
+class ConvexHullScheduler:
+    def __init__(self):
+        self._pending = {}  # decorator -> generation, in the order of the requests
+        self._generations = {}  # decorator -> generation of the latest request
+        self._job = None
+
+        self._start_timer = QTimer()
+        self._start_timer.setInterval(0)
+        self._start_timer.setSingleShot(True)
+        self._start_timer.timeout.connect(self._startJob)
+
+    ##  Request a new convex hull for the node of the decorator
+    def schedule(self, decorator):
+        generation = self._generations.get(decorator, 0) + 1
+        self._generations[decorator] = generation
+        self._pending.pop(decorator, None)
+        self._pending[decorator] = generation
+        if self._job is None:
+            self._start_timer.start()
+
+    ##  Forget a decorator, for instance because its node was removed
+    #   A hull that is being computed for it is dropped.
+    def cancel(self, decorator):
+        self._pending.pop(decorator, None)
+        self._generations.pop(decorator, None)
+
+    def _startJob(self):
+        if self._job is not None or not self._pending:
+            return
+        requests = []
+        for decorator, generation in self._pending.items():
+            try:
+                requests.append((decorator, generation, decorator.takeConvexHullSnapshot()))
+            except Exception:
+                Logger.logException("e", "Failed to take a snapshot of a node for its convex hull")
+                self._generations.pop(decorator, None)
+        self._pending = {}
+        if not requests:
+            return
+        self._job = ConvexHullJob(requests)
+        self._job.finished.connect(self._onJobFinished)
+        self._job.start()
+
+    def _onJobFinished(self, job):
+        self._job = None
+        for decorator, generation, hull, mesh_cache in job.getResult():
+            if self._generations.get(decorator) != generation:
+                continue  # Changed again or cancelled while the job was running.
+            del self._generations[decorator]
+            try:
+                decorator.setConvexHull(hull, mesh_cache)
+            except Exception:
+                Logger.logException("e", "Failed to publish the convex hull of a node")
+
+        if self._pending:
+            self._start_timer.start()
+
+    @classmethod
+    def getInstance(cls) -> "ConvexHullScheduler":
+        if ConvexHullScheduler.__instance is None:
+            ConvexHullScheduler.__instance = cls()
+        return ConvexHullScheduler.__instance
+
+    __instance = None  # type: "ConvexHullScheduler"
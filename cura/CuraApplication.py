@@ -35,6 +35,7 @@ from UM.Operations.GroupedOperation import GroupedOperation
 from UM.Operations.SetTransformOperation import SetTransformOperation
 
 from cura.Arrange import Arrange
+from cura.ArrangeManager import ArrangeManager
 from cura.ShapeArray import ShapeArray
 from cura.ConvexHullDecorator import ConvexHullDecorator
 from cura.SetParentOperation import SetParentOperation
@@ -229,6 +230,7 @@ class CuraApplication(QtApplication):
         ])
         self._physics = None
         self._volume = None
+        self._arrange_manager = None
         self._output_devices = {}
         self._print_information = None
         self._previous_active_tool = None
@@ -294,6 +296,8 @@ class CuraApplication(QtApplication):
         preferences.addPreference("mesh/scale_to_fit", False)
         preferences.addPreference("mesh/scale_tiny_meshes", True)
         preferences.addPreference("mesh/arrange_align", False)
+        preferences.addPreference("mesh/arrange_rotate", False)
+        preferences.addPreference("mesh/arrange_hierarchical_threshold", 20)
         preferences.addPreference("cura/dialog_on_project_save", True)
         preferences.addPreference("cura/asked_dialog_on_project_save", False)
         preferences.addPreference("cura/choice_on_profile_override", "always_ask")
@@ -651,6 +655,7 @@ class CuraApplication(QtApplication):
 
         # Set the build volume of the arranger to the used build volume
         Arrange.build_volume = self._volume
+        self._arrange_manager = ArrangeManager(controller.getScene(), self._volume)
 
         self.getRenderer().setBackgroundColor(QColor(245, 245, 245))
 
@@ -1292,6 +1297,10 @@ class CuraApplication(QtApplication):
     def getBuildVolume(self):
         return self._volume
 
+    ##  Get the arrange manager, which keeps an arranger with the objects on the build plate
+    def getArrangeManager(self):
+        return self._arrange_manager
+
     additionalComponentsChanged = pyqtSignal(str, arguments = ["areaId"])
 
     @pyqtProperty("QVariantMap", notify = additionalComponentsChanged)
@@ -1361,8 +1370,7 @@ class CuraApplication(QtApplication):
         filename = job.getFileName()
         self._currently_loading_files.remove(filename)
 
-        root = self.getController().getScene().getRoot()
-        arranger = Arrange.create(scene_root = root)
+        arranger = self._arrange_manager.getArranger()
         min_offset = 4
         self.fileLoaded.emit(filename)
 
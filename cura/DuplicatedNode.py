@@ -1,5 +1,6 @@
 from copy import deepcopy
 
+from UM.Math.Polygon import Polygon
 from UM.Math.Vector import Vector
 from UM.Operations.MirrorOperation import MirrorOperation
 from UM.Application import Application
@@ -9,6 +10,8 @@ from cura.ShapeArray import ShapeArray
 from cura.Settings.ExtruderManager import ExtruderManager
 from cura.Settings.SetObjectExtruderOperation import SetObjectExtruderOperation
 
+import numpy
+
 class DuplicatedNode(SceneNode):
 
     def __init__(self, node, parent = None):
@@ -58,6 +61,30 @@ class DuplicatedNode(SceneNode):
         if node_pos.x > 0:
             self.node.setPosition(Vector(0, node_pos.y, node_pos.z))
 
+    ##  Move a hull of the source node to where this twin is
+    #   The twin is a mirrored (in x) or translated copy of the source node, so the same goes for its
+    #   hull and the points do not need to be computed from the mesh again.
+    #   \param hull Polygon of the source node
+    #   \return Polygon of this node, or None if there are no twins in the current print mode
+    def transformSourceHull(self, hull):
+        global_stack = Application.getInstance().getGlobalContainerStack()
+        return self.transformHull(hull, global_stack.getProperty("print_mode", "value"), global_stack.getProperty("machine_width", "value"))
+
+    ##  Move a hull of a source node to where its twin is, without looking at the settings
+    #   This can run on any thread, see ConvexHullDecorator.computeConvexHull.
+    #   \param hull Polygon of the source node
+    #   \param print_mode value of the print_mode setting
+    #   \param machine_width value of the machine_width setting
+    #   \return Polygon of the twin, or None if there are no twins in the print mode
+    @staticmethod
+    def transformHull(hull, print_mode, machine_width):
+        if print_mode == "mirror":
+            # Reversed to keep the points in the same order around the hull
+            return Polygon(numpy.array(hull.getPoints()[::-1] * [-1, 1], numpy.float32))
+        elif print_mode == "duplication":
+            return Polygon(numpy.array(hull.getPoints() + [machine_width / 2, 0], numpy.float32))
+        return None
+
     def _onTransformationChanged(self, node):
         print_mode = Application.getInstance().getGlobalContainerStack().getProperty("print_mode", "value")
         if print_mode != "regular":
@@ -0,0 +1,209 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from cura.Arrange import Arrange, LocationSuggestion
+
+import numpy
+
+
+##  Arranger that searches coarse versions of the occupied grid first and only refines where needed.
+#
+#   For every cell size in levels, the cells of the grid are grouped into blocks. A block where the
+#   shape is certain to fit (for every cell in the block) gives an upper bound for the best priority,
+#   and a block where the shape is certain to collide is skipped. Only the cells that are still
+#   undecided and can beat the best priority so far are refined at the next level, and in the end
+#   checked at full resolution. The result is the same spot that Arrange.bestSpot finds.
+class HierarchicalArrange(Arrange):
+    ##  Sizes of the blocks in cells, coarsest first. Each size must be a multiple of the next one.
+    levels = (8, 2)
+
+    def __init__(self, x, y, offset_x, offset_y, scale = 1.0):
+        super().__init__(x, y, offset_x, offset_y, scale = scale)
+        self._pyramid = {}  # block size -> (any cell occupied, all cells occupied)
+
+    def place(self, x, y, shape_arr):
+        super().place(x, y, shape_arr)
+        self._pyramid = {}
+
+    def setGrid(self, occupied, priority):
+        super().setGrid(occupied, priority)
+        self._pyramid = {}
+
+    ##  Find "best" spot for ShapeArray
+    #   Return namedtuple with properties x, y, penalty_points, priority
+    #   \param shape_arr ShapeArray
+    #   \param start_prio Start with this priority value (and skip the ones before)
+    #   \param step Slicing value, higher = more skips = faster but less accurate
+    def bestSpot(self, shape_arr, start_prio = 0, step = 1):
+        shape_mask = shape_arr.arr == 1
+        if self._scale != 1 or not numpy.any(shape_mask):
+            return super().bestSpot(shape_arr, start_prio = start_prio, step = step)
+
+        priorities = self._triedPriorities(start_prio, step)
+        no_priority = numpy.iinfo(numpy.int64).max
+        priority = self._priority.astype(numpy.int64)
+        priority[~numpy.isin(self._priority, priorities)] = no_priority
+
+        # Upper left corner of the shape for every row and column of the grid. Like in checkShape,
+        # the shape does not fit if this corner is outside the grid.
+        corner_y = numpy.arange(priority.shape[0]) + shape_arr.offset_y
+        corner_x = numpy.arange(priority.shape[1]) + shape_arr.offset_x
+        unknown = (priority != no_priority) & (corner_y >= 0)[:, numpy.newaxis] & (corner_x >= 0)[numpy.newaxis, :]
+
+        best = (no_priority, 0)  # (priority, index of the cell), the index decides between equal priorities
+        for block_size in self.levels:
+            if not numpy.any(unknown):
+                break
+            fits, collides = self._classifyBlocks(shape_mask, corner_y, corner_x, unknown, block_size)
+            best = min(best, self._bestCell(priority, unknown & fits))
+            unknown &= ~(fits | collides)
+            unknown &= priority <= best[0]
+
+        if numpy.any(unknown):
+            best = min(best, self._bestCell(priority, unknown & self._exactFits(shape_mask, corner_y, corner_x, unknown)))
+
+        if best[0] == no_priority:
+            return LocationSuggestion(x = None, y = None, penalty_points = None, priority = priorities[-1])  # No suitable location found :-(
+
+        y, x = numpy.unravel_index(best[1], priority.shape)
+        projected_x = x - self._offset_x
+        projected_y = y - self._offset_y
+        # Validate the spot at full resolution before anyone places the object there.
+        penalty_points = self.checkShape(projected_x, projected_y, shape_arr)
+        if penalty_points is None:
+            return super().bestSpot(shape_arr, start_prio = start_prio, step = step)
+        return LocationSuggestion(x = projected_x, y = projected_y, penalty_points = penalty_points, priority = self._priority[y][x])
+
+    ##  Return (priority, index) of the cell with the lowest priority among the cells in mask
+    def _bestCell(self, priority, mask):
+        if not numpy.any(mask):
+            return (numpy.iinfo(numpy.int64).max, 0)
+        masked_priority = numpy.where(mask, priority, numpy.iinfo(numpy.int64).max)
+        index = int(numpy.argmin(masked_priority))
+        return (int(masked_priority.flat[index]), index)
+
+    ##  Determine per block of cells whether the shape fits for all cells or collides for all cells
+    #   Only the blocks around the unknown cells are computed.
+    #   \return (fits, collides) boolean arrays with the shape of the grid
+    def _classifyBlocks(self, shape_mask, corner_y, corner_x, unknown, block_size):
+        any_occupied, all_occupied = self._occupiedBlocks(block_size)
+
+        # The union and intersection of the shape over all cells of a block, in blocks.
+        # The shape of the first cell of a block starts at this block:
+        first_block_y, phase_y = divmod(int(corner_y[0]), block_size)
+        first_block_x, phase_x = divmod(int(corner_x[0]), block_size)
+        union, intersection = self._blockShapes(shape_mask, block_size, phase_y, phase_x)
+
+        rows = numpy.nonzero(numpy.any(unknown, axis = 1))[0]
+        columns = numpy.nonzero(numpy.any(unknown, axis = 0))[0]
+        block_y0, block_y1 = rows[0] // block_size, rows[-1] // block_size + 1
+        block_x0, block_x1 = columns[0] // block_size, columns[-1] // block_size + 1
+
+        # Everything outside the grid is occupied.
+        window_y = block_y0 + first_block_y
+        window_x = block_x0 + first_block_x
+        any_window = self._window(any_occupied, window_y, window_y + block_y1 - block_y0 + union.shape[0] - 1,
+                                  window_x, window_x + block_x1 - block_x0 + union.shape[1] - 1)
+        block_fits = self._correlate(any_window, union.astype(numpy.float64)) < 0.5
+        if numpy.any(intersection):
+            all_window = self._window(all_occupied, window_y, window_y + block_y1 - block_y0 + intersection.shape[0] - 1,
+                                      window_x, window_x + block_x1 - block_x0 + intersection.shape[1] - 1)
+            block_collides = self._correlate(all_window, intersection.astype(numpy.float64)) > 0.5
+        else:
+            block_collides = numpy.zeros(block_fits.shape, dtype = bool)
+
+        fits = numpy.zeros(unknown.shape, dtype = bool)
+        collides = numpy.zeros(unknown.shape, dtype = bool)
+        cell_y0, cell_x0 = block_y0 * block_size, block_x0 * block_size
+        cell_y1 = min(block_y1 * block_size, unknown.shape[0])
+        cell_x1 = min(block_x1 * block_size, unknown.shape[1])
+        fits[cell_y0:cell_y1, cell_x0:cell_x1] = self._expandBlocks(block_fits, block_size)[:cell_y1 - cell_y0, :cell_x1 - cell_x0]
+        collides[cell_y0:cell_y1, cell_x0:cell_x1] = self._expandBlocks(block_collides, block_size)[:cell_y1 - cell_y0, :cell_x1 - cell_x0]
+        return fits, collides
+
+    ##  Check the unknown cells at full resolution
+    #   \return boolean array with the shape of the grid, True where the shape fits
+    def _exactFits(self, shape_mask, corner_y, corner_x, unknown):
+        rows = numpy.nonzero(numpy.any(unknown, axis = 1))[0]
+        columns = numpy.nonzero(numpy.any(unknown, axis = 0))[0]
+        y0, y1 = rows[0], rows[-1] + 1
+        x0, x1 = columns[0], columns[-1] + 1
+        window = self._occupiedWindow(int(corner_y[y0]), int(corner_y[y1 - 1]) + shape_mask.shape[0],
+                                      int(corner_x[x0]), int(corner_x[x1 - 1]) + shape_mask.shape[1])
+        fits = numpy.zeros(unknown.shape, dtype = bool)
+        fits[y0:y1, x0:x1] = self._correlate(window, shape_mask.astype(numpy.float64)) < 0.5
+        return fits
+
+    ##  Return grid[y0:y1, x0:x1] as float array, with ones where the window is outside the grid
+    @staticmethod
+    def _window(grid, y0, y1, x0, x1):
+        window = numpy.ones((y1 - y0, x1 - x0), dtype = numpy.float64)
+        src_y0, src_y1 = max(y0, 0), min(y1, grid.shape[0])
+        src_x0, src_x1 = max(x0, 0), min(x1, grid.shape[1])
+        if src_y0 < src_y1 and src_x0 < src_x1:
+            window[src_y0 - y0:src_y1 - y0, src_x0 - x0:src_x1 - x0] = grid[src_y0:src_y1, src_x0:src_x1]
+        return window
+
+    ##  Return occupied[y0:y1, x0:x1] as float array, with ones where the window is outside the grid
+    #   Only the packed rows and bytes under the window are unpacked.
+    def _occupiedWindow(self, y0, y1, x0, x1):
+        window = numpy.ones((y1 - y0, x1 - x0), dtype = numpy.float64)
+        src_y0, src_y1 = max(y0, 0), min(y1, self.shape[0])
+        src_x0, src_x1 = max(x0, 0), min(x1, self.shape[1])
+        if src_y0 < src_y1 and src_x0 < src_x1:
+            window[src_y0 - y0:src_y1 - y0, src_x0 - x0:src_x1 - x0] = self._occupiedRegion(src_y0, src_y1, src_x0, src_x1)
+        return window
+
+    ##  Return the occupied grid in blocks: whether any cell is occupied and whether all cells are
+    #   Cells outside the grid count as occupied.
+    def _occupiedBlocks(self, block_size):
+        if block_size not in self._pyramid:
+            grid_y, grid_x = self.shape
+            blocks_y = -(-grid_y // block_size)
+            blocks_x = -(-grid_x // block_size)
+            padded = numpy.ones((blocks_y * block_size, blocks_x * block_size), dtype = bool)
+            padded[:grid_y, :grid_x] = self._occupied != 0
+            blocks = padded.reshape(blocks_y, block_size, blocks_x, block_size)
+            self._pyramid[block_size] = (blocks.any(axis = (1, 3)), blocks.all(axis = (1, 3)))
+        return self._pyramid[block_size]
+
+    ##  Return the union and the intersection of the shape over all offsets within a block, in blocks
+    #   The union covers every block that the shape of any cell of the block can touch, the
+    #   intersection only the blocks that are completely covered by the shape of every cell.
+    #   \param phase_y, phase_x position of the shape of the first cell within its block
+    @classmethod
+    def _blockShapes(cls, shape_mask, block_size, phase_y, phase_x):
+        union = cls._sweep(cls._sweep(shape_mask, block_size, 0, numpy.logical_or), block_size, 1, numpy.logical_or)
+        intersection = cls._sweep(cls._sweep(shape_mask, block_size, 0, numpy.logical_and), block_size, 1, numpy.logical_and)
+
+        size_y = -(-(phase_y + union.shape[0]) // block_size) * block_size
+        size_x = -(-(phase_x + union.shape[1]) // block_size) * block_size
+        padded_union = numpy.zeros((size_y, size_x), dtype = bool)
+        padded_union[phase_y:phase_y + union.shape[0], phase_x:phase_x + union.shape[1]] = union
+        padded_intersection = numpy.zeros((size_y, size_x), dtype = bool)
+        padded_intersection[phase_y:phase_y + union.shape[0], phase_x:phase_x + union.shape[1]] = intersection
+
+        blocks_shape = (size_y // block_size, block_size, size_x // block_size, block_size)
+        return (padded_union.reshape(blocks_shape).any(axis = (1, 3)),
+                padded_intersection.reshape(blocks_shape).all(axis = (1, 3)))
+
+    ##  Combine the mask with itself shifted by 0 .. block_size - 1 cells along an axis
+    #   Outside the mask counts as False, so the result is block_size - 1 cells larger.
+    @staticmethod
+    def _sweep(mask, block_size, axis, combine):
+        new_shape = list(mask.shape)
+        new_shape[axis] += block_size - 1
+        result = None
+        for shift in range(block_size):
+            shifted = numpy.zeros(new_shape, dtype = bool)
+            if axis == 0:
+                shifted[shift:shift + mask.shape[0], :] = mask
+            else:
+                shifted[:, shift:shift + mask.shape[1]] = mask
+            result = shifted if result is None else combine(result, shifted)
+        return result
+
+    ##  Repeat every block value block_size times along both axes
+    @staticmethod
+    def _expandBlocks(blocks, block_size):
+        return numpy.repeat(numpy.repeat(blocks, block_size, axis = 0), block_size, axis = 1)
@@ -10,11 +10,15 @@ import numpy
 
 
 ## Builder class for constructing a LayerData object
+#
+#  The line mesh of every layer is built once and kept, so layers can be added while the LayerData
+#  is built again and again, for instance to show the layers while they come in from the engine.
 class LayerDataBuilder(MeshBuilder):
     def __init__(self):
         super().__init__()
         self._layers = {}
         self._element_counts = {}
+        self._layer_meshes = {}  # layer -> (polygon count, vertices, colors, line_dimensions, extruders, line_types, indices)
 
     def addLayer(self, layer):
         if layer not in self._layers:
@@ -49,16 +53,14 @@ class LayerDataBuilder(MeshBuilder):
 
         self._layers[layer].setThickness(thickness)
 
-    ##  Return the layer data as LayerData.
+    ##  Build the line mesh of a layer, with indices starting at 0, and keep it for build()
     #
-    #   \param material_color_map: [r, g, b, a] for each extruder row.
-    #   \param line_type_brightness: compatibility layer view uses line type brightness of 0.5
-    def build(self, material_color_map, line_type_brightness = 1.0):
-        vertex_count = 0
-        index_count = 0
-        for layer, data in self._layers.items():
-            vertex_count += data.lineMeshVertexCount()
-            index_count += data.lineMeshElementCount()
+    #   Layers that were not built yet, or that got more polygons after they were built, are built by
+    #   build(). Building them earlier spreads the work.
+    def buildLayer(self, layer):
+        data = self._layers[layer]
+        vertex_count = data.lineMeshVertexCount()
+        index_count = data.lineMeshElementCount()
 
         vertices = numpy.empty((vertex_count, 3), numpy.float32)
         line_dimensions = numpy.empty((vertex_count, 2), numpy.float32)
@@ -67,16 +69,34 @@ class LayerDataBuilder(MeshBuilder):
         extruders = numpy.empty((vertex_count), numpy.float32)
         line_types = numpy.empty((vertex_count), numpy.float32)
 
-        vertex_offset = 0
-        index_offset = 0
-        for layer, data in sorted(self._layers.items()):
-            ( vertex_offset, index_offset ) = data.build( vertex_offset, index_offset, vertices, colors, line_dimensions, extruders, line_types, indices)
-            self._element_counts[layer] = data.elementCount
+        data.build(0, 0, vertices, colors, line_dimensions, extruders, line_types, indices)
+        self._element_counts[layer] = data.elementCount
+        self._layer_meshes[layer] = (len(data.polygons), vertices, colors, line_dimensions, extruders, line_types, indices)
+
+    ##  Return the layer data as LayerData.
+    #
+    #   The builder can be used again afterwards, to add more layers and build again.
+    #   \param material_color_map: [r, g, b, a] for each extruder row.
+    #   \param line_type_brightness: compatibility layer view uses line type brightness of 0.5
+    #   \param layer_number_offset: added to the numbers of the layers in the LayerData
+    def build(self, material_color_map, line_type_brightness = 1.0, layer_number_offset = 0):
+        for layer, data in self._layers.items():
+            layer_mesh = self._layer_meshes.get(layer)
+            if layer_mesh is None or layer_mesh[0] != len(data.polygons):
+                self.buildLayer(layer)
+
+        layer_meshes = [self._layer_meshes[layer] for layer in sorted(self._layers)]
+        vertices = self._concatenate([layer_mesh[1] for layer_mesh in layer_meshes], (0, 3), numpy.float32)
+        colors = self._concatenate([layer_mesh[2] for layer_mesh in layer_meshes], (0, 4), numpy.float32)
+        line_dimensions = self._concatenate([layer_mesh[3] for layer_mesh in layer_meshes], (0, 2), numpy.float32)
+        extruders = self._concatenate([layer_mesh[4] for layer_mesh in layer_meshes], (0, ), numpy.float32)
+        line_types = self._concatenate([layer_mesh[5] for layer_mesh in layer_meshes], (0, ), numpy.float32)
+
+        # The indices of every layer start at 0, so they are offset by the vertices of the layers before it.
+        vertex_offsets = numpy.cumsum([0] + [len(layer_mesh[1]) for layer_mesh in layer_meshes[:-1]], dtype = numpy.int32)
+        indices = self._concatenate([layer_mesh[6] + vertex_offset for layer_mesh, vertex_offset in zip(layer_meshes, vertex_offsets)], (0, 2), numpy.int32)
 
-        self.addVertices(vertices)
         colors[:, 0:3] *= line_type_brightness
-        self.addColors(colors)
-        self.addIndices(indices.flatten())
 
         # Note: we're using numpy indexing here.
         # See also: https://docs.scipy.org/doc/numpy/reference/arrays.indexing.html
@@ -110,7 +130,16 @@ class LayerDataBuilder(MeshBuilder):
                 }
             }
 
-        return LayerData(vertices=self.getVertices(), normals=self.getNormals(), indices=self.getIndices(),
-                        colors=self.getColors(), uvs=self.getUVCoordinates(), file_name=self.getFileName(),
-                        center_position=self.getCenterPosition(), layers=self._layers,
-                        element_counts=self._element_counts, attributes=attributes)
+        # The LayerData gets its own dictionaries, layers can still be added to this builder.
+        layers = {layer + layer_number_offset: data for layer, data in self._layers.items()}
+        element_counts = {layer + layer_number_offset: count for layer, count in self._element_counts.items()}
+
+        return LayerData(vertices=vertices, normals=self.getNormals(), indices=indices.flatten(),
+                        colors=colors, uvs=self.getUVCoordinates(), file_name=self.getFileName(),
+                        center_position=self.getCenterPosition(), layers=layers,
+                        element_counts=element_counts, attributes=attributes)
+
+    ##  Concatenate arrays, which may be none at all
+    @staticmethod
+    def _concatenate(arrays, empty_shape, dtype):
+        return numpy.concatenate([numpy.empty(empty_shape, dtype)] + arrays)
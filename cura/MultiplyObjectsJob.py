@@ -9,17 +9,21 @@ from UM.Operations.TranslateOperation import TranslateOperation
 from UM.Operations.GroupedOperation import GroupedOperation
 from UM.Logger import Logger
 from UM.Message import Message
+from UM.Preferences import Preferences
 from UM.i18n import i18nCatalog
 i18n_catalog = i18nCatalog("cura")
 
 from cura.ZOffsetDecorator import ZOffsetDecorator
 from cura.Arrange import Arrange
+from cura.HierarchicalArrange import HierarchicalArrange
 from cura.ShapeArray import ShapeArray
 from cura.DuplicatedNode import DuplicatedNode
 from cura.AddNodesOperation import AddNodesOperation
 
 from typing import List
 
+import copy
+
 from UM.Application import Application
 from UM.Scene.Selection import Selection
 from UM.Operations.AddSceneNodeOperation import AddSceneNodeOperation
@@ -35,48 +39,56 @@ class MultiplyObjectsJob(Job):
         status_message = Message(i18n_catalog.i18nc("@info:status", "Multiplying and placing objects"), lifetime=0,
                                  dismissable=False, progress=0)
         status_message.show()
-        scene = Application.getInstance().getController().getScene()
 
         total_progress = len(self._objects) * self._count
         current_progress = 0
 
-        root = scene.getRoot()
-        arranger = Arrange.create(scene_root=root)
+        # Searching coarse to fine pays off when there are many objects to place
+        if total_progress > int(Preferences.getInstance().getValue("mesh/arrange_hierarchical_threshold")):
+            arranger_class = HierarchicalArrange
+        else:
+            arranger_class = Arrange
+        arranger = Application.getInstance().getArrangeManager().getArranger(arranger_class)
         nodes = []
+        found_solution_for_all = True
         for node in self._objects:
             # If object is part of a group, multiply group
             current_node = node
             while current_node.getParent() and current_node.getParent().callDecoration("isGroup"):
                 current_node = current_node.getParent()
 
-            node_too_big = False
             if node.getBoundingBox().width < 300 or node.getBoundingBox().depth < 300:
                 offset_shape_arr, hull_shape_arr = ShapeArray.fromNode(current_node, min_offset=self._min_offset)
+                # Find all spots first, so nodes are only copied for the spots that were found
+                spots = arranger.placeMany(offset_shape_arr, hull_shape_arr, self._count)
             else:
-                node_too_big = True
+                spots = []
+            if len(spots) < self._count:
+                found_solution_for_all = False
 
-            found_solution_for_all = True
-            for i in range(self._count):
-                # We do place the nodes one by one, as we want to yield in between.
-                if not node_too_big:
-                    node, solution_found = arranger.findNodePlacement(current_node, offset_shape_arr, hull_shape_arr)
-                if node_too_big or not solution_found:
-                    found_solution_for_all = False
-                    new_location = node.getPosition()
-                    new_location = new_location.set(z = 100 - i * 20)
-                    node.setPosition(new_location)
+            for x, y in spots:
+                new_node = copy.deepcopy(current_node)
+                # Ensure that the object is above the build platform
+                new_node.removeDecorator(ZOffsetDecorator)
+                if new_node.getBoundingBox():
+                    center_y = new_node.getWorldPosition().y - new_node.getBoundingBox().bottom
+                else:
+                    center_y = 0
+                new_node.setPosition(Vector(x, center_y, y))
+                nodes.append(new_node)
 
-                nodes.append(node)
                 current_progress += 1
                 status_message.setProgress((current_progress / total_progress) * 100)
                 Job.yieldThread()
 
+            current_progress += self._count - len(spots)
+            status_message.setProgress((current_progress / total_progress) * 100)
             Job.yieldThread()
 
         if nodes:
             op = GroupedOperation()
+            print_mode_enabled = Application.getInstance().getGlobalContainerStack().getProperty("print_mode", "enabled")
             for new_node in nodes:
-                print_mode_enabled = Application.getInstance().getGlobalContainerStack().getProperty("print_mode", "enabled")
                 if print_mode_enabled:
                     node_dup = DuplicatedNode(new_node)
                     op.addOperation(AddNodesOperation(node_dup, current_node.getParent()))
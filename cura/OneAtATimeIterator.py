@@ -3,18 +3,29 @@
 
 from UM.Scene.Iterator import Iterator
 from UM.Scene.SceneNode import SceneNode
-from functools import cmp_to_key
 from UM.Application import Application
 
+from cura.PolygonOverlap import PolygonOverlap
+
+import heapq
+import numpy
+import threading
+import weakref
+
 ## Iterator that returns a list of nodes in the order that they need to be printed
 #  If there is no solution an empty list is returned.
 #  Take note that the list of nodes can have children (that may or may not contain mesh data)
 class OneAtATimeIterator(Iterator.Iterator):
+    ##  Hit maps of the last nodes that were ordered, per scene root, see _computeHitMap
+    #   The slicing and the user interface iterate over the same scene, so they share the hit map.
+    _hit_map_caches = weakref.WeakKeyDictionary()  # scene root -> _HitMapCache
+    _hit_map_cache_lock = threading.Lock()  # the slice job runs in its own thread
+
     def __init__(self, scene_node):
         super().__init__(scene_node) # Call super to make multiple inheritence work.
-        self._hit_map = [[]]
+        self._hit_map = numpy.zeros((0, 0), dtype = bool)
         self._original_node_list = []
-    
+
     def _fillStack(self):
         node_list = []
         for node in self._scene_node.getChildren():
@@ -32,80 +43,97 @@ class OneAtATimeIterator(Iterator.Iterator):
         self._original_node_list = node_list[:]
 
         ## Initialise the hit map (pre-compute all hits between all objects)
-        self._hit_map = [[self._checkHit(i,j) for i in node_list] for j in node_list]
+        #  _hit_map[j][i] is True if node i can not be printed before node j, so then j has to be printed first.
+        self._hit_map = self._computeHitMap(node_list)
 
         # Check if we have to files that block eachother. If this is the case, there is no solution!
-        for a in range(0,len(node_list)):
-            for b in range(0,len(node_list)):
-                if a != b and self._hit_map[a][b] and self._hit_map[b][a]:
-                    return 
-
-        # Sort the original list so that items that block the most other objects are at the beginning.
-        # This does not decrease the worst case running time, but should improve it in most cases.
-        sorted(node_list, key = cmp_to_key(self._calculateScore))
-
-        todo_node_list = [_ObjectOrder([], node_list)]
-        while len(todo_node_list) > 0:
-            current = todo_node_list.pop()
-            for node in current.todo:
-                # Check if the object can be placed with what we have and still allows for a solution in the future
-                if not self._checkHitMultiple(node, current.order) and not self._checkBlockMultiple(node, current.todo):
-                    # We found a possible result. Create new todo & order list.
-                    new_todo_list = current.todo[:]
-                    new_todo_list.remove(node)
-                    new_order = current.order[:] + [node]
-                    if len(new_todo_list) == 0: 
-                        # We have no more nodes to check, so quit looking.
-                        todo_node_list = None
-                        self._node_stack = new_order
-
-                        return
-                    todo_node_list.append(_ObjectOrder(new_order, new_todo_list))
-        self._node_stack = [] #No result found!
-
-
-    # Check if first object can be printed before the provided list (using the hit map)
-    def _checkHitMultiple(self, node, other_nodes):
-        node_index = self._original_node_list.index(node)
-        for other_node in other_nodes:
-            other_node_index = self._original_node_list.index(other_node)
-            if self._hit_map[node_index][other_node_index]:
-                return True
-        return False
-
-    def _checkBlockMultiple(self, node, other_nodes):
-        node_index = self._original_node_list.index(node)
-        for other_node in other_nodes:
-            other_node_index = self._original_node_list.index(other_node)
-            if self._hit_map[other_node_index][node_index] and node_index != other_node_index:
-                return True
-        return False
-
-    ##  Calculate score simply sums the number of other objects it 'blocks'
-    def _calculateScore(self, a, b):
-        score_a = sum(self._hit_map[self._original_node_list.index(a)])
-        score_b = sum(self._hit_map[self._original_node_list.index(b)])
-        return score_a - score_b
-
-    #   Checks if A can be printed before B
-    def _checkHit(self, a, b):
-        if a == b:
-            return False
-
-        overlap = a.callDecoration("getConvexHullBoundary").intersectsPolygon(b.callDecoration("getConvexHullHeadFull"))
-        if overlap:
-            return True
-        else: 
-            return False
-
-
-## Internal object used to keep track of a possible order in which to print objects.      
-class _ObjectOrder():
-    def __init__(self, order, todo):
-        """
-        :param order:   List of indexes in which to print objects, ordered by printing order.
-        :param todo:    List of indexes which are not yet inserted into the order list.
-        """
-        self.order = order
-        self.todo = todo
-
+        if numpy.any(self._hit_map & self._hit_map.T):
+            return
+
+        self._node_stack = [node_list[index] for index in self._findOrder(self._hit_map)]
+
+    ##  Return the boolean hit map of the nodes, see _fillStack
+    #   Only the rows and columns of the nodes that changed since the last hit map of the scene are
+    #   computed again, all at once with a separating axis test of the stacked hulls. A head that only
+    #   touches a node hits it, like with Polygon.intersectsPolygon.
+    def _computeHitMap(self, node_list):
+        boundaries = [node.callDecoration("getConvexHullBoundary") for node in node_list]
+        heads = [node.callDecoration("getConvexHullHeadFull") for node in node_list]
+        with self._hit_map_cache_lock:
+            cache = self._hit_map_caches.get(self._scene_node)
+            if cache is None:
+                cache = _HitMapCache()
+                self._hit_map_caches[self._scene_node] = cache
+            return cache.getHitMap(node_list, boundaries, heads)
+
+    ##  Order the nodes so that every node is printed after all nodes that it can not be printed before
+    #   This is a topological sort of the hit map. Of the nodes that can be printed next, the one that
+    #   comes last in the list is taken, which gives the same order as the depth first search that was
+    #   used before. A node that waits for itself (a cycle in the hit map) can never be printed, so then
+    #   there is no solution at all.
+    #   \param hit_map boolean numpy array, see _fillStack
+    #   \return list of indices of the nodes in printing order, empty if there is no solution
+    @staticmethod
+    def _findOrder(hit_map):
+        # Number of nodes that still have to be printed before each node
+        waiting_for = hit_map.sum(axis = 0) - numpy.diagonal(hit_map)
+        available = [-index for index in numpy.nonzero(waiting_for == 0)[0]]
+        heapq.heapify(available)
+
+        order = []
+        while available:
+            index = -heapq.heappop(available)
+            order.append(int(index))
+            released = hit_map[index].copy()
+            released[index] = False
+            released_indices = numpy.nonzero(released)[0]
+            waiting_for[released_indices] -= 1
+            for released_index in released_indices[waiting_for[released_indices] == 0]:
+                heapq.heappush(available, -released_index)
+
+        if len(order) < hit_map.shape[0]:
+            return []  # No result found!
+        return order
+
+
+##  The hit map of a list of nodes, which is updated for the nodes that changed
+#
+#   The convex hull decorators return the same hull objects for as long as a node does not move or
+#   change, so a node whose hulls are the same objects as last time has the same row and column in
+#   the hit map. A moved node gets new hulls and only its row and column are tested again.
+class _HitMapCache:
+    def __init__(self):
+        self._node_indices = {}  # node -> index in the hit map
+        self._boundaries = []
+        self._heads = []
+        self._hit_map = numpy.zeros((0, 0), dtype = bool)
+
+    ##  Return the hit map of the nodes, see OneAtATimeIterator._fillStack
+    #   \param node_list list of SceneNode
+    #   \param boundaries the getConvexHullBoundary of every node
+    #   \param heads the getConvexHullHeadFull of every node
+    def getHitMap(self, node_list, boundaries, heads):
+        count = len(node_list)
+        hit_map = numpy.zeros((count, count), dtype = bool)
+
+        kept = []
+        kept_previous = []
+        for index, node in enumerate(node_list):
+            previous = self._node_indices.get(node)
+            if previous is not None and self._boundaries[previous] is boundaries[index] and self._heads[previous] is heads[index]:
+                kept.append(index)
+                kept_previous.append(previous)
+        hit_map[numpy.ix_(kept, kept)] = self._hit_map[numpy.ix_(kept_previous, kept_previous)]
+
+        changed = numpy.setdiff1d(numpy.arange(count), kept)
+        if len(changed):
+            # _hit_map[j][i] is True if the head around node j hits node i
+            hit_map[changed, :] = PolygonOverlap.overlapMatrix([heads[index] for index in changed], boundaries)
+            hit_map[:, changed] = PolygonOverlap.overlapMatrix(heads, [boundaries[index] for index in changed])
+            numpy.fill_diagonal(hit_map, False)
+
+        self._node_indices = {node: index for index, node in enumerate(node_list)}
+        self._boundaries = boundaries
+        self._heads = heads
+        self._hit_map = hit_map
+        return hit_map
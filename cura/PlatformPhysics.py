@@ -10,11 +10,15 @@ from UM.Math.Vector import Vector
 from UM.Scene.Selection import Selection
 from UM.Preferences import Preferences
 
+from cura.BroadPhaseGrid import BroadPhaseGrid
 from cura.ConvexHullDecorator import ConvexHullDecorator
+from cura.ConvexHullNode import ConvexHullNode
+from cura.PolygonOverlap import PolygonOverlap
 
 from . import PlatformPhysicsOperation
 from . import ZOffsetDecorator
 
+import numpy
 import random  # used for list shuffling
 
 
@@ -34,11 +38,23 @@ class PlatformPhysics:
         self._change_timer.timeout.connect(self._onChangeTimerFinished)
         self._move_factor = 1.1  # By how much should we multiply overlap to calculate a new spot?
         self._max_overlap_checks = 10  # How many times should we try to find a new spot per tick?
+        self._descendants = {}  # node -> set of all its children, filled during a tick
+
+        # Broad phase: only the nodes whose hulls have overlapping bounding boxes can collide, so only those
+        # are checked exactly. The grid is kept up to date with the nodes that changed between ticks.
+        self._grid = BroadPhaseGrid()
+        self._known_nodes = set()  # nodes in the scene at the last tick
+        self._dirty_nodes = set()  # sources of scene changes since the last tick
 
         Preferences.getInstance().addPreference("physics/automatic_push_free", True)
         Preferences.getInstance().addPreference("physics/automatic_drop_down", True)
 
     def _onSceneChanged(self, source):
+        # A new convex hull of a node can make it collide with other nodes.
+        if isinstance(source, ConvexHullNode):
+            source = source.getWatchedNode()
+        if source is not None:
+            self._dirty_nodes.add(source)
         self._change_timer.start()
 
     def _onChangeTimerFinished(self):
@@ -47,17 +63,24 @@ class PlatformPhysics:
 
         root = self._controller.getScene().getRoot()
 
-        # Keep a list of nodes that are moving. We use this so that we don't move two intersecting objects in the
+        # Keep a set of nodes that are moving. We use this so that we don't move two intersecting objects in the
         # same direction.
-        transformed_nodes = []
+        transformed_nodes = set()
 
-        # We try to shuffle all the nodes to prevent "locked" situations, where iteration B inverts iteration A.
-        # By shuffling the order of the nodes, this might happen a few times, but at some point it will resolve.
-        nodes = list(BreadthFirstIterator(root))
+        # Only the nodes that changed since the last tick and the nodes near them can need moving.
+        scene_order, dirty_nodes = self._collectDirtyNodes(root)
+        self._descendants = {}
+        nodes = set(dirty_nodes)
+        for node in dirty_nodes:
+            box = self._grid.getBox(node)
+            if box is not None:
+                nodes.update(self._grid.query(box))
 
         # Only check nodes inside build area.
-        nodes = [node for node in nodes if (hasattr(node, "_outside_buildarea") and not node._outside_buildarea)]
+        nodes = sorted([node for node in nodes if (hasattr(node, "_outside_buildarea") and not node._outside_buildarea)], key = scene_order.get)
 
+        # We try to shuffle all the nodes to prevent "locked" situations, where iteration B inverts iteration A.
+        # By shuffling the order of the nodes, this might happen a few times, but at some point it will resolve.
         random.shuffle(nodes)
         for node in nodes:
             if node is root or type(node) is not SceneNode or node.getBoundingBox() is None:
@@ -76,68 +99,129 @@ class PlatformPhysics:
                 node.addDecorator(ConvexHullDecorator())
 
             if Preferences.getInstance().getValue("physics/automatic_push_free"):
-                # Check for collisions between convex hulls
-                for other_node in BreadthFirstIterator(root):
-                    # Ignore root, ourselves and anything that is not a normal SceneNode.
-                    if other_node is root or type(other_node) is not SceneNode or other_node is node:
-                        continue
-                    
-                    # Ignore collisions of a group with it's own children
-                    if other_node in node.getAllChildren() or node in other_node.getAllChildren():
-                        continue
-                    
-                    # Ignore collisions within a group
-                    if other_node.getParent() and node.getParent() and (other_node.getParent().callDecoration("isGroup") is not None or node.getParent().callDecoration("isGroup") is not None):
-                        continue
-                    
-                    # Ignore nodes that do not have the right properties set.
-                    if not other_node.callDecoration("getConvexHull") or not other_node.getBoundingBox():
-                        continue
-
-                    if other_node in transformed_nodes:
-                        continue  # Other node is already moving, wait for next pass.
-
-                    overlap = (0, 0)  # Start loop with no overlap
-                    current_overlap_checks = 0
-                    # Continue to check the overlap until we no longer find one.
-                    while overlap and current_overlap_checks < self._max_overlap_checks:
-                        current_overlap_checks += 1
-                        head_hull = node.callDecoration("getConvexHullHead")
-                        if head_hull:  # One at a time intersection.
-                            overlap = head_hull.translate(move_vector.x, move_vector.z).intersectsPolygon(other_node.callDecoration("getConvexHull"))
-                            if not overlap:
-                                other_head_hull = other_node.callDecoration("getConvexHullHead")
-                                if other_head_hull:
-                                    overlap = node.callDecoration("getConvexHull").translate(move_vector.x, move_vector.z).intersectsPolygon(other_head_hull)
-                                    if overlap:
-                                        # Moving ensured that overlap was still there. Try anew!
-                                        move_vector = move_vector.set(x=move_vector.x + overlap[0] * self._move_factor,
-                                                                      z=move_vector.z + overlap[1] * self._move_factor)
-                            else:
-                                # Moving ensured that overlap was still there. Try anew!
-                                move_vector = move_vector.set(x=move_vector.x + overlap[0] * self._move_factor,
-                                                              z=move_vector.z + overlap[1] * self._move_factor)
-                        else:
-                            own_convex_hull = node.callDecoration("getConvexHull")
-                            other_convex_hull = other_node.callDecoration("getConvexHull")
-                            if own_convex_hull and other_convex_hull:
-                                overlap = own_convex_hull.translate(move_vector.x, move_vector.z).intersectsPolygon(other_convex_hull)
-                                if overlap:  # Moving ensured that overlap was still there. Try anew!
-                                    move_vector = move_vector.set(x=move_vector.x + overlap[0] * self._move_factor,
-                                                                  z=move_vector.z + overlap[1] * self._move_factor)
-                            else:
-                                # This can happen in some cases if the object is not yet done with being loaded.
-                                #  Simply waiting for the next tick seems to resolve this correctly.
-                                overlap = None
+                own_box = BroadPhaseGrid.boxOfPolygons(node.callDecoration("getConvexHull"), node.callDecoration("getConvexHullHead"))
+                checked_nodes = {node}
+                # Moving the node can bring it near other nodes, so look for new candidates after every round.
+                while own_box is not None:
+                    moved_box = (own_box[0] + move_vector.x, own_box[1] + move_vector.z, own_box[2] + move_vector.x, own_box[3] + move_vector.z)
+                    candidates = sorted(self._grid.query(moved_box) - checked_nodes, key = scene_order.get)
+                    if not candidates:
+                        break
+                    checked_nodes.update(candidates)
+
+                    other_nodes = []
+                    for other_node in candidates:
+                        # Ignore collisions of a group with it's own children
+                        if other_node in self._getDescendants(node) or node in self._getDescendants(other_node):
+                            continue
+
+                        # Ignore collisions within a group
+                        if other_node.getParent() and node.getParent() and (other_node.getParent().callDecoration("isGroup") is not None or node.getParent().callDecoration("isGroup") is not None):
+                            continue
+
+                        if other_node in transformed_nodes:
+                            continue  # Other node is already moving, wait for next pass.
+
+                        other_nodes.append(other_node)
+
+                    if other_nodes:
+                        move_vector = self._pushFree(node, other_nodes, move_vector)
 
             if not Vector.Null.equals(move_vector, epsilon=1e-5):
-                transformed_nodes.append(node)
+                transformed_nodes.add(node)
                 op = PlatformPhysicsOperation.PlatformPhysicsOperation(node, move_vector)
                 op.push()
+                self._updateGrid(node)
 
         # After moving, we have to evaluate the boundary checks for nodes
         build_volume = Application.getInstance().getBuildVolume()
-        build_volume.updateNodeBoundaryCheck()
+        build_volume.updateNodeBoundaryCheck(dirty_nodes | set(nodes))
+
+    ##  Find the nodes that changed since the last tick and bring the grid up to date with them
+    #   Nodes that are new in the scene count as changed, and so do the nodes in a changed group and the
+    #   groups around a changed node.
+    #   \return (scene order, changed nodes) where scene order maps every node to its position in the scene
+    def _collectDirtyNodes(self, root):
+        scene_order = {}
+        for index, node in enumerate(BreadthFirstIterator(root)):
+            # Ignore root and anything that is not a normal SceneNode.
+            if node is root or type(node) is not SceneNode:
+                continue
+            scene_order[node] = index
+
+        dirty_nodes = {node for node in self._dirty_nodes if node in scene_order}
+        dirty_nodes.update(node for node in scene_order if node not in self._known_nodes)
+        for node in list(dirty_nodes):
+            dirty_nodes.update(child for child in node.getAllChildren() if child in scene_order)
+            parent = node.getParent()
+            while parent in scene_order:
+                dirty_nodes.add(parent)
+                parent = parent.getParent()
+
+        for node in self._known_nodes:
+            if node not in scene_order:
+                self._grid.remove(node)
+        for node in dirty_nodes:
+            self._updateGrid(node)
+
+        self._dirty_nodes = set()
+        self._known_nodes = set(scene_order)
+        return scene_order, dirty_nodes
+
+    ##  Put the hulls of a node in the grid, or remove the node if other nodes can not collide with it
+    def _updateGrid(self, node):
+        # Ignore nodes that do not have the right properties set.
+        convex_hull = node.callDecoration("getConvexHull")
+        box = None
+        if convex_hull and node.getBoundingBox():
+            box = BroadPhaseGrid.boxOfPolygons(convex_hull, node.callDecoration("getConvexHullHead"))
+        if box is not None:
+            self._grid.insert(node, box)
+        else:
+            self._grid.remove(node)
+
+    def _getDescendants(self, node):
+        if node not in self._descendants:
+            self._descendants[node] = set(node.getAllChildren())
+        return self._descendants[node]
+
+    ##  Push the node away from the other nodes until their hulls no longer overlap
+    #   The overlaps with all other nodes are computed at once, and every round the node is pushed
+    #   away from all nodes it still overlaps.
+    #   \param move_vector Vector by which the node is moved already
+    #   \return Vector by which the node should be moved
+    def _pushFree(self, node, other_nodes, move_vector):
+        own_convex_hull = node.callDecoration("getConvexHull")
+        if not own_convex_hull:
+            # This can happen in some cases if the object is not yet done with being loaded.
+            #  Simply waiting for the next tick seems to resolve this correctly.
+            return move_vector
+
+        head_hull = node.callDecoration("getConvexHullHead")
+        other_convex_hulls = [other_node.callDecoration("getConvexHull") for other_node in other_nodes]
+        if head_hull:  # One at a time intersection.
+            other_head_hulls = [other_node.callDecoration("getConvexHullHead") for other_node in other_nodes]
+
+        for _ in range(self._max_overlap_checks):
+            offset = (move_vector.x, move_vector.z)
+            if head_hull:
+                overlaps = PolygonOverlap.minimumTranslationVectors([head_hull] * len(other_nodes), other_convex_hulls, offset)
+                # Where our head does not hit the other node, its head can still hit us.
+                missing = numpy.isnan(overlaps[:, 0])
+                if numpy.any(missing):
+                    overlaps[missing] = PolygonOverlap.minimumTranslationVectors(
+                        [own_convex_hull] * int(numpy.count_nonzero(missing)),
+                        [other_head_hull for other_head_hull, is_missing in zip(other_head_hulls, missing) if is_missing], offset)
+            else:
+                overlaps = PolygonOverlap.minimumTranslationVectors([own_convex_hull] * len(other_nodes), other_convex_hulls, offset)
+
+            colliding = ~numpy.isnan(overlaps[:, 0])
+            if not numpy.any(colliding):
+                break
+            # Moving ensured that overlap was still there. Try anew!
+            push = overlaps[colliding].sum(axis = 0) * self._move_factor
+            move_vector = move_vector.set(x = move_vector.x + push[0], z = move_vector.z + push[1])
+        return move_vector
 
     def _onToolOperationStarted(self, tool):
         self._enabled = False
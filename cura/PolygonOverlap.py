@@ -0,0 +1,112 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import numpy
+
+
+##  Separating axis test for many pairs of convex polygons at once.
+#
+#   The polygons are stacked in one array, padded to the same number of points by repeating their
+#   last point. The padding only adds edges of length zero, which are not used as axes, and points
+#   that are already in the polygon, which do not change any projection.
+class PolygonOverlap:
+    _chunk_elements = 2 ** 22  # maximum number of projected points per chunk of overlapMatrix
+
+    ##  Stack polygons in one array
+    #   \param polygons list of Polygon, None or polygons with less than 2 points never overlap
+    #   \return (points, counts) with points a float64 array (count, max points, 2)
+    @staticmethod
+    def stack(polygons):
+        point_lists = [polygon.getPoints() if polygon is not None else numpy.zeros((0, 2)) for polygon in polygons]
+        counts = numpy.array([len(points) for points in point_lists], dtype = numpy.int64)
+        size = max(2, int(counts.max())) if len(counts) else 2
+        stacked = numpy.zeros((len(point_lists), size, 2), dtype = numpy.float64)
+        for index, points in enumerate(point_lists):
+            if len(points) == 0:
+                continue
+            stacked[index, :len(points)] = points
+            stacked[index, len(points):] = points[-1]
+        return stacked, counts
+
+    ##  Return the minimum translation vectors for pairs of convex polygons
+    #   This gives the same results as Polygon.intersectsPolygon of Uranium, including its rules at the
+    #   boundary: polygons that only touch do overlap, and the vector is 0.1 longer than the overlap
+    #   along the axis of the smallest overlap.
+    #   \param first list of Polygon
+    #   \param second list of Polygon, as long as first
+    #   \param offset (x, y) or array (pairs, 2) added to the points of the first polygons
+    #   \return float64 array (pairs, 2), NaN for the pairs that do not overlap
+    @classmethod
+    def minimumTranslationVectors(cls, first, second, offset = None):
+        first_points, first_counts = cls.stack(first)
+        second_points, second_counts = cls.stack(second)
+        if offset is not None:
+            offset = numpy.asarray(offset, dtype = numpy.float64).reshape(-1, 1, 2)
+            first_points = first_points + offset
+        return cls._minimumTranslationVectors(first_points, first_counts, second_points, second_counts)
+
+    ##  Return for every combination of a first and a second convex polygon whether they overlap
+    #   Only the pairs with overlapping bounding boxes are tested, in chunks to limit the memory use.
+    #   \param first list of Polygon
+    #   \param second list of Polygon
+    #   \return boolean array (len(first), len(second))
+    @classmethod
+    def overlapMatrix(cls, first, second):
+        result = numpy.zeros((len(first), len(second)), dtype = bool)
+        if not first or not second:
+            return result
+        first_points, first_counts = cls.stack(first)
+        second_points, second_counts = cls.stack(second)
+
+        # Polygons whose bounding boxes only touch can still overlap
+        first_min, first_max = first_points.min(axis = 1), first_points.max(axis = 1)
+        second_min, second_max = second_points.min(axis = 1), second_points.max(axis = 1)
+        candidates = numpy.all((first_min[:, numpy.newaxis] <= second_max[numpy.newaxis]) & (second_min[numpy.newaxis] <= first_max[:, numpy.newaxis]), axis = 2)
+        first_indices, second_indices = numpy.nonzero(candidates)
+
+        pair_size = (first_points.shape[1] + second_points.shape[1]) * max(first_points.shape[1], second_points.shape[1])
+        chunk_size = max(1, cls._chunk_elements // pair_size)
+        for start in range(0, len(first_indices), chunk_size):
+            first_chunk = first_indices[start:start + chunk_size]
+            second_chunk = second_indices[start:start + chunk_size]
+            vectors = cls._minimumTranslationVectors(first_points[first_chunk], first_counts[first_chunk], second_points[second_chunk], second_counts[second_chunk])
+            result[first_chunk, second_chunk] = ~numpy.isnan(vectors[:, 0])
+        return result
+
+    ##  minimumTranslationVectors on stacked polygons, see stack
+    #   The axes are tried in the order of Polygon.intersectsPolygon: first the edges of the first
+    #   polygon, then those of the second one. The first axis with the smallest overlap wins.
+    @classmethod
+    def _minimumTranslationVectors(cls, first_points, first_counts, second_points, second_counts):
+        axes = numpy.concatenate((cls._edgeNormals(first_points), cls._edgeNormals(second_points)), axis = 1)
+        valid_axes = numpy.any(axes != 0, axis = 2)
+        # The vector moves along the normals of the first polygon, and against those of the second one.
+        directions = numpy.concatenate((numpy.ones(first_points.shape[1]), -numpy.ones(second_points.shape[1])))
+
+        first_projection = numpy.einsum("pad,pmd->pam", axes, first_points)
+        second_projection = numpy.einsum("pad,pmd->pam", axes, second_points)
+        first_min, first_max = first_projection.min(axis = 2), first_projection.max(axis = 2)
+        second_min, second_max = second_projection.min(axis = 2), second_projection.max(axis = 2)
+
+        separated = numpy.any(valid_axes & ((first_min > second_max) | (second_min > first_max)), axis = 1)
+
+        # This is the overlap as Polygon.intersectsPolygon measures it, which is not always the
+        # real overlap: it takes the maximum of the second polygon, never of the first.
+        size = numpy.where(valid_axes, second_max - numpy.maximum(first_min, second_min), numpy.inf)
+        best_axis = numpy.argmin(size, axis = 1)
+        pairs = numpy.arange(len(best_axis))
+        best_size = size[pairs, best_axis]
+        vectors = axes[pairs, best_axis] * (directions[best_axis] * (best_size + 0.1))[:, numpy.newaxis]
+
+        overlaps = ~separated & (first_counts >= 2) & (second_counts >= 2) & (best_size < 10000000.0)
+        vectors[~overlaps] = numpy.nan
+        return vectors
+
+    ##  Unit normals of the edges of stacked polygons, zero for the edges of length zero
+    #   The normal of the edge from point n - 1 to point n is (dy, -dx), like in Polygon.intersectsPolygon.
+    @staticmethod
+    def _edgeNormals(points):
+        edges = points - numpy.roll(points, 1, axis = 1)
+        normals = numpy.stack((edges[:, :, 1], -edges[:, :, 0]), axis = 2)
+        lengths = numpy.linalg.norm(normals, axis = 2, keepdims = True)
+        return numpy.divide(normals, lengths, out = numpy.zeros_like(normals), where = lengths > 1e-9)
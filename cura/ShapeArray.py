@@ -1,5 +1,8 @@
 import numpy
 import copy
+import threading
+import weakref
+from collections import OrderedDict
 
 from UM.Math.Polygon import Polygon
 from UM.Preferences import Preferences
@@ -7,6 +10,13 @@ from UM.Preferences import Preferences
 
 ##  Polygon representation as an array for use with Arrange
 class ShapeArray:
+    ##  Cache for fromNode: key -> (offset_shape_arr, hull_shape_arr), least recently used first
+    #   Nodes with the same hull (relative to their position) share the same ShapeArrays.
+    _node_cache = OrderedDict()
+    _node_cache_size = 128
+    _node_cache_keys = weakref.WeakKeyDictionary()  # node -> keys of the ShapeArrays of that node
+    _node_cache_lock = threading.Lock()  # arrange jobs run in their own thread
+
     def __init__(self, arr, offset_x, offset_y, scale = 1):
         self.arr = arr
         self.offset_x = offset_x
@@ -38,12 +48,15 @@ class ShapeArray:
     #   \param node source node where the convex hull must be present
     #   \param min_offset offset for the offset ShapeArray
     #   \param scale scale the coordinates
+    #   \param angle rotate the shapes around the position of the node (around the Y axis), in radians.
+    #   When printing one at a time, only the node is rotated and not the head around it.
     @classmethod
-    def fromNode(cls, node, min_offset, scale = 1):
+    def fromNode(cls, node, min_offset, scale = 1, angle = 0):
         transform = node._transformation
         transform_x = transform._data[0][3]
         transform_y = transform._data[2][3]
 
+        shape_angle = angle
         arrange_align = Preferences.getInstance().getValue("mesh/arrange_align")
         if arrange_align:
             bb = node.getBoundingBox()
@@ -53,6 +66,12 @@ class ShapeArray:
             hull_verts = node.callDecoration("getConvexHull")
             # For one_at_a_time printing you need the convex hull head.
             polygon = node.callDecoration("getConvexHullHead") or hull_verts
+            if angle and polygon is not hull_verts:
+                # The head does not turn with the node, so only turn the hull of the node itself.
+                boundary_points = node.callDecoration("getConvexHullBoundary").getPoints() - [transform_x, transform_y]
+                boundary_points = cls.rotatePoints(boundary_points, angle) + [transform_x, transform_y]
+                polygon = node.callDecoration("addConvexHullHead", Polygon(numpy.array(boundary_points, numpy.float32)))
+                shape_angle = 0  # Turned already.
 
         # offset_verts2 = hull_head_verts2.getMinkowskiHull(Polygon.approximatedCircle(min_offset))
         # offset_points2 = copy.deepcopy(offset_verts2._points)  # x, y
@@ -65,68 +84,177 @@ class ShapeArray:
         # hull_points2[:, 1] = numpy.add(hull_points2[:, 1], -transform_y)
         # hull_shape_arr2 = ShapeArray.fromPolygon(hull_points2, scale = scale)  # x, y
 
+        hull_points = copy.deepcopy(polygon._points)
+        hull_points[:, 0] = numpy.add(hull_points[:, 0], -transform_x)
+        hull_points[:, 1] = numpy.add(hull_points[:, 1], -transform_y)
+
+        # Positions are in mm and the arrays have cells of 1 mm, so rounding the key hardly matters
+        # but lets identical parts share their ShapeArrays despite rounding errors in the translation.
+        key = (numpy.round(hull_points, 3).tobytes(), hull_points.shape, min_offset, scale, bool(arrange_align), angle)
+        with cls._node_cache_lock:
+            cls._node_cache_keys.setdefault(node, set()).add(key)
+            if key in cls._node_cache:
+                cls._node_cache.move_to_end(key)
+                return cls._node_cache[key]
+
         offset_verts = polygon.getMinkowskiHull(Polygon.approximatedCircle(min_offset))
         offset_points = copy.deepcopy(offset_verts._points)  # x, y
         offset_points[:, 0] = numpy.add(offset_points[:, 0], -transform_x)
         offset_points[:, 1] = numpy.add(offset_points[:, 1], -transform_y)
+        if shape_angle:
+            offset_points = cls.rotatePoints(offset_points, shape_angle)
         offset_shape_arr = ShapeArray.fromPolygon(offset_points, scale=scale)
 
-        hull_points = copy.deepcopy(polygon._points)
-        hull_points[:, 0] = numpy.add(hull_points[:, 0], -transform_x)
-        hull_points[:, 1] = numpy.add(hull_points[:, 1], -transform_y)
+        if shape_angle:
+            hull_points = cls.rotatePoints(hull_points, shape_angle)
         hull_shape_arr = ShapeArray.fromPolygon(hull_points, scale=scale)
 
+        with cls._node_cache_lock:
+            cls._node_cache[key] = (offset_shape_arr, hull_shape_arr)
+            if len(cls._node_cache) > cls._node_cache_size:
+                cls._node_cache.popitem(last=False)
         return offset_shape_arr, hull_shape_arr
 
+    ##  Forget the cached ShapeArrays of a node, for example because its convex hull changed
+    #   \param node scene node that was passed to fromNode before
+    @classmethod
+    def invalidateNode(cls, node):
+        if node is None:  # Decorators that are not on a node yet
+            return
+        with cls._node_cache_lock:
+            for key in cls._node_cache_keys.pop(node, ()):
+                cls._node_cache.pop(key, None)
+
+    ##  Rasterize a number of polygons into one grid, with the cells of Arrange
+    #   Cell (row, column) of the grid is the cell that Arrange.place(0, 0, ...) marks in a grid with
+    #   the same offsets, parts of polygons outside the grid are left out.
+    #   \param polygons list of numpy arrays with the (x, y) vertices of the polygons
+    #   \param shape (rows, columns) of the grid
+    #   \param offset_x, offset_y offsets of the grid, see Arrange
+    #   \return boolean numpy array with the given shape, True where a polygon covers the cell
+    @classmethod
+    def rasterize(cls, polygons, shape, offset_x, offset_y, scale = 1):
+        grid = numpy.zeros(shape, dtype=bool)
+        for vertices in polygons:
+            shape_arr = cls.fromPolygon(vertices, scale = scale)
+            top = offset_y + shape_arr.offset_y
+            left = offset_x + shape_arr.offset_x
+            y0, y1 = max(top, 0), min(top + shape_arr.arr.shape[0], shape[0])
+            x0, x1 = max(left, 0), min(left + shape_arr.arr.shape[1], shape[1])
+            if y0 < y1 and x0 < x1:
+                grid[y0:y1, x0:x1] |= shape_arr.arr[y0 - top:y1 - top, x0 - left:x1 - left] == 1
+        return grid
+
+    ##  Rotate (x, z) points around the origin, the same way as rotating a scene node around the Y axis
+    #   \param points numpy array of (x, z) points
+    #   \param angle in radians
+    @staticmethod
+    def rotatePoints(points, angle):
+        cos_angle = numpy.cos(angle)
+        sin_angle = numpy.sin(angle)
+        rotated = numpy.empty(points.shape, dtype=numpy.float64)
+        rotated[:, 0] = cos_angle * points[:, 0] + sin_angle * points[:, 1]
+        rotated[:, 1] = -sin_angle * points[:, 0] + cos_angle * points[:, 1]
+        return rotated
+
     ##  Create np.array with dimensions defined by shape
     #   Fills polygon defined by vertices with ones, all other values zero
-    #   Only works correctly for convex hull vertices
-    #   Originally from: http://stackoverflow.com/questions/37117878/generating-a-filled-polygon-inside-a-numpy-array
+    #   Convex polygons are filled row by row using the column range between the edges, which gives
+    #   the same result as intersecting the half planes of all edges. Other polygons are filled with
+    #   an even-odd scanline fill.
     #   \param shape  numpy format shape, [x-size, y-size]
     #   \param vertices
+    #   \return uint8 array, 1 inside the polygon
     @classmethod
     def arrayFromPolygon(cls, shape, vertices):
-        base_array = numpy.zeros(shape, dtype=float)  # Initialize your array of zeros
-
-        fill = numpy.ones(base_array.shape) * True  # Initialize boolean array defining shape fill
-
-        # Create check array for each edge segment, combine into fill array
-        for k in range(vertices.shape[0]):
-            fill = numpy.all([fill, cls._check(vertices[k - 1], vertices[k], base_array)], axis=0)
-
-        # Set all values inside polygon to one
-        base_array[fill] = 1
-
-        return base_array
+        vertices = numpy.asarray(vertices, dtype=float)
+        # Drop edges of zero length, they do not bound anything
+        vertices = vertices[numpy.any(vertices != numpy.roll(vertices, 1, axis=0), axis=1)]
+        if vertices.shape[0] < 2:
+            return numpy.zeros(shape, dtype=numpy.uint8)
+        if cls._isConvex(vertices):
+            fill = cls._fillConvex(shape, vertices)
+        else:
+            fill = cls._fillScanline(shape, vertices)
+        return fill.astype(numpy.uint8)
 
-    ##  Return indices that mark one side of the line, used by arrayFromPolygon
-    #   Uses the line defined by p1 and p2 to check array of
-    #   input indices against interpolated value
-    #   Returns boolean array, with True inside and False outside of shape
-    #   Originally from: http://stackoverflow.com/questions/37117878/generating-a-filled-polygon-inside-a-numpy-array
-    #   \param p1 2-tuple with x, y for point 1
-    #   \param p2 2-tuple with x, y for point 2
-    #   \param base_array boolean array to project the line on
+    ##  Return whether the vertices make a convex polygon (in either orientation)
+    #   All turns must go the same way, and together they must make exactly one full turn. A polygon
+    #   that crosses itself, like a pentagram, turns the same way at every vertex but more than once.
     @classmethod
-    def _check(cls, p1, p2, base_array):
-        if p1[0] == p2[0] and p1[1] == p2[1]:
-            return
-        idxs = numpy.indices(base_array.shape)  # Create 3D array of indices
+    def _isConvex(cls, vertices):
+        if vertices.shape[0] < 3:
+            return True
+        edges = vertices - numpy.roll(vertices, 1, axis=0)
+        next_edges = numpy.roll(edges, -1, axis=0)
+        cross = edges[:, 0] * next_edges[:, 1] - edges[:, 1] * next_edges[:, 0]
+        if numpy.any(cross > 0) and numpy.any(cross < 0):
+            return False
+        dot = edges[:, 0] * next_edges[:, 0] + edges[:, 1] * next_edges[:, 1]
+        turning = numpy.sum(numpy.arctan2(cross, dot))
+        return abs(abs(turning) - 2 * numpy.pi) < 1e-6
 
-        p1 = p1.astype(float)
-        p2 = p2.astype(float)
+    ##  Fill a convex polygon: for each row, the polygon spans the columns between its left and right edges
+    #   Edges that go "down" (increasing row index) bound the columns on the right, edges that go "up" on
+    #   the left. Axis aligned edges do not bound anything, but exclude the first column, like the
+    #   half plane test of arrayFromPolygon used to.
+    @classmethod
+    def _fillConvex(cls, shape, vertices):
+        rows = numpy.arange(shape[0], dtype=float)
+        columns = numpy.arange(shape[1])
+        p1 = numpy.roll(vertices, 1, axis=0)
+        p2 = vertices
 
-        if p2[0] == p1[0]:
-            sign = numpy.sign(p2[1] - p1[1])
-            return idxs[1] * sign
+        row_delta = p2[:, 0] - p1[:, 0]
+        column_delta = p2[:, 1] - p1[:, 1]
+        sloped = (row_delta != 0) & (column_delta != 0)
+        down = sloped & (row_delta > 0)
+        up = sloped & (row_delta < 0)
 
-        if p2[1] == p1[1]:
-            sign = numpy.sign(p2[0] - p1[0])
-            return idxs[1] * sign
+        max_column = numpy.full(shape[0], numpy.inf)
+        if numpy.any(down):
+            max_column = numpy.amin((rows[numpy.newaxis, :] - p1[down, 0:1]) / row_delta[down, numpy.newaxis] * column_delta[down, numpy.newaxis] + p1[down, 1:2], axis=0)
+        min_column = numpy.full(shape[0], -numpy.inf)
+        if numpy.any(up):
+            min_column = numpy.amax((rows[numpy.newaxis, :] - p1[up, 0:1]) / row_delta[up, numpy.newaxis] * column_delta[up, numpy.newaxis] + p1[up, 1:2], axis=0)
 
-        # Calculate max column idx for each row idx based on interpolated line between two points
+        fill = (columns[numpy.newaxis, :] <= max_column[:, numpy.newaxis]) & (columns[numpy.newaxis, :] >= min_column[:, numpy.newaxis])
+        if numpy.any(~sloped):
+            fill[:, 0] = False
+        return fill
 
-        max_col_idx = (idxs[0] - p1[0]) / (p2[0] - p1[0]) * (p2[1] - p1[1]) + p1[1]
-        sign = numpy.sign(p2[0] - p1[0])
-        return idxs[1] * sign <= max_col_idx * sign
+    ##  Fill any simple polygon with the even-odd rule, sampling the cells at their integer coordinates
+    #   For every row, the crossings with the edges are sorted and the columns between each pair of
+    #   crossings are filled.
+    @classmethod
+    def _fillScanline(cls, shape, vertices):
+        fill = numpy.zeros(shape, dtype=bool)
+        if shape[0] <= 0 or shape[1] <= 0 or vertices.shape[0] < 3:
+            return fill
+        rows = numpy.arange(shape[0], dtype=float)
+        p1 = numpy.roll(vertices, 1, axis=0)
+        p2 = vertices
+        low = numpy.minimum(p1[:, 0], p2[:, 0])
+        high = numpy.maximum(p1[:, 0], p2[:, 0])
+        row_delta = p2[:, 0] - p1[:, 0]
+        with numpy.errstate(divide = "ignore", invalid = "ignore"):
+            crossings = (rows[numpy.newaxis, :] - p1[:, 0:1]) / row_delta[:, numpy.newaxis] * (p2[:, 1:2] - p1[:, 1:2]) + p1[:, 1:2]
+        # Half open on the rows, so a vertex that is shared by two edges is only counted once.
+        crosses = (rows[numpy.newaxis, :] >= low[:, numpy.newaxis]) & (rows[numpy.newaxis, :] < high[:, numpy.newaxis])
+        crossings = numpy.where(crosses, crossings, numpy.inf)
+        crossings.sort(axis=0)
 
+        # Every pair of crossings fills the columns in between. Mark the start and end of each span
+        # in a difference array, the cumulative sum is then positive inside the polygon.
+        spans = numpy.zeros((shape[0], shape[1] + 1), dtype=numpy.int32)
+        for pair in range(0, crossings.shape[0] - 1, 2):
+            starts = crossings[pair]
+            ends = crossings[pair + 1]
+            in_row = numpy.isfinite(ends)
+            first = numpy.clip(numpy.ceil(starts[in_row]), 0, shape[1]).astype(numpy.int64)
+            last = numpy.clip(numpy.floor(ends[in_row]) + 1, 0, shape[1]).astype(numpy.int64)
+            row_idx = numpy.nonzero(in_row)[0]
+            numpy.add.at(spans, (row_idx, first), 1)
+            numpy.add.at(spans, (row_idx, last), -1)
+        fill[:] = numpy.cumsum(spans, axis=1)[:, :-1] > 0
+        return fill
@@ -19,6 +19,8 @@ from PyQt5.QtCore import QObject, pyqtSlot
 from cura.Settings.ExtruderManager import ExtruderManager
 from . import ProcessSlicedLayersJob
 from . import StartSliceJob
+from .SettingsMessageCache import SettingsMessageCache
+from .SliceResultCache import SliceResult, SliceResultCache
 
 import os
 import sys
@@ -65,6 +67,7 @@ class CuraEngineBackend(QObject, Backend):
 
         default_engine_location = os.path.abspath(default_engine_location)
         Preferences.getInstance().addPreference("backend/location", default_engine_location)
+        Preferences.getInstance().addPreference("backend/slice_result_cache_size", 256)  # In MiB.
 
         # Workaround to disable layer view processing if layer view is not active.
         self._layer_view_active = False
@@ -85,6 +88,7 @@ class CuraEngineBackend(QObject, Backend):
         #  and only wait for the error check to be finished to start the auto-slicing timer again.
         #
         self._global_container_stack = None
+        self._settings_cache = SettingsMessageCache()  # Settings of the stacks as they were sent for the previous slice.
         Application.getInstance().globalContainerStackChanged.connect(self._onGlobalStackChanged)
         self._onGlobalStackChanged()
 
@@ -111,6 +115,9 @@ class CuraEngineBackend(QObject, Backend):
         self._process_layers_job = None  # The currently active job to process layers, or None if it is not processing layers.
         self._need_slicing = False
         self._engine_is_fresh = True  # Is the newly started engine used before or not?
+        # Results of previous slices, to show them again without slicing when the same slice message comes up.
+        self._slice_result_cache = SliceResultCache(self._getSliceResultCacheSize())
+        self._slice_result = None  # SliceResult of the slice that the engine is working on.
 
         self._backend_log_max_lines = 20000  # Maximum number of lines to buffer
         self._error_message = None  # Pop-up message that shows errors.
@@ -212,6 +219,7 @@ class CuraEngineBackend(QObject, Backend):
 
         self._stored_layer_data = []
         self._stored_optimized_layer_data = []
+        self._slice_result = None
 
         if self._process is None:
             self._createSocket()
@@ -226,7 +234,7 @@ class CuraEngineBackend(QObject, Backend):
         self.slicingStarted.emit()
 
         slice_message = self._socket.createMessage("cura.proto.Slice")
-        self._start_slice_job = StartSliceJob.StartSliceJob(slice_message)
+        self._start_slice_job = StartSliceJob.StartSliceJob(slice_message, self._settings_cache)
         self._start_slice_job.start()
         self._start_slice_job.finished.connect(self._onStartSliceCompleted)
 
@@ -236,8 +244,13 @@ class CuraEngineBackend(QObject, Backend):
         self._slicing = False
         self._stored_layer_data = []
         self._stored_optimized_layer_data = []
+        self._slice_result = None
         if self._start_slice_job is not None:
             self._start_slice_job.cancel()
+        if self._process_layers_job is not None and self._process_layers_job.isWaitingForLayers():
+            # The rest of the layers is not going to come anymore.
+            self._process_layers_job.abort()
+            self._process_layers_job = None
 
         self.slicingCancelled.emit()
         self.processingProgress.emit(0)
@@ -328,6 +341,16 @@ class CuraEngineBackend(QObject, Backend):
             else:
                 self.backendStateChange.emit(BackendState.NotStarted)
             return
+
+        # The same slice message gives the same result, so show that again if we still have it.
+        slice_message_hash = job.getSliceMessageHash()
+        slice_result = self._slice_result_cache.get(slice_message_hash)
+        if slice_result is not None:
+            Logger.log("d", "Reusing the result of an earlier slice, slice result cache: %s", self._slice_result_cache.getStatistics())
+            self._restoreSliceResult(slice_result)
+            return
+        self._slice_result = SliceResult(slice_message_hash)
+
         # Preparation completed, send it to the backend.
         self._socket.sendMessage(job.getSliceMessage())
 
@@ -465,6 +488,19 @@ class CuraEngineBackend(QObject, Backend):
     #   \param message The protobuf message containing sliced layer data.
     def _onOptimizedLayerMessage(self, message):
         self._stored_optimized_layer_data.append(message)
+        if self._slice_result is not None:
+            self._slice_result.addOptimizedLayer(message)
+
+        # Process the layers while the engine is still slicing, so the layer view fills in as they come.
+        if self._layer_view_active:
+            if self._process_layers_job is None:
+                self._process_layers_job = ProcessSlicedLayersJob.ProcessSlicedLayersJob(self._stored_optimized_layer_data, streaming = True)
+                self._process_layers_job.finished.connect(self._onProcessLayersFinished)
+                self._process_layers_job.start()
+                self._stored_optimized_layer_data = []
+            elif self._process_layers_job.isWaitingForLayers():
+                self._process_layers_job.addLayers(self._stored_optimized_layer_data)
+                self._stored_optimized_layer_data = []
 
     ##  Called when a progress message is received from the engine.
     #
@@ -477,6 +513,15 @@ class CuraEngineBackend(QObject, Backend):
     #
     #   \param message The protobuf message signalling that slicing is finished.
     def _onSlicingFinishedMessage(self, message):
+        if self._slice_result is not None:
+            self._slice_result.setGCodeList(self._scene.gcode_list)
+            self._slice_result_cache.put(self._slice_result)
+            self._slice_result = None
+
+        self._finishSlicing()
+
+    ##  Show the g-code and the layers of the slice that just finished, from the engine or from the cache.
+    def _finishSlicing(self):
         self.backendStateChange.emit(BackendState.Done)
         self.processingProgress.emit(1.0)
 
@@ -492,7 +537,11 @@ class CuraEngineBackend(QObject, Backend):
         self._slicing = False
         self._need_slicing = False
         Logger.log("d", "Slicing took %s seconds", time() - self._slice_start_time )
-        if self._layer_view_active and (self._process_layers_job is None or not self._process_layers_job.isRunning()):
+        if self._process_layers_job is not None and self._process_layers_job.isWaitingForLayers():
+            self._process_layers_job.addLayers(self._stored_optimized_layer_data)
+            self._process_layers_job.finishLayers()
+            self._stored_optimized_layer_data = []
+        elif self._layer_view_active and (self._process_layers_job is None or not self._process_layers_job.isRunning()):
             self._process_layers_job = ProcessSlicedLayersJob.ProcessSlicedLayersJob(self._stored_optimized_layer_data)
             self._process_layers_job.finished.connect(self._onProcessLayersFinished)
             self._process_layers_job.start()
@@ -532,8 +581,35 @@ class CuraEngineBackend(QObject, Backend):
             "retract": message.time_retract,
             "support_interface": message.time_support_interface
         }
+        if self._slice_result is not None:
+            self._slice_result.print_estimates = (feature_times, material_amounts)
         self.printDurationMessage.emit(feature_times, material_amounts)
 
+    ##  Show the result of an earlier slice as if the engine just sent it.
+    #
+    #   The result is already in the cache, so it is not put in again. The placeholders in the g-code
+    #   are replaced after the print estimates of the result are emitted, so they are filled in with
+    #   those and not with the estimates of the previous slice.
+    #   \param slice_result The SliceResult from the slice result cache.
+    def _restoreSliceResult(self, slice_result):
+        self._slice_result = None
+        self.backendStateChange.emit(BackendState.Processing)
+        self.processingProgress.emit(0.0)
+
+        self._scene.gcode_list = list(slice_result.gcode_list)
+        self._stored_optimized_layer_data = list(slice_result.optimized_layers)
+        if slice_result.print_estimates is not None:
+            self.printDurationMessage.emit(*slice_result.print_estimates)
+        self._finishSlicing()
+
+    ##  Return the size of the slice result cache in bytes, from the preferences.
+    def _getSliceResultCacheSize(self):
+        return int(Preferences.getInstance().getValue("backend/slice_result_cache_size")) * 1024 * 1024
+
+    ##  Return the hits, misses and memory use of the slice result cache.
+    def getSliceResultCacheStatistics(self):
+        return self._slice_result_cache.getStatistics()
+
     ##  Creates a new socket connection.
     def _createSocket(self):
         super()._createSocket(os.path.abspath(os.path.join(PluginRegistry.getInstance().getPluginPath(self.getPluginId()), "Cura.proto")))
@@ -615,25 +691,30 @@ class CuraEngineBackend(QObject, Backend):
         if self._global_container_stack:
             self._global_container_stack.propertyChanged.disconnect(self._onSettingChanged)
             self._global_container_stack.containersChanged.disconnect(self._onChanged)
+            self._settings_cache.disconnectStack(self._global_container_stack)
             extruders = list(ExtruderManager.getInstance().getMachineExtruders(self._global_container_stack.getId()))
 
             for extruder in extruders:
                 extruder.propertyChanged.disconnect(self._onSettingChanged)
                 extruder.containersChanged.disconnect(self._onChanged)
+                self._settings_cache.disconnectStack(extruder)
 
         self._global_container_stack = Application.getInstance().getGlobalContainerStack()
 
         if self._global_container_stack:
             self._global_container_stack.propertyChanged.connect(self._onSettingChanged)  # Note: Only starts slicing when the value changed.
             self._global_container_stack.containersChanged.connect(self._onChanged)
+            self._settings_cache.connectStack(self._global_container_stack)
             extruders = list(ExtruderManager.getInstance().getMachineExtruders(self._global_container_stack.getId()))
             for extruder in extruders:
                 extruder.propertyChanged.connect(self._onSettingChanged)
                 extruder.containersChanged.connect(self._onChanged)
+                self._settings_cache.connectStack(extruder)
             self._onChanged()
 
     def _onProcessLayersFinished(self, job):
-        self._process_layers_job = None
+        if job is self._process_layers_job:  # An aborted job can finish after the next one started.
+            self._process_layers_job = None
 
     ##  Connect slice function to timer.
     def enableTimer(self):
@@ -649,6 +730,10 @@ class CuraEngineBackend(QObject, Backend):
             self._change_timer.timeout.disconnect(self.slice)
 
     def _onPreferencesChanged(self, preference):
+        if preference == "backend/location":  # The results of another engine may differ.
+            self._slice_result_cache.clear()
+        if preference == "backend/slice_result_cache_size":
+            self._slice_result_cache.setMaxSize(self._getSliceResultCacheSize())
         if preference != "general/auto_slice":
             return
         auto_slice = self.determineAutoSlicing()
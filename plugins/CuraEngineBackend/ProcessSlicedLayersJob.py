@@ -2,6 +2,7 @@
 #Cura is released under the terms of the AGPLv3 or higher.
 
 import gc
+import threading
 
 from UM.Job import Job
 from UM.Scene.Iterator.DepthFirstIterator import DepthFirstIterator
@@ -42,14 +43,38 @@ def colorCodeToRGBA(color_code):
         1.0]
 
 
+##  Converts the layers that the engine sent to layer data in the scene, for the layer view.
+#
+#   The job can start before the engine is done slicing. The layers are then given to it with
+#   addLayers as they come in, and it converts them while it waits for the rest. The layers that
+#   are done are shown every now and then, so the layer view fills in while the engine is still
+#   working. finishLayers tells the job that all layers are there.
+#
+#   Only the conversion runs on the thread of the job. The nodes with the layer data are put in the
+#   scene on the main thread.
 class ProcessSlicedLayersJob(Job):
-    def __init__(self, layers):
+    ##  \param layers The cura.proto.LayerOptimized messages to process.
+    #   \param streaming Whether more layers are going to be added with addLayers.
+    def __init__(self, layers, streaming = False):
         super().__init__()
-        self._layers = layers
+        self._layers = list(layers)  # Layers that were not processed yet.
+        self._layers_condition = threading.Condition()
+        self._waiting_for_layers = streaming
+        self._streaming = streaming
         self._scene = Application.getInstance().getController().getScene()
         self._progress = None
         self._abort_requested = False
 
+        self._layer_data = LayerDataBuilder.LayerDataBuilder()
+        self._processed_layer_count = 0
+        self._min_layer_number = 0
+        self._layer_node = None  # Node with the layer data that is shown.
+        self._shown_layer_count = 0
+        self._show_time = 0
+
+    ##  Minimum number of seconds between showing the layers processed so far
+    _show_interval = 1.0
+
     ##  Aborts the processing of layers.
     #
     #   This abort is made on a best-effort basis, meaning that the actual
@@ -58,12 +83,33 @@ class ProcessSlicedLayersJob(Job):
     #   that the abort will stop the job any time soon or even at all.
     def abort(self):
         self._abort_requested = True
+        with self._layers_condition:
+            self._layers_condition.notify_all()
+
+    ##  Add layers that came in from the engine, see the streaming argument of the constructor
+    def addLayers(self, layers):
+        with self._layers_condition:
+            self._layers.extend(layers)
+            self._layers_condition.notify_all()
+
+    ##  All layers were added, the layer data can be completed
+    #
+    #   The progress is only shown from here on: before, it is not known how many layers there are.
+    def finishLayers(self):
+        with self._layers_condition:
+            self._waiting_for_layers = False
+            self._layers_condition.notify_all()
+            if self._layers is not None and not self._abort_requested:  # Not done processing yet.
+                self._showProgress()
+
+    ##  Return whether layers can still be added to this job
+    def isWaitingForLayers(self):
+        return self._waiting_for_layers
 
     def run(self):
         start_time = time()
-        if Application.getInstance().getController().getActiveView().getPluginId() == "LayerView":
-            self._progress = Message(catalog.i18nc("@info:status", "Processing Layers"), 0, False, -1)
-            self._progress.show()
+        if not self._streaming:
+            self._showProgress()
             Job.yieldThread()
             if self._abort_requested:
                 if self._progress:
@@ -72,8 +118,6 @@ class ProcessSlicedLayersJob(Job):
 
         Application.getInstance().getController().activeViewChanged.connect(self._onActiveViewChanged)
 
-        new_node = SceneNode()
-
         ## Remove old layer data (if any)
         for node in DepthFirstIterator(self._scene.getRoot()):
             if node.callDecoration("getLayerData"):
@@ -90,84 +134,166 @@ class ProcessSlicedLayersJob(Job):
         # sure any old layer data is really cleaned up before adding new.
         gc.collect()
 
-        mesh = MeshData()
-        layer_data = LayerDataBuilder.LayerDataBuilder()
-        layer_count = len(self._layers)
+        self._material_color_map = self._getMaterialColorMap()
 
-        # Find the minimum layer number
-        # When using a raft, the raft layers are sent as layers < 0. Instead of allowing layers < 0, we
-        # instead simply offset all other layers so the lowest layer is always 0.
-        min_layer_number = 0
-        for layer in self._layers:
-            if layer.id < min_layer_number:
-                min_layer_number = layer.id
+        # We have to scale the colors for compatibility mode
+        if OpenGLContext.isLegacyOpenGL() or bool(Preferences.getInstance().getValue("view/force_layer_view_compatibility_mode")):
+            self._line_type_brightness = 0.5  # for compatibility mode
+        else:
+            self._line_type_brightness = 1.0
+
+        while True:
+            layers = self._takeLayers()
+            if self._abort_requested:
+                if self._progress:
+                    self._progress.hide()
+                return
+            if not layers:
+                break
 
-        current_layer = 0
+            for layer in layers:
+                self._processLayer(layer)
+                Job.yieldThread()
 
-        for layer in self._layers:
-            abs_layer_number = layer.id + abs(min_layer_number)
+                if self._abort_requested:
+                    if self._progress:
+                        self._progress.hide()
+                    return
+                if self._progress:
+                    self._progress.setProgress(self._processed_layer_count / (self._processed_layer_count + len(self._layers)) * 99)
 
-            layer_data.addLayer(abs_layer_number)
-            this_layer = layer_data.getLayer(abs_layer_number)
-            layer_data.setLayerHeight(abs_layer_number, layer.height)
+            # Show what we have so far, if the engine is still working on the rest.
+            if self._waiting_for_layers and time() - self._show_time > self._show_interval and self._processed_layer_count > self._shown_layer_count:
+                self._showLayers()
 
-            for p in range(layer.repeatedMessageCount("path_segment")):
-                polygon = layer.getRepeatedMessage("path_segment", p)
+        # We are done processing all the layers we got from the engine, now create a mesh out of the data
+        self._showLayers()
 
-                extruder = polygon.extruder
+        with self._layers_condition:
+            if self._progress:
+                self._progress.setProgress(100)
+                self._progress.hide()
 
-                line_types = numpy.fromstring(polygon.line_type, dtype="u1")  # Convert bytearray to numpy array
-                line_types = line_types.reshape((-1,1))
+            # Clear the unparsed layers. This saves us a bunch of memory if the Job does not get destroyed.
+            self._layers = None
+        self._layer_data = None
 
-                points = numpy.fromstring(polygon.points, dtype="f4")  # Convert bytearray to numpy array
-                if polygon.point_type == 0: # Point2D
-                    points = points.reshape((-1,2))  # We get a linear list of pairs that make up the points, so make numpy interpret them correctly.
-                else:  # Point3D
-                    points = points.reshape((-1,3))
+        Logger.log("d", "Processing layers took %s seconds", time() - start_time)
 
-                line_widths = numpy.fromstring(polygon.line_width, dtype="f4")  # Convert bytearray to numpy array
-                line_widths = line_widths.reshape((-1,1))  # We get a linear list of pairs that make up the points, so make numpy interpret them correctly.
+    ##  Wait for layers to process
+    #   \return The layers that came in since the last call, empty if there are no more layers.
+    def _takeLayers(self):
+        with self._layers_condition:
+            while not self._layers and self._waiting_for_layers and not self._abort_requested:
+                self._layers_condition.wait()
+            layers = self._layers
+            self._layers = []
+        return layers
+
+    ##  Convert one cura.proto.LayerOptimized message to a layer of the layer data
+    def _processLayer(self, layer):
+        # When using a raft, the raft layers are sent as layers < 0. Instead of allowing layers < 0, we
+        # instead simply offset all other layers so the lowest layer is always 0. The layers are kept
+        # by the number from the engine, and offset when the layer data is built.
+        self._min_layer_number = min(self._min_layer_number, layer.id)
+
+        layer_data = self._layer_data
+        layer_data.addLayer(layer.id)
+        this_layer = layer_data.getLayer(layer.id)
+        layer_data.setLayerHeight(layer.id, layer.height)
+
+        for p in range(layer.repeatedMessageCount("path_segment")):
+            polygon = layer.getRepeatedMessage("path_segment", p)
+
+            extruder = polygon.extruder
+
+            line_types = numpy.fromstring(polygon.line_type, dtype="u1")  # Convert bytearray to numpy array
+            line_types = line_types.reshape((-1,1))
+
+            points = numpy.fromstring(polygon.points, dtype="f4")  # Convert bytearray to numpy array
+            if polygon.point_type == 0: # Point2D
+                points = points.reshape((-1,2))  # We get a linear list of pairs that make up the points, so make numpy interpret them correctly.
+            else:  # Point3D
+                points = points.reshape((-1,3))
+
+            line_widths = numpy.fromstring(polygon.line_width, dtype="f4")  # Convert bytearray to numpy array
+            line_widths = line_widths.reshape((-1,1))  # We get a linear list of pairs that make up the points, so make numpy interpret them correctly.
+
+            # In the future, line_thicknesses should be given by CuraEngine as well.
+            # Currently the infill layer thickness also translates to line width
+            line_thicknesses = numpy.zeros(line_widths.shape, dtype="f4")
+            line_thicknesses[:] = layer.thickness / 1000  # from micrometer to millimeter
+
+            # Create a new 3D-array, copy the 2D points over and insert the right height.
+            # This uses manual array creation + copy rather than numpy.insert since this is
+            # faster.
+            new_points = numpy.empty((len(points), 3), numpy.float32)
+            if polygon.point_type == 0:  # Point2D
+                new_points[:, 0] = points[:, 0]
+                new_points[:, 1] = layer.height / 1000  # layer height value is in backend representation
+                new_points[:, 2] = -points[:, 1]
+            else: # Point3D
+                new_points[:, 0] = points[:, 0]
+                new_points[:, 1] = points[:, 2]
+                new_points[:, 2] = -points[:, 1]
+
+            this_poly = LayerPolygon.LayerPolygon(extruder, line_types, new_points, line_widths, line_thicknesses)
+            this_poly.buildCache()
+
+            this_layer.polygons.append(this_poly)
 
-                # In the future, line_thicknesses should be given by CuraEngine as well.
-                # Currently the infill layer thickness also translates to line width
-                line_thicknesses = numpy.zeros(line_widths.shape, dtype="f4")
-                line_thicknesses[:] = layer.thickness / 1000  # from micrometer to millimeter
+            Job.yieldThread()
 
-                # Create a new 3D-array, copy the 2D points over and insert the right height.
-                # This uses manual array creation + copy rather than numpy.insert since this is
-                # faster.
-                new_points = numpy.empty((len(points), 3), numpy.float32)
-                if polygon.point_type == 0:  # Point2D
-                    new_points[:, 0] = points[:, 0]
-                    new_points[:, 1] = layer.height / 1000  # layer height value is in backend representation
-                    new_points[:, 2] = -points[:, 1]
-                else: # Point3D
-                    new_points[:, 0] = points[:, 0]
-                    new_points[:, 1] = points[:, 2]
-                    new_points[:, 2] = -points[:, 1]
+        # Build the line mesh of the layer now, then showing the layers only has to put them together.
+        layer_data.buildLayer(layer.id)
+        self._processed_layer_count += 1
 
-                this_poly = LayerPolygon.LayerPolygon(extruder, line_types, new_points, line_widths, line_thicknesses)
-                this_poly.buildCache()
+    ##  Show the layers processed so far in the scene, replacing the layers that were shown before
+    #
+    #   The layer data is built here, the node with it is put in the scene later on the main thread.
+    def _showLayers(self):
+        layer_mesh = self._layer_data.build(self._material_color_map, self._line_type_brightness, -self._min_layer_number)
 
-                this_layer.polygons.append(this_poly)
+        if self._abort_requested:
+            return
 
-                Job.yieldThread()
-            Job.yieldThread()
-            current_layer += 1
-            progress = (current_layer / layer_count) * 99
-            # TODO: Rebuild the layer data mesh once the layer has been processed.
-            # This needs some work in LayerData so we can add the new layers instead of recreating the entire mesh.
+        self._shown_layer_count = self._processed_layer_count
+        self._show_time = time()
+        Application.getInstance().callLater(self._replaceLayerNode, layer_mesh)
 
-            if self._abort_requested:
-                if self._progress:
-                    self._progress.hide()
-                return
-            if self._progress:
-                self._progress.setProgress(progress)
+    ##  Replace the node with the layers that were shown before by a node with the given layer data
+    #
+    #   This changes the scene, so it must be called on the main thread.
+    def _replaceLayerNode(self, layer_mesh):
+        if self._abort_requested:
+            return
 
-        # We are done processing all the layers we got from the engine, now create a mesh out of the data
+        # Add LayerDataDecorator to scene node to indicate that the node has layer data
+        new_node = SceneNode()
+        decorator = LayerDataDecorator.LayerDataDecorator()
+        decorator.setLayerData(layer_mesh)
+        new_node.addDecorator(decorator)
 
-        # Find out colors per extruder
+        new_node.setMeshData(MeshData())
+
+        settings = Application.getInstance().getGlobalContainerStack()
+        if not settings.getProperty("machine_center_is_zero", "value"):
+            new_node.setPosition(Vector(-settings.getProperty("machine_width", "value") / 2, 0.0, settings.getProperty("machine_depth", "value") / 2))
+
+        if self._layer_node is not None:
+            self._layer_node.getParent().removeChild(self._layer_node)
+        # Set build volume as parent, the build volume can move as a result of raft settings.
+        # It makes sense to set the build volume as parent: the print is actually printed on it.
+        new_node_parent = Application.getInstance().getBuildVolume()
+        new_node.setParent(new_node_parent)  # Note: After this we can no longer abort!
+        self._layer_node = new_node
+
+        view = Application.getInstance().getController().getActiveView()
+        if view.getPluginId() == "LayerView":
+            view.resetLayerData()
+
+    ##  Return the colors of the materials per extruder, [r, g, b, a] for each extruder row
+    def _getMaterialColorMap(self):
         global_container_stack = Application.getInstance().getGlobalContainerStack()
         manager = ExtruderManager.getInstance()
         extruders = list(manager.getMachineExtruders(global_container_stack.getId()))
@@ -188,51 +314,17 @@ class ProcessSlicedLayersJob(Job):
             color_code = global_container_stack.material.getMetaDataEntry("color_code", default="#e0e000")
             color = colorCodeToRGBA(color_code)
             material_color_map[0, :] = color
+        return material_color_map
 
-        # We have to scale the colors for compatibility mode
-        if OpenGLContext.isLegacyOpenGL() or bool(Preferences.getInstance().getValue("view/force_layer_view_compatibility_mode")):
-            line_type_brightness = 0.5  # for compatibility mode
-        else:
-            line_type_brightness = 1.0
-        layer_mesh = layer_data.build(material_color_map, line_type_brightness)
-
-        if self._abort_requested:
-            if self._progress:
-                self._progress.hide()
-            return
-
-        # Add LayerDataDecorator to scene node to indicate that the node has layer data
-        decorator = LayerDataDecorator.LayerDataDecorator()
-        decorator.setLayerData(layer_mesh)
-        new_node.addDecorator(decorator)
-
-        new_node.setMeshData(mesh)
-        # Set build volume as parent, the build volume can move as a result of raft settings.
-        # It makes sense to set the build volume as parent: the print is actually printed on it.
-        new_node_parent = Application.getInstance().getBuildVolume()
-        new_node.setParent(new_node_parent)  # Note: After this we can no longer abort!
-
-        settings = Application.getInstance().getGlobalContainerStack()
-        if not settings.getProperty("machine_center_is_zero", "value"):
-            new_node.setPosition(Vector(-settings.getProperty("machine_width", "value") / 2, 0.0, settings.getProperty("machine_depth", "value") / 2))
-
-        if self._progress:
-            self._progress.setProgress(100)
-
-        view = Application.getInstance().getController().getActiveView()
-        if view.getPluginId() == "LayerView":
-            view.resetLayerData()
-
-        if self._progress:
-            self._progress.hide()
-
-        # Clear the unparsed layers. This saves us a bunch of memory if the Job does not get destroyed.
-        self._layers = None
-
-        Logger.log("d", "Processing layers took %s seconds", time() - start_time)
+    ##  Show the progress of processing the layers, if the layer view is active
+    def _showProgress(self):
+        if Application.getInstance().getController().getActiveView().getPluginId() == "LayerView":
+            if not self._progress:
+                self._progress = Message(catalog.i18nc("@info:status", "Processing Layers"), 0, False, -1)
+            self._progress.show()
 
     def _onActiveViewChanged(self):
-        if self.isRunning():
+        if self.isRunning() and not self._waiting_for_layers:
             if Application.getInstance().getController().getActiveView().getPluginId() == "LayerView":
                 if not self._progress:
                     self._progress = Message(catalog.i18nc("@info:status", "Processing Layers"), 0, False, 0)
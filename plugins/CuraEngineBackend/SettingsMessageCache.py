@@ -0,0 +1,162 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import threading
+import weakref
+
+from UM.Job import Job
+from UM.Settings.Validator import ValidatorState
+
+
+##  The properties of the settings of one stack that StartSliceJob sends to the engine.
+class StackSettings:
+    def __init__(self):
+        self.keys = []  # all keys of the stack, in the order of getAllKeys()
+        self.values = {}  # key -> value
+        self.encoded_values = {}  # key -> value as it is sent to the engine
+        self.settable_per_extruder = {}  # key -> bool
+        self.limit_to_extruder = {}  # key -> extruder position, -1 if not limited
+        self.dirty_keys = set()  # keys that changed since the properties were read
+
+    ##  Read the properties of keys from the stack
+    def update(self, stack, keys):
+        for key in keys:
+            value = stack.getProperty(key, "value")
+            self.values[key] = value
+            self.encoded_values[key] = str(value).encode("utf-8")
+            self.settable_per_extruder[key] = stack.getProperty(key, "settable_per_extruder")
+            self.limit_to_extruder[key] = int(round(float(stack.getProperty(key, "limit_to_extruder"))))
+            Job.yieldThread()
+
+
+##  The settings of one stack that have a value with an error, see SettingsMessageCache.getErrorKeys
+class StackValidation:
+    ##  Validation states that stop the slice
+    _error_states = {ValidatorState.Exception, ValidatorState.MaximumError, ValidatorState.MinimumError}
+
+    def __init__(self):
+        self.error_keys = {}  # key -> validation state, only the keys with an error
+        self.dirty_keys = None  # keys that changed since the validation states were read, None for all keys
+
+    ##  Read the validation states of keys from the stack
+    def update(self, stack, keys):
+        for key in keys:
+            validation_state = stack.getProperty(key, "validationState")
+            if validation_state in self._error_states:
+                self.error_keys[key] = validation_state
+            else:
+                self.error_keys.pop(key, None)
+            Job.yieldThread()
+
+
+##  Keeps the encoded setting values of the container stacks between slices.
+#
+#   Every slice sends the value of every setting of the global stack and the extruder stacks to the
+#   engine. Most of them did not change since the last slice, so the cache keeps the values of the
+#   stacks it is connected to and only reads the keys again for which the stacks emitted
+#   propertyChanged. Some settings are computed from the settings of other stacks, so a changed key
+#   is read again on all stacks. When containers of a stack are swapped, for instance when another
+#   material or quality is selected, everything is read again.
+#
+#   Stacks that are not connected are read completely on every slice.
+#
+#   The cache also keeps which settings have an error, for the stacks of the objects as well. Those
+#   stacks are connected the first time getErrorKeys is asked for them. Any change of a key, also of
+#   another property than the value, makes the validation state of that key be read again.
+class SettingsMessageCache:
+    ##  The properties that StartSliceJob reads
+    _properties = {"value", "settable_per_extruder", "limit_to_extruder"}
+
+    def __init__(self):
+        self._lock = threading.Lock()  # the slice job reads the stacks in its own thread
+        self._stacks = []  # connected stacks
+        self._stack_settings = {}  # id of connected stack -> StackSettings
+        self._stack_validations = weakref.WeakKeyDictionary()  # stack -> StackValidation
+
+    ##  Keep the settings of the stack between slices, from now on
+    def connectStack(self, stack):
+        stack.propertyChanged.connect(self._onPropertyChanged)
+        stack.containersChanged.connect(self.invalidate)
+        with self._lock:
+            self._stacks.append(stack)
+
+    def disconnectStack(self, stack):
+        stack.propertyChanged.disconnect(self._onPropertyChanged)
+        stack.containersChanged.disconnect(self.invalidate)
+        with self._lock:
+            self._stacks = [connected_stack for connected_stack in self._stacks if connected_stack is not stack]
+            self._stack_settings.pop(id(stack), None)
+            if self._stack_validations.pop(stack, None) is not None:
+                stack.propertyChanged.disconnect(self._onValidationChanged)
+
+    ##  Read all settings again on the next slice
+    def invalidate(self, *args):
+        with self._lock:
+            self._stack_settings = {}
+            for validation in self._stack_validations.values():
+                validation.dirty_keys = None
+
+    ##  Return the StackSettings of a stack, with the properties of the keys that changed read again
+    def getStackSettings(self, stack):
+        with self._lock:
+            connected = any(connected_stack is stack for connected_stack in self._stacks)
+            settings = self._stack_settings.get(id(stack)) if connected else None
+            if settings is None:
+                settings = StackSettings()
+                if connected:
+                    self._stack_settings[id(stack)] = settings
+                keys = None
+            else:
+                # Keys that change while they are read are marked again for the next slice.
+                keys = settings.dirty_keys
+                settings.dirty_keys = set()
+
+        if keys is None:
+            settings.keys = list(stack.getAllKeys())
+            keys = settings.keys
+        try:
+            settings.update(stack, keys)
+        except Exception:
+            with self._lock:  # Read everything again on the next slice.
+                self._stack_settings.pop(id(stack), None)
+            raise
+        return settings
+
+    ##  Return the keys of the settings of a stack that have an error, with their validation states
+    #   Only the validation states of the keys that changed since the last time are read again.
+    #   \return dict of key -> ValidatorState
+    def getErrorKeys(self, stack):
+        with self._lock:
+            validation = self._stack_validations.get(stack)
+            if validation is None:
+                validation = StackValidation()
+                self._stack_validations[stack] = validation
+                stack.propertyChanged.connect(self._onValidationChanged)
+            # Keys that change while they are read are marked again for the next slice.
+            keys = validation.dirty_keys
+            validation.dirty_keys = set()
+
+        if keys is None:
+            validation.error_keys = {}
+            keys = stack.getAllKeys()
+        try:
+            validation.update(stack, keys)
+        except Exception:
+            with self._lock:  # Read everything again on the next slice.
+                validation.dirty_keys = None
+            raise
+        return dict(validation.error_keys)
+
+    ##  The validation state of a key depends on the values of other keys, also in other stacks
+    def _onValidationChanged(self, key, property_name):
+        with self._lock:
+            for validation in self._stack_validations.values():
+                if validation.dirty_keys is not None:
+                    validation.dirty_keys.add(key)
+
+    def _onPropertyChanged(self, key, property_name):
+        if property_name not in self._properties:
+            return
+        with self._lock:
+            for settings in self._stack_settings.values():
+                settings.dirty_keys.add(key)
@@ -0,0 +1,87 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from collections import OrderedDict
+
+
+##  What the engine sent back for one slice message.
+class SliceResult:
+    ##  \param key The hash of the slice message, see StartSliceJob.getSliceMessageHash
+    def __init__(self, key):
+        self.key = key
+        self.gcode_list = []  # g-code as the engine sent it, before the placeholders are replaced
+        self.optimized_layers = []  # cura.proto.LayerOptimized messages
+        self.print_estimates = None  # (feature times, material amounts), see CuraEngineBackend.printDurationMessage
+        self.size = 0  # estimated number of bytes
+
+    def addOptimizedLayer(self, message):
+        self.optimized_layers.append(message)
+        for index in range(message.repeatedMessageCount("path_segment")):
+            segment = message.getRepeatedMessage("path_segment", index)
+            self.size += len(segment.points) + len(segment.line_type) + len(segment.line_width)
+
+    def setGCodeList(self, gcode_list):
+        self.gcode_list = list(gcode_list)
+        self.size += sum(len(line) for line in self.gcode_list)
+
+
+##  Least recently used cache of slice results, with a budget for their memory use.
+#
+#   Slicing the same scene with the same settings again, for instance after undoing a setting
+#   change, gives the same result. The results are kept by the hash of the slice message, so the
+#   result of such a slice can be shown without running the engine.
+class SliceResultCache:
+    ##  \param max_size Maximum number of bytes of the results together, estimated.
+    def __init__(self, max_size):
+        self._max_size = max_size
+        self._results = OrderedDict()  # key -> SliceResult, least recently used first
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    ##  Return the result of a slice message, or None if it is not in the cache
+    def get(self, key):
+        result = self._results.get(key)
+        if result is None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        self._results.move_to_end(key)
+        return result
+
+    ##  Add a result, removing the least recently used results that do not fit in the budget anymore
+    def put(self, result):
+        previous_result = self._results.pop(result.key, None)
+        if previous_result is not None:
+            self._size -= previous_result.size
+        if result.size > self._max_size:
+            return  # Would only push out all other results.
+        self._results[result.key] = result
+        self._size += result.size
+        self._evict()
+
+    def setMaxSize(self, max_size):
+        self._max_size = max_size
+        self._evict()
+
+    def clear(self):
+        self._results.clear()
+        self._size = 0
+
+    ##  Return the hits, misses and evictions since the cache was created, and the current use
+    def getStatistics(self):
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "results": len(self._results),
+            "size": self._size,
+            "max_size": self._max_size
+        }
+
+    def _evict(self):
+        while self._size > self._max_size and self._results:
+            _, result = self._results.popitem(last = False)
+            self._size -= result.size
+            self._evictions += 1
@@ -4,7 +4,10 @@
 import numpy
 from string import Formatter
 from enum import IntEnum
+import hashlib
+import threading
 import time
+import weakref
 
 from UM.Job import Job
 from UM.Application import Application
@@ -13,12 +16,13 @@ from UM.Logger import Logger
 from UM.Scene.SceneNode import SceneNode
 from UM.Scene.Iterator.DepthFirstIterator import DepthFirstIterator
 
-from UM.Settings.Validator import ValidatorState
 from UM.Settings.SettingRelation import RelationType
 
 from cura.OneAtATimeIterator import OneAtATimeIterator
 from cura.Settings.ExtruderManager import ExtruderManager
 
+from .SettingsMessageCache import SettingsMessageCache
+
 class StartJobResult(IntEnum):
     Finished = 1
     Error = 2
@@ -52,28 +56,52 @@ class StartSliceJob(Job):
     #   g-code in the volume of the mesh.
     _not_printed_mesh_settings = {"anti_overhang_mesh", "infill_mesh", "cutting_mesh"}
 
-    def __init__(self, slice_message):
+    ##  Vertices of the nodes as they were sent for the previous slices, see _getEngineVertices
+    _engine_vertices_cache = weakref.WeakKeyDictionary()  # node -> (mesh data, world transformation, vertices, digest)
+    _engine_vertices_cache_lock = threading.Lock()  # a cancelled job can still be running when the next one starts
+
+    ##  Converts row vectors from Y up axes to Z up axes. Equals a 90 degree rotation.
+    _engine_axes = numpy.array([[1, 0, 0], [0, 0, 1], [0, -1, 0]], dtype = numpy.float64)
+
+    ##  Global settings that only matter through the start and end g-code, which is in the hash itself.
+    _settings_not_hashed = {"time", "date", "day"}
+
+    ##  \param slice_message The cura.proto.Slice message to fill
+    #   \param settings_cache SettingsMessageCache with the settings of the previous slices, if any
+    def __init__(self, slice_message, settings_cache = None):
         super().__init__()
 
         self._scene = Application.getInstance().getController().getScene()
         self._slice_message = slice_message
+        self._settings_cache = settings_cache if settings_cache is not None else SettingsMessageCache()
+        self._slice_message_hash = hashlib.sha1()
         self._is_cancelled = False
 
     def getSliceMessage(self):
         return self._slice_message
 
+    ##  Return a hash of the contents of the slice message, the same for slice messages that give the same result
+    #   Arcus does not serialize messages for Python, so the hash is computed while the message is built.
+    def getSliceMessageHash(self):
+        return self._slice_message_hash.hexdigest()
+
+    ##  Add parts of the slice message to its hash, see getSliceMessageHash
+    def _addToHash(self, *parts):
+        for part in parts:
+            if not isinstance(part, bytes):
+                part = str(part).encode("utf-8")
+            self._slice_message_hash.update(str(len(part)).encode("utf-8") + b":" + part)
+
     ##  Check if a stack has any errors.
     ##  returns true if it has errors, false otherwise.
+    #   The settings cache only reads the validation states of the keys that changed since the last slice.
     def _checkStackForErrors(self, stack):
         if stack is None:
             return False
 
-        for key in stack.getAllKeys():
-            validation_state = stack.getProperty(key, "validationState")
-            if validation_state in (ValidatorState.Exception, ValidatorState.MaximumError, ValidatorState.MinimumError):
-                Logger.log("w", "Setting %s is not valid, but %s. Aborting slicing.", key, validation_state)
-                return True
-            Job.yieldThread()
+        for key, validation_state in self._settings_cache.getErrorKeys(stack).items():
+            Logger.log("w", "Setting %s is not valid, but %s. Aborting slicing.", key, validation_state)
+            return True
         return False
 
     ##  Runs the job that initiates the slicing.
@@ -175,39 +203,68 @@ class StartSliceJob(Job):
 
             for group in object_groups:
                 group_message = self._slice_message.addRepeatedMessage("object_lists")
+                self._addToHash("object_lists")
                 if group[0].getParent().callDecoration("isGroup"):
                     self._handlePerObjectSettings(group[0].getParent(), group_message)
                 for object in group:
-                    mesh_data = object.getMeshData()
-                    rot_scale = object.getWorldTransformation().getTransposed().getData()[0:3, 0:3]
-                    translate = object.getWorldTransformation().getData()[:3, 3]
-
-                    # This effectively performs a limited form of MeshData.getTransformed that ignores normals.
-                    verts = mesh_data.getVertices()
-                    verts = verts.dot(rot_scale)
-                    verts += translate
-
-                    # Convert from Y up axes to Z up axes. Equals a 90 degree rotation.
-                    verts[:, [1, 2]] = verts[:, [2, 1]]
-                    verts[:, 1] *= -1
-
                     obj = group_message.addRepeatedMessage("objects")
                     obj.id = id(object)
-
-                    indices = mesh_data.getIndices()
-                    if indices is not None:
-                        flat_verts = numpy.take(verts, indices.flatten(), axis=0)
-                    else:
-                        flat_verts = numpy.array(verts)
-
-                    obj.vertices = flat_verts
+                    vertices, vertices_digest = self._getEngineVertices(object)
+                    obj.vertices = vertices
+                    self._addToHash("objects", vertices_digest)
 
                     self._handlePerObjectSettings(object, obj)
 
                     Job.yieldThread()
 
+            self._pruneEngineVertices([object for group in object_groups for object in group])
+
         self.setResult(StartJobResult.Finished)
 
+    ##  Return the vertices of the faces of a node, as the engine gets them
+    #
+    #   The vertices are transformed to the world space of the engine, which has the Z axis up, and
+    #   listed per face, three per triangle, as float32. The result is cached per node for as long as
+    #   the node keeps the same mesh data and world transformation, so changing only a setting does
+    #   not transform all meshes again. The returned array must not be changed.
+    #   \param node \type{SceneNode} Node with mesh data.
+    #   \return (vertices, digest), vertices a numpy float32 array (face count * 3, 3) and digest a hash of them
+    @classmethod
+    def _getEngineVertices(cls, node):
+        mesh_data = node.getMeshData()
+        world_transformation = node.getWorldTransformation().getData()
+        with cls._engine_vertices_cache_lock:
+            cached = cls._engine_vertices_cache.get(node)
+        if cached is not None and cached[0] is mesh_data and numpy.array_equal(cached[1], world_transformation):
+            return cached[2], cached[3]
+
+        # This effectively performs a limited form of MeshData.getTransformed that ignores normals, and
+        # converts to the axes of the engine in the same matrix product.
+        rot_scale = world_transformation[0:3, 0:3].T.dot(cls._engine_axes)
+        translate = world_transformation[0:3, 3].dot(cls._engine_axes)
+        verts = mesh_data.getVertices().dot(rot_scale)
+        verts += translate
+        verts = verts.astype(numpy.float32)
+
+        indices = mesh_data.getIndices()
+        if indices is not None:
+            verts = numpy.take(verts, indices.ravel(), axis = 0)
+        verts.flags.writeable = False
+        digest = hashlib.sha1(numpy.ascontiguousarray(verts).data).digest()
+
+        with cls._engine_vertices_cache_lock:
+            cls._engine_vertices_cache[node] = (mesh_data, world_transformation.copy(), verts, digest)
+        return verts, digest
+
+    ##  Forget the vertices of the nodes that were not sliced, see _getEngineVertices
+    #   \param nodes The nodes that were sent to the engine.
+    @classmethod
+    def _pruneEngineVertices(cls, nodes):
+        nodes = set(nodes)
+        with cls._engine_vertices_cache_lock:
+            for node in [node for node in cls._engine_vertices_cache.keys() if node not in nodes]:
+                del cls._engine_vertices_cache[node]
+
     def cancel(self):
         super().cancel()
         self._is_cancelled = True
@@ -231,33 +288,40 @@ class StartSliceJob(Job):
             message.id = message_id
         else:
             message.id = int(stack.getMetaDataEntry("position"))
+        self._addToHash("extruders", message.id)
 
         material_instance_container = stack.findContainer({"type": "material"})
 
-        for key in stack.getAllKeys():
+        stack_settings = self._settings_cache.getStackSettings(stack)
+        for key in stack_settings.keys:
             # Do not send settings that are not settable_per_extruder.
-            if not stack.getProperty(key, "settable_per_extruder"):
+            if not stack_settings.settable_per_extruder[key]:
                 continue
             setting = message.getMessage("settings").addRepeatedMessage("settings")
             setting.name = key
             if key == "material_guid" and material_instance_container:
                 # Also send the material GUID. This is a setting in fdmprinter, but we have no interface for it.
-                setting.value = str(material_instance_container.getMetaDataEntry("GUID", "")).encode("utf-8")
+                value = str(material_instance_container.getMetaDataEntry("GUID", "")).encode("utf-8")
             else:
-                setting.value = str(stack.getProperty(key, "value")).encode("utf-8")
+                value = stack_settings.encoded_values[key]
+            setting.value = value
+            self._addToHash(key, value)
             Job.yieldThread()
 
     ##  Create extruder message from global stack
     def _buildExtruderMessageFromGlobalStack(self, stack):
         message = self._slice_message.addRepeatedMessage("extruders")
+        self._addToHash("extruders")
 
-        for key in stack.getAllKeys():
+        stack_settings = self._settings_cache.getStackSettings(stack)
+        for key in stack_settings.keys:
             # Do not send settings that are not settable_per_extruder.
-            if not stack.getProperty(key, "settable_per_extruder"):
+            if not stack_settings.settable_per_extruder[key]:
                 continue
             setting = message.getMessage("settings").addRepeatedMessage("settings")
             setting.name = key
-            setting.value = str(stack.getProperty(key, "value")).encode("utf-8")
+            setting.value = stack_settings.encoded_values[key]
+            self._addToHash(key, stack_settings.encoded_values[key])
             Job.yieldThread()
 
     ##  Sends all global settings to the engine.
@@ -265,16 +329,15 @@ class StartSliceJob(Job):
     #   The settings are taken from the global stack. This does not include any
     #   per-extruder settings or per-object settings.
     def _buildGlobalSettingsMessage(self, stack):
-        keys = stack.getAllKeys()
+        stack_settings = self._settings_cache.getStackSettings(stack)
         settings = {}
-        for key in keys:
-            settings[key] = stack.getProperty(key, "value")
-            if key == "adhesion_extruder_nr" and int(stack.getProperty(key, "value")) == -1:
+        for key in stack_settings.keys:
+            settings[key] = stack_settings.values[key]
+            if key == "adhesion_extruder_nr" and int(stack_settings.values[key]) == -1:
                 if "Left" in ExtruderManager.getInstance().getUsedExtruderStacks()[0].getName():
                     settings[key] = "0"
                 else:
                     settings[key] = "1"
-            Job.yieldThread()
 
         start_gcode = settings["machine_start_gcode"]
         #Pre-compute material material_bed_temp_prepend and material_print_temp_prepend
@@ -294,9 +357,14 @@ class StartSliceJob(Job):
             setting_message = self._slice_message.getMessage("global_settings").addRepeatedMessage("settings")
             setting_message.name = key
             if key == "machine_start_gcode" or key == "machine_end_gcode" or key == "machine_extruder_start_code" or key == "machine_extruder_end_code": #If it's a g-code message, use special formatting.
-                setting_message.value = self._expandGcodeTokens(key, value, settings)
+                encoded_value = self._expandGcodeTokens(key, value, settings)
+            elif key in stack_settings.encoded_values and value is stack_settings.values[key]:
+                encoded_value = stack_settings.encoded_values[key]
             else:
-                setting_message.value = str(value).encode("utf-8")
+                encoded_value = str(value).encode("utf-8")
+            setting_message.value = encoded_value
+            if key not in self._settings_not_hashed:
+                self._addToHash(key, encoded_value)
             Job.yieldThread()
 
     ##  Sends for some settings which extruder they should fallback to if not
@@ -308,9 +376,10 @@ class StartSliceJob(Job):
     #   \param stack The global stack with all settings, from which to read the
     #   limit_to_extruder property.
     def _buildGlobalInheritsStackMessage(self, stack):
-        for key in stack.getAllKeys():
-            extruder = int(round(float(stack.getProperty(key, "limit_to_extruder"))))
-            if key == "adhesion_extruder_nr" and int(stack.getProperty(key, "value")) == -1:
+        stack_settings = self._settings_cache.getStackSettings(stack)
+        for key in stack_settings.keys:
+            extruder = stack_settings.limit_to_extruder[key]
+            if key == "adhesion_extruder_nr" and int(stack_settings.values[key]) == -1:
                 if "Left" in ExtruderManager.getInstance().getUsedExtruderStacks()[0].getName():
                     extruder = 0
                 else:
@@ -319,6 +388,7 @@ class StartSliceJob(Job):
                 setting_extruder = self._slice_message.addRepeatedMessage("limit_to_extruder")
                 setting_extruder.name = key
                 setting_extruder.extruder = extruder
+                self._addToHash("limit_to_extruder", key, extruder)
             Job.yieldThread()
 
     ##  Check if a node has per object settings and ensure that they are set correctly in the message
@@ -342,7 +412,7 @@ class StartSliceJob(Job):
             changed_setting_keys.add("extruder_nr")
 
         # Get values for all changed settings
-        for key in changed_setting_keys:
+        for key in sorted(changed_setting_keys): # Sorted to get the same hash for the same settings.
             setting = message.addRepeatedMessage("settings")
             setting.name = key
             extruder = int(round(float(stack.getProperty(key, "limit_to_extruder"))))
@@ -350,7 +420,9 @@ class StartSliceJob(Job):
                 limited_stack = ExtruderManager.getInstance().getActiveExtruderStacks()[extruder]
             else:
                 limited_stack = stack #Just take from the per-object settings itself.
-            setting.value = str(limited_stack.getProperty(key, "value")).encode("utf-8")
+            value = str(limited_stack.getProperty(key, "value")).encode("utf-8")
+            setting.value = value
+            self._addToHash(key, value)
             Job.yieldThread()
 
     ##  Recursive function to put all settings that require eachother for value changes in a list
@@ -0,0 +1,125 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from time import time
+
+import pytest
+
+from UM.Application import Application
+from UM.Backend.Backend import BackendState
+from UM.Signal import Signal
+
+from plugins.CuraEngineBackend import ProcessSlicedLayersJob
+from plugins.CuraEngineBackend.CuraEngineBackend import CuraEngineBackend #The module we're testing. It imports its package relatively.
+from plugins.CuraEngineBackend.SliceResultCache import SliceResult, SliceResultCache
+
+
+##  Print information that follows the print estimates of the backend, like PrintInformation
+class MockPrintInformation:
+    class Duration:
+        def __init__(self, seconds):
+            self._seconds = seconds
+
+        def getDisplayString(self, display_format):
+            return str(self._seconds)
+
+    def __init__(self, backend):
+        self.currentPrintTime = self.Duration(0)
+        self.materialLengths = []
+        self.materialWeights = []
+        self.materialCosts = []
+        self.jobName = "UM3_box"
+        backend.printDurationMessage.connect(self._onPrintDurationMessage)
+
+    def _onPrintDurationMessage(self, feature_times, material_amounts):
+        self.currentPrintTime = self.Duration(sum(feature_times.values()))
+        self.materialLengths = material_amounts
+
+
+class MockApplication:
+    def __init__(self, print_information):
+        self._print_information = print_information
+
+    def getPrintInformation(self):
+        return self._print_information
+
+
+##  Job that only remembers the layers it was started with
+class MockProcessSlicedLayersJob:
+    def __init__(self, layers, streaming = False):
+        self.finished = Signal()
+        self.layers = layers
+        MockProcessSlicedLayersJob.jobs.append(self)
+
+    def start(self):
+        pass
+
+    def isRunning(self):
+        return False
+
+    def isWaitingForLayers(self):
+        return False
+
+    jobs = []
+
+
+class MockScene:
+    def __init__(self):
+        self.gcode_list = []
+
+
+##  Backend with just what is needed to finish a slice, without engine or Qt
+@pytest.fixture
+def backend(monkeypatch):
+    backend = CuraEngineBackend.__new__(CuraEngineBackend)
+    backend.backendStateChange = Signal()
+    backend.processingProgress = Signal()
+    backend.printDurationMessage = Signal()
+    backend._scene = MockScene()
+    backend._slice_result_cache = SliceResultCache(1024 * 1024)
+    backend._slice_result = None
+    backend._stored_optimized_layer_data = []
+    backend._process_layers_job = None
+    backend._layer_view_active = True
+    backend._slicing = True
+    backend._need_slicing = True
+    backend._slice_start_time = time()
+
+    application = MockApplication(MockPrintInformation(backend))
+    monkeypatch.setattr(Application, "getInstance", lambda: application)
+    monkeypatch.setattr(ProcessSlicedLayersJob, "ProcessSlicedLayersJob", MockProcessSlicedLayersJob)
+    MockProcessSlicedLayersJob.jobs = []
+    return backend
+
+
+##  A cache hit shows the g-code, the layers and the print estimates of the cached slice
+#   The cached result stays as it was, and nothing is put in the cache.
+def test_restoreSliceResult(backend):
+    slice_result = SliceResult("hash")
+    slice_result.optimized_layers = ["layer 0", "layer 1"]
+    slice_result.setGCodeList([";PRINT.TIME:{print_time}\n", "G28\n"])
+    slice_result.print_estimates = ({"infill": 100, "travel": 20}, [1500.0])
+    backend._slice_result_cache.put(slice_result)
+    backend._slice_result = SliceResult("interrupted")  # A slice that the engine did not finish.
+
+    states = []
+    progress = []
+    print_estimates = []
+    backend.backendStateChange.connect(states.append)
+    backend.processingProgress.connect(progress.append)
+    backend.printDurationMessage.connect(lambda *args: print_estimates.append(args))
+    backend._restoreSliceResult(backend._slice_result_cache.get("hash"))
+
+    assert states == [BackendState.Processing, BackendState.Done]
+    assert progress == [0.0, 1.0]
+    assert print_estimates == [slice_result.print_estimates]
+    assert backend._scene.gcode_list == [";PRINT.TIME:120\n", "G28\n"]
+    assert slice_result.gcode_list == [";PRINT.TIME:{print_time}\n", "G28\n"]
+    assert [job.layers for job in MockProcessSlicedLayersJob.jobs] == [["layer 0", "layer 1"]]
+    assert MockProcessSlicedLayersJob.jobs[0].layers is not slice_result.optimized_layers
+    assert not backend._slicing
+
+    statistics = backend._slice_result_cache.getStatistics()
+    assert statistics["results"] == 1
+    assert statistics["size"] == slice_result.size
+    assert backend._slice_result is None
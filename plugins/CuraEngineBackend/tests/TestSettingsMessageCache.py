@@ -0,0 +1,123 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from UM.Settings.Validator import ValidatorState
+from UM.Signal import Signal
+
+from SettingsMessageCache import SettingsMessageCache #The module we're testing.
+
+
+##  Container stack with just the properties that the cache reads, counting the reads
+class MockStack:
+    def __init__(self, values):
+        self.propertyChanged = Signal()
+        self.containersChanged = Signal()
+        self.values = values
+        self.reads = []
+
+    def getAllKeys(self):
+        return list(self.values.keys())
+
+    def getProperty(self, key, property_name):
+        self.reads.append(key)
+        if property_name == "value":
+            return self.values[key]
+        if property_name == "settable_per_extruder":
+            return key != "machine_width"
+        if property_name == "limit_to_extruder":
+            return "-1"
+        if property_name == "validationState":
+            return ValidatorState.MaximumError if self.values.get(key, 0) > 1000 else ValidatorState.Valid
+
+    def setValue(self, key, value):
+        self.values[key] = value
+        self.propertyChanged.emit(key, "value")
+
+
+def test_getStackSettings():
+    stack = MockStack({"machine_width": 220, "layer_height": 0.1})
+    cache = SettingsMessageCache()
+    cache.connectStack(stack)
+
+    settings = cache.getStackSettings(stack)
+    assert settings.keys == ["machine_width", "layer_height"]
+    assert settings.encoded_values == {"machine_width": b"220", "layer_height": b"0.1"}
+    assert settings.settable_per_extruder == {"machine_width": False, "layer_height": True}
+    assert settings.limit_to_extruder == {"machine_width": -1, "layer_height": -1}
+
+
+##  Only the keys that changed are read again
+def test_getStackSettings_changed():
+    stack = MockStack({"machine_width": 220, "layer_height": 0.1})
+    cache = SettingsMessageCache()
+    cache.connectStack(stack)
+    cache.getStackSettings(stack)
+
+    stack.reads = []
+    stack.setValue("layer_height", 0.2)
+    settings = cache.getStackSettings(stack)
+    assert set(stack.reads) == {"layer_height"}
+    assert settings.encoded_values["layer_height"] == b"0.2"
+
+    stack.reads = []
+    cache.getStackSettings(stack)
+    assert stack.reads == []
+
+
+##  Everything is read again when containers are swapped, or always for stacks that are not connected
+def test_getStackSettings_invalidate():
+    stack = MockStack({"machine_width": 220, "layer_height": 0.1})
+    other_stack = MockStack({"layer_height": 0.3})
+    cache = SettingsMessageCache()
+    cache.connectStack(stack)
+    cache.getStackSettings(stack)
+    cache.getStackSettings(other_stack)
+
+    stack.reads = []
+    other_stack.reads = []
+    stack.values["layer_height"] = 0.15
+    stack.containersChanged.emit(stack)
+    assert cache.getStackSettings(stack).values["layer_height"] == 0.15
+    assert set(stack.reads) == {"machine_width", "layer_height"}
+    cache.getStackSettings(other_stack)
+    assert set(other_stack.reads) == {"layer_height"}
+
+    cache.disconnectStack(stack)
+    stack.reads = []
+    cache.getStackSettings(stack)
+    assert set(stack.reads) == {"machine_width", "layer_height"}
+
+
+##  Only the validation states of the keys that changed are read again, also for stacks of objects
+def test_getErrorKeys():
+    stack = MockStack({"machine_width": 220, "layer_height": 0.1})
+    object_stack = MockStack({"infill_sparse_density": 2000, "layer_height": 0.1})
+    cache = SettingsMessageCache()
+    cache.connectStack(stack)
+
+    assert cache.getErrorKeys(stack) == {}
+    assert cache.getErrorKeys(object_stack) == {"infill_sparse_density": ValidatorState.MaximumError}
+
+    stack.reads = []
+    object_stack.reads = []
+    object_stack.setValue("infill_sparse_density", 20)
+    stack.setValue("machine_width", 2200)
+    assert cache.getErrorKeys(object_stack) == {}
+    assert set(object_stack.reads) == {"infill_sparse_density", "machine_width"}
+    assert cache.getErrorKeys(stack) == {"machine_width": ValidatorState.MaximumError}
+    assert set(stack.reads) == {"infill_sparse_density", "machine_width"}
+
+    # Another property than the value can change the validation state as well
+    stack.reads = []
+    stack.values["machine_width"] = 220
+    stack.propertyChanged.emit("machine_width", "maximum_value")
+    assert cache.getErrorKeys(stack) == {}
+    assert stack.reads == ["machine_width"]
+
+    stack.reads = []
+    cache.getErrorKeys(stack)
+    assert stack.reads == []
+
+    stack.containersChanged.emit(stack)
+    cache.getErrorKeys(stack)
+    assert set(stack.reads) == {"machine_width", "layer_height"}
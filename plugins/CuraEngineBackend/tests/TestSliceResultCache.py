@@ -0,0 +1,63 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from SliceResultCache import SliceResult, SliceResultCache #The module we're testing.
+
+
+##  Layer message with path segments of the given sizes, like a cura.proto.LayerOptimized
+class MockLayerMessage:
+    class Segment:
+        def __init__(self, size):
+            self.points = b"p" * size
+            self.line_type = b""
+            self.line_width = b""
+
+    def __init__(self, segment_sizes):
+        self._segments = [self.Segment(size) for size in segment_sizes]
+
+    def repeatedMessageCount(self, field_name):
+        return len(self._segments)
+
+    def getRepeatedMessage(self, field_name, index):
+        return self._segments[index]
+
+
+def gimmeSliceResult(key, size):
+    result = SliceResult(key)
+    result.addOptimizedLayer(MockLayerMessage([size // 2]))
+    result.setGCodeList([";" * (size - size // 2)])
+    return result
+
+
+def test_sizeOfResult():
+    result = SliceResult("a")
+    result.addOptimizedLayer(MockLayerMessage([10, 20]))
+    result.setGCodeList([";FLAVOR", "G28"])
+    assert result.size == 30 + 7 + 3
+
+
+##  The least recently used results are evicted when the results do not fit anymore
+def test_evictLeastRecentlyUsed():
+    cache = SliceResultCache(100)
+    cache.put(gimmeSliceResult("a", 40))
+    cache.put(gimmeSliceResult("b", 40))
+    assert cache.get("a") is not None
+    cache.put(gimmeSliceResult("c", 40))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.getStatistics() == {"hits": 3, "misses": 1, "evictions": 1, "results": 2, "size": 80, "max_size": 100}
+
+
+##  Results larger than the whole cache are not kept, and a smaller budget evicts results
+def test_budget():
+    cache = SliceResultCache(100)
+    cache.put(gimmeSliceResult("a", 40))
+    cache.put(gimmeSliceResult("huge", 200))
+    assert cache.get("huge") is None
+    assert cache.get("a") is not None
+
+    cache.setMaxSize(30)
+    assert cache.get("a") is None
+    assert cache.getStatistics()["size"] == 0
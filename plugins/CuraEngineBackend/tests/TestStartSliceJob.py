@@ -0,0 +1,131 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import hashlib
+import weakref
+
+import numpy
+import pytest
+
+from UM.Math.Matrix import Matrix
+
+from plugins.CuraEngineBackend.StartSliceJob import StartSliceJob #The module we're testing. It imports its package relatively.
+
+
+class MockMeshData:
+    def __init__(self, vertices, indices = None):
+        self._vertices = vertices
+        self._indices = indices
+
+    def getVertices(self):
+        return self._vertices
+
+    def getIndices(self):
+        return self._indices
+
+
+class MockNode:
+    def __init__(self, mesh_data, transformation):
+        self._mesh_data = mesh_data
+        self.transformation = transformation
+
+    def getMeshData(self):
+        return self._mesh_data
+
+    def getWorldTransformation(self):
+        return Matrix(self.transformation)
+
+
+def gimmeMeshData(indexed = True):
+    random = numpy.random.RandomState(17)
+    vertices = random.uniform(-20, 20, (30, 3)).astype(numpy.float32)
+    indices = random.randint(0, 30, (40, 3)).astype(numpy.int32) if indexed else None
+    return MockMeshData(vertices, indices)
+
+
+def gimmeTransformation(x = 12.5, angle = 0.3):
+    data = numpy.identity(4)
+    data[[0, 0, 2, 2], [0, 2, 0, 2]] = [numpy.cos(angle), numpy.sin(angle), -numpy.sin(angle), numpy.cos(angle)]
+    data[1, 1] = 1.5
+    data[0:3, 3] = [x, 3, -40.25]
+    return data
+
+
+##  The vertices as StartSliceJob computed them before they were cached
+def oldEngineVertices(node):
+    mesh_data = node.getMeshData()
+    rot_scale = node.getWorldTransformation().getData().T[0:3, 0:3]
+    translate = node.getWorldTransformation().getData()[:3, 3]
+
+    verts = mesh_data.getVertices()
+    verts = verts.dot(rot_scale)
+    verts += translate
+
+    # Convert from Y up axes to Z up axes. Equals a 90 degree rotation.
+    verts[:, [1, 2]] = verts[:, [2, 1]]
+    verts[:, 1] *= -1
+
+    indices = mesh_data.getIndices()
+    if indices is not None:
+        return numpy.take(verts, indices.flatten(), axis = 0)
+    return numpy.array(verts)
+
+
+@pytest.fixture(autouse = True)
+def engine_vertices_cache(monkeypatch):
+    cache = weakref.WeakKeyDictionary()
+    monkeypatch.setattr(StartSliceJob, "_engine_vertices_cache", cache)
+    return cache
+
+
+##  The vertices are the same as before, as float32, with a digest of their bytes
+def test_getEngineVertices():
+    for indexed in (True, False):
+        node = MockNode(gimmeMeshData(indexed), gimmeTransformation())
+        vertices, digest = StartSliceJob._getEngineVertices(node)
+        expected_vertices = oldEngineVertices(node)
+        assert vertices.dtype == numpy.float32
+        assert vertices.shape == expected_vertices.shape
+        assert numpy.allclose(vertices, expected_vertices, atol = 1e-4)
+        assert digest == hashlib.sha1(numpy.ascontiguousarray(vertices).data).digest()
+
+
+##  The vertices are reused for the same mesh data and transformation, and computed again when either changes
+def test_getEngineVertices_cache():
+    mesh_data = gimmeMeshData()
+    node = MockNode(mesh_data, gimmeTransformation())
+    vertices, digest = StartSliceJob._getEngineVertices(node)
+    assert not vertices.flags.writeable
+
+    # A transformation that is equal but not the same object still hits the cache
+    node.transformation = gimmeTransformation()
+    assert StartSliceJob._getEngineVertices(node)[0] is vertices
+
+    node.transformation = gimmeTransformation(x = 13.5)
+    moved_vertices, moved_digest = StartSliceJob._getEngineVertices(node)
+    assert moved_vertices is not vertices
+    assert moved_digest != digest
+    assert numpy.allclose(moved_vertices, oldEngineVertices(node), atol = 1e-4)
+    assert StartSliceJob._getEngineVertices(node)[0] is moved_vertices
+
+    node._mesh_data = gimmeMeshData()
+    assert StartSliceJob._getEngineVertices(node)[0] is not moved_vertices
+
+    # Another node with the same mesh data has vertices of its own
+    other_node = MockNode(mesh_data, gimmeTransformation(angle = 1.2))
+    other_vertices, _ = StartSliceJob._getEngineVertices(other_node)
+    assert numpy.allclose(other_vertices, oldEngineVertices(other_node), atol = 1e-4)
+
+
+##  Only the vertices of the nodes that were sent are kept
+def test_pruneEngineVertices(engine_vertices_cache):
+    nodes = [MockNode(gimmeMeshData(), gimmeTransformation(x = x)) for x in range(3)]
+    vertices = [StartSliceJob._getEngineVertices(node)[0] for node in nodes]
+
+    StartSliceJob._pruneEngineVertices([nodes[0], nodes[2]])
+    assert set(engine_vertices_cache.keys()) == {nodes[0], nodes[2]}
+    assert StartSliceJob._getEngineVertices(nodes[0])[0] is vertices[0]
+    assert StartSliceJob._getEngineVertices(nodes[1])[0] is not vertices[1]
+
+    StartSliceJob._pruneEngineVertices([])
+    assert len(engine_vertices_cache) == 0
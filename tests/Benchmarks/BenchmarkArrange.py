@@ -0,0 +1,236 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+##  Benchmark suite for arranging, with machine-readable results to track regressions.
+#
+#   Builds synthetic build plates for every combination of part count, hull type, disallowed
+#   areas and print mode, arranges all parts on them like ArrangeObjectsJob does and reports the
+#   time spent in Arrange.create, ShapeArray.fromPolygon, Arrange.bestSpot and Arrange.place,
+#   together with the number of placed parts and the placement density (the part of the free
+#   cells of the build plate that is covered by the placed hulls).
+#
+#   The application is not started: UM.Application, UM.Preferences and the Cura modules that need
+#   Qt are replaced by stubs before Arrange is imported, so this runs headless. Run it from the
+#   Cura root directory with Uranium on the Python path:
+#       python3 tests/Benchmarks/BenchmarkArrange.py --output arrange.json
+
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import sys
+import time
+import types
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+machine_width = 220
+machine_depth = 220
+machine_head_with_fans_polygon = [[-20, 10], [10, 10], [10, -10], [-20, -10]]
+min_offset = 4
+
+
+##  Global stack with just the settings that the arranger looks at
+class BenchmarkGlobalStack:
+    def __init__(self):
+        self.print_mode = "regular"
+
+    def getProperty(self, key, property_name):
+        return {
+            "machine_width": machine_width,
+            "machine_depth": machine_depth,
+            "print_mode": self.print_mode,
+            "machine_head_with_fans_polygon": machine_head_with_fans_polygon
+        }.get(key)
+
+
+class BenchmarkApplication:
+    _global_container_stack = BenchmarkGlobalStack()
+
+    @classmethod
+    def getInstance(cls):
+        return cls
+
+    @classmethod
+    def getGlobalContainerStack(cls):
+        return cls._global_container_stack
+
+
+class BenchmarkPreferences:
+    _values = {"mesh/arrange_align": False}
+
+    @classmethod
+    def getInstance(cls):
+        return cls
+
+    @classmethod
+    def getValue(cls, key):
+        return cls._values.get(key)
+
+
+##  Replace the modules that need a running application or Qt by stubs
+def stubModules():
+    stubs = {
+        "UM.Application": {"Application": BenchmarkApplication},
+        "UM.Preferences": {"Preferences": BenchmarkPreferences},
+        "cura.DuplicatedNode": {"DuplicatedNode": type("DuplicatedNode", (), {})},
+        "cura.ZOffsetDecorator": {"ZOffsetDecorator": type("ZOffsetDecorator", (), {})},
+    }
+    for name, attributes in stubs.items():
+        module = types.ModuleType(name)
+        module.__dict__.update(attributes)
+        sys.modules[name] = module
+
+stubModules()
+
+from UM.Math.Polygon import Polygon
+
+from cura.Arrange import Arrange
+from cura.HierarchicalArrange import HierarchicalArrange
+from cura.ShapeArray import ShapeArray
+
+
+##  Build volume with just the disallowed areas, like BuildVolume computes them
+class BenchmarkBuildVolume:
+    def __init__(self, disallowed_areas, print_mode):
+        self.margin = 0
+        self._disallowed_areas = []
+        self._masks = {}  # (width, depth) -> raster of the disallowed areas, like BuildVolume keeps it
+        if disallowed_areas:
+            border = 3
+            self._disallowed_areas.append(rectangle(-machine_width / 2, -machine_depth / 2, machine_width / 2, -machine_depth / 2 + border))
+            self._disallowed_areas.append(rectangle(-machine_width / 2, machine_depth / 2 - border, machine_width / 2, machine_depth / 2))
+            self._disallowed_areas.append(rectangle(-machine_width / 2, -machine_depth / 2, -machine_width / 2 + border, machine_depth / 2))
+            self._disallowed_areas.append(rectangle(machine_width / 2 - border, -machine_depth / 2, machine_width / 2, machine_depth / 2))
+            # Clips in the corners
+            self._disallowed_areas.append(rectangle(-machine_width / 2, -machine_depth / 2, -machine_width / 2 + 30, -machine_depth / 2 + 20))
+            self._disallowed_areas.append(rectangle(machine_width / 2 - 30, machine_depth / 2 - 20, machine_width / 2, machine_depth / 2))
+
+        # The other half of the build plate, see BuildVolume._updateDisallowedAreas
+        if print_mode == "mirror":
+            machine_head_size = math.fabs(machine_head_with_fans_polygon[0][0] - machine_head_with_fans_polygon[2][0])
+            self._disallowed_areas.append(rectangle(-machine_head_size / 2, -machine_depth / 2, machine_width / 2, machine_depth / 2))
+        elif print_mode == "duplication":
+            self._disallowed_areas.append(rectangle(0, -machine_depth / 2, machine_width / 2, machine_depth / 2))
+
+    def getDisallowedAreas(self):
+        return self._disallowed_areas
+
+    def getDisallowedAreasMask(self, width, depth):
+        if (width, depth) not in self._masks:
+            self._masks[(width, depth)] = ShapeArray.rasterize([area.getPoints() for area in self._disallowed_areas], (depth, width), int(width / 2), int(depth / 2))
+        return self._masks[(width, depth)]
+
+
+##  Polygon of a rectangle, clockwise like the convex hulls in the scene
+def rectangle(min_x, min_y, max_x, max_y):
+    return Polygon(numpy.array([[max_x, min_y], [min_x, min_y], [min_x, max_y], [max_x, max_y]], dtype = numpy.float32))
+
+
+##  Outline of an ellipse with half axes a and b, rotated by angle, clockwise
+def ellipse(a, b, angle, point_count = 16):
+    angles = numpy.linspace(2 * math.pi, 0, point_count, endpoint = False)
+    points = numpy.column_stack((a * numpy.cos(angles), b * numpy.sin(angles)))
+    return ShapeArray.rotatePoints(points, angle)
+
+
+##  Random parts: list of (hull points, offset hull points)
+#   \param hull "convex" for roundish parts, "elongated" for long and thin ones
+def makeParts(count, hull):
+    random = numpy.random.RandomState(count)
+    parts = []
+    for _ in range(count):
+        if hull == "convex":
+            a = random.uniform(5, 20)
+            b = a * random.uniform(0.6, 1.0)
+        else:
+            a = random.uniform(15, 40)
+            b = random.uniform(3, 8)
+        angle = random.uniform(0, math.pi)
+        parts.append((ellipse(a, b, angle), ellipse(a + min_offset, b + min_offset, angle)))
+    return parts
+
+
+##  Arrange the parts on a new build plate and return the timings and the placement density
+def run(part_count, hull, disallowed_areas, print_mode, arranger_class):
+    BenchmarkApplication.getGlobalContainerStack().print_mode = print_mode
+    Arrange.build_volume = BenchmarkBuildVolume(disallowed_areas, print_mode)
+    parts = makeParts(part_count, hull)
+
+    start_time = time.perf_counter()
+    arranger = arranger_class.create(fixed_nodes = [])
+    create_time = time.perf_counter() - start_time
+    free_cells = arranger._occupied.size - numpy.count_nonzero(arranger._occupied)
+
+    start_time = time.perf_counter()
+    shapes = [(ShapeArray.fromPolygon(offset_points), ShapeArray.fromPolygon(hull_points)) for hull_points, offset_points in parts]
+    from_polygon_time = time.perf_counter() - start_time
+
+    # Biggest first, like ArrangeObjectsJob
+    shapes.sort(key = lambda shape: shape[0].arr.size, reverse = True)
+
+    best_spot_time = 0
+    place_time = 0
+    placed = 0
+    covered_cells = 0
+    for offset_shape_arr, hull_shape_arr in shapes:
+        start_time = time.perf_counter()
+        best_spot = arranger.bestSpot(offset_shape_arr)
+        best_spot_time += time.perf_counter() - start_time
+        if best_spot.x is None:
+            continue
+
+        start_time = time.perf_counter()
+        arranger.place(best_spot.x, best_spot.y, hull_shape_arr)
+        place_time += time.perf_counter() - start_time
+        placed += 1
+        covered_cells += numpy.count_nonzero(hull_shape_arr.arr)
+
+    return {
+        "parts": part_count,
+        "hull": hull,
+        "disallowed_areas": disallowed_areas,
+        "print_mode": print_mode,
+        "arranger": arranger_class.__name__,
+        "create_time": create_time,
+        "from_polygon_time": from_polygon_time,
+        "best_spot_time": best_spot_time,
+        "place_time": place_time,
+        "placed": placed,
+        "density": covered_cells / free_cells if free_cells else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark the arranger and write the results as JSON.")
+    parser.add_argument("--output", help = "File to write the results to, standard output by default.")
+    parser.add_argument("--parts", type = int, nargs = "+", default = [10, 50, 200], help = "Part counts to try.")
+    parser.add_argument("--arranger", choices = ["Arrange", "HierarchicalArrange"], default = "Arrange")
+    args = parser.parse_args()
+
+    arranger_class = {"Arrange": Arrange, "HierarchicalArrange": HierarchicalArrange}[args.arranger]
+    results = []
+    for part_count, hull, disallowed_areas, print_mode in itertools.product(
+            args.parts, ["convex", "elongated"], [False, True], ["regular", "mirror", "duplication"]):
+        results.append(run(part_count, hull, disallowed_areas, print_mode, arranger_class))
+
+    report = {
+        "machine": {"width": machine_width, "depth": machine_depth},
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent = 2)
+    else:
+        json.dump(report, sys.stdout, indent = 2)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
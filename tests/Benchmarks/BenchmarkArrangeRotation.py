@@ -0,0 +1,98 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+##  Benchmark for arranging with rotations: packing density and wall time.
+#
+#   Places elongated parts on an empty build plate, once in their own orientation and once
+#   trying ArrangeObjectsJob.rotation_count rotations per part, and prints for both the
+#   number of placed parts, the packing density (the part of the bounding box around all placed
+#   parts that is covered) and the time it took.
+#   Run from the Cura root directory with Uranium on the Python path:
+#       python3 tests/Benchmarks/BenchmarkArrangeRotation.py
+
+import math
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from UM.Application import Application
+
+from cura.Arrange import Arrange
+from cura.ShapeArray import ShapeArray
+
+machine_width = 220
+machine_depth = 220
+min_offset = 4
+rotation_count = 8  # same as ArrangeObjectsJob.rotation_count
+
+
+##  Global stack with just the settings that Arrange looks at
+class BenchmarkGlobalStack:
+    def getProperty(self, key, property_name):
+        return {"machine_width": machine_width, "machine_depth": machine_depth, "print_mode": "regular"}.get(key)
+
+
+##  Outline of an ellipse with half axes a and b, as (x, y) points
+def ellipse(a, b, point_count = 24):
+    angles = numpy.linspace(0, 2 * math.pi, point_count, endpoint = False)
+    return numpy.column_stack((a * numpy.cos(angles), b * numpy.sin(angles)))
+
+
+##  Long, thin parts: (hull points, offset hull points)
+def elongatedParts(count):
+    random = numpy.random.RandomState(42)
+    parts = []
+    for _ in range(count):
+        length = random.uniform(30, 80)
+        width = random.uniform(6, 15)
+        # Clockwise, like the convex hulls of scene nodes
+        parts.append((ellipse(length / 2, width / 2)[::-1], ellipse(length / 2 + min_offset, width / 2 + min_offset)[::-1]))
+    return parts
+
+
+##  Arrange the parts like ArrangeObjectsJob does and return (placed parts, packing density)
+def arrange(parts, angles, executor):
+    arranger = Arrange(machine_depth, machine_width, machine_width // 2, machine_depth // 2)
+    arranger.centerFirst()
+
+    placed = 0
+    for hull_points, offset_points in parts:
+        rotated_shapes = []
+        for angle in angles:
+            rotated_shapes.append((angle,
+                                   ShapeArray.fromPolygon(ShapeArray.rotatePoints(offset_points, angle)),
+                                   ShapeArray.fromPolygon(ShapeArray.rotatePoints(hull_points, angle))))
+        angle, best_spot, hull_shape_arr = arranger.bestRotatedSpot(rotated_shapes, executor = executor)
+        if best_spot.x is not None:
+            arranger.place(best_spot.x, best_spot.y, hull_shape_arr)
+            placed += 1
+    occupied_y, occupied_x = numpy.nonzero(arranger._occupied)
+    if len(occupied_y) == 0:
+        return placed, 0.0
+    bounding_box_area = (occupied_y.max() - occupied_y.min() + 1) * (occupied_x.max() - occupied_x.min() + 1)
+    return placed, len(occupied_y) / bounding_box_area
+
+
+def main():
+    application = mock.MagicMock()
+    application.getGlobalContainerStack.return_value = BenchmarkGlobalStack()
+    with mock.patch.object(Application, "getInstance", return_value = application):
+        print("parts  mode       placed  density  time (s)")
+        for part_count in (30, 120):
+            parts = elongatedParts(part_count)
+            for mode, angles in (("fixed", [0]), ("rotate", [2 * math.pi * i / rotation_count for i in range(rotation_count)])):
+                with ThreadPoolExecutor(max_workers = min(len(angles), os.cpu_count() or 1)) as executor:
+                    start_time = time.time()
+                    placed, density = arrange(parts, angles, executor)
+                    wall_time = time.time() - start_time
+                print("%5d  %-9s  %6d  %7.3f  %8.2f" % (part_count, mode, placed, density, wall_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+##  Benchmark for ordering the objects when printing one at a time.
+#
+#   Puts parts on a build plate in rows, spaced so that the print head only reaches the part to the
+#   left of every part, and times OneAtATimeIterator on them: computing the hit map, updating it
+#   after one part moved and finding the printing order. The results are written as JSON.
+#   Run from the Cura root directory with Uranium on the Python path:
+#       python3 tests/Benchmarks/BenchmarkOneAtATime.py --parts 10 50 200
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from UM.Math.Polygon import Polygon
+from UM.Scene.SceneNode import SceneNode
+from UM.Scene.SceneNodeDecorator import SceneNodeDecorator
+
+from cura.OneAtATimeIterator import OneAtATimeIterator
+
+part_size = 10
+# The head reaches further to the left than to the right, like machine_head_with_fans_polygon
+head_polygon = Polygon(numpy.array([[-20, 10], [10, 10], [10, -10], [-20, -10]], numpy.float32))
+column_spacing = part_size + 15  # within the reach of the head on the left side only
+row_spacing = part_size + 30
+columns = 10
+
+
+##  The hulls that ConvexHullDecorator gives for one at a time printing
+class BenchmarkHullDecorator(SceneNodeDecorator):
+    def __init__(self, hull):
+        super().__init__()
+        self.setHull(hull)
+
+    ##  Give the node new hulls, like ConvexHullDecorator does when the node moves
+    def setHull(self, hull):
+        self._hull = hull
+        self._head_full = hull.getMinkowskiHull(head_polygon)
+
+    def getConvexHull(self):
+        return self._hull
+
+    def getConvexHullBoundary(self):
+        return self._hull
+
+    def getConvexHullHeadFull(self):
+        return self._head_full
+
+
+def makeScene(part_count):
+    root = SceneNode()
+    for index in range(part_count):
+        x = (index % columns) * column_spacing
+        y = (index // columns) * row_spacing
+        hull = Polygon(numpy.array([[x, y], [x, y + part_size], [x + part_size, y + part_size], [x + part_size, y]], numpy.float32))
+        node = SceneNode(root)
+        node.addDecorator(BenchmarkHullDecorator(hull))
+    return root
+
+
+def run(part_count):
+    root = makeScene(part_count)
+    iterator = OneAtATimeIterator(root)
+    node_list = root.getChildren()
+
+    start_time = time.perf_counter()
+    hit_map = iterator._computeHitMap(node_list)
+    hit_map_time = time.perf_counter() - start_time
+
+    # Move the first part to the far end of the build plate
+    moved_node = node_list[0]
+    moved_node.callDecoration("setHull", Polygon(moved_node.callDecoration("getConvexHull").getPoints() + [0, row_spacing * (part_count // columns + 1)]))
+    start_time = time.perf_counter()
+    hit_map = iterator._computeHitMap(node_list)
+    moved_hit_map_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    order = iterator._findOrder(hit_map)
+    order_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    ordered_nodes = list(iterator)
+    total_time = time.perf_counter() - start_time
+
+    return {
+        "parts": part_count,
+        "hits": int(numpy.count_nonzero(hit_map)),
+        "ordered": len(ordered_nodes),
+        "solution_found": len(order) == part_count,
+        "hit_map_time": hit_map_time,
+        "moved_hit_map_time": moved_hit_map_time,
+        "order_time": order_time,
+        "total_time": total_time
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark the one at a time ordering and write the results as JSON.")
+    parser.add_argument("--output", help = "File to write the results to, standard output by default.")
+    parser.add_argument("--parts", type = int, nargs = "+", default = [10, 50, 200], help = "Part counts to try.")
+    args = parser.parse_args()
+
+    report = {
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "results": [run(part_count) for part_count in args.parts]
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent = 2)
+    else:
+        json.dump(report, sys.stdout, indent = 2)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,13 @@
+import gc
 import pytest
 import numpy
 import time
+import weakref
+
+from UM.Math.Polygon import Polygon
 
 from cura.Arrange import Arrange
+from cura.HierarchicalArrange import HierarchicalArrange
 from cura.ShapeArray import ShapeArray
 
 
@@ -120,12 +125,44 @@ def test_arrayFromPolygon2():
     assert numpy.any(array)
 
 
+##  Return indices that mark one side of the line
+#   Uses the line defined by p1 and p2 to check array of
+#   input indices against interpolated value
+#   Returns boolean array, with True inside and False outside of shape
+#   This is how ShapeArray used to fill polygons, by intersecting these for all edges.
+#   Originally from: http://stackoverflow.com/questions/37117878/generating-a-filled-polygon-inside-a-numpy-array
+#   \param p1 2-tuple with x, y for point 1
+#   \param p2 2-tuple with x, y for point 2
+#   \param base_array boolean array to project the line on
+def check(p1, p2, base_array):
+    if p1[0] == p2[0] and p1[1] == p2[1]:
+        return
+    idxs = numpy.indices(base_array.shape)  # Create 3D array of indices
+
+    p1 = p1.astype(float)
+    p2 = p2.astype(float)
+
+    if p2[0] == p1[0]:
+        sign = numpy.sign(p2[1] - p1[1])
+        return idxs[1] * sign
+
+    if p2[1] == p1[1]:
+        sign = numpy.sign(p2[0] - p1[0])
+        return idxs[1] * sign
+
+    # Calculate max column idx for each row idx based on interpolated line between two points
+
+    max_col_idx = (idxs[0] - p1[0]) / (p2[0] - p1[0]) * (p2[1] - p1[1]) + p1[1]
+    sign = numpy.sign(p2[0] - p1[0])
+    return idxs[1] * sign <= max_col_idx * sign
+
+
 ##  Line definition -> array with true/false
 def test_check():
     base_array = numpy.zeros([5, 5], dtype=float)
     p1 = numpy.array([0, 0])
     p2 = numpy.array([4, 4])
-    check_array = ShapeArray._check(p1, p2, base_array)
+    check_array = check(p1, p2, base_array)
     assert numpy.any(check_array)
     assert check_array[3][0]
     assert not check_array[0][3]
@@ -136,7 +173,409 @@ def test_check2():
     base_array = numpy.zeros([5, 5], dtype=float)
     p1 = numpy.array([0, 3])
     p2 = numpy.array([4, 3])
-    check_array = ShapeArray._check(p1, p2, base_array)
+    check_array = check(p1, p2, base_array)
     assert numpy.any(check_array)
     assert not check_array[3][0]
     assert check_array[3][4]
+
+
+##  Try out the cells one by one, in order of priority, like bestSpot used to do
+def bestSpotOneByOne(ar, shape_arr, start_prio = 0, step = 1):
+    start_idx = numpy.where(ar._priority_unique_values == start_prio)[0][0]
+    for priority in ar._priority_unique_values[start_idx::step]:
+        tryout_idx = numpy.where(ar._priority == priority)
+        for idx in range(len(tryout_idx[0])):
+            projected_x = tryout_idx[1][idx] - ar._offset_x
+            projected_y = tryout_idx[0][idx] - ar._offset_y
+            penalty_points = ar.checkShape(projected_x, projected_y, shape_arr)
+            if penalty_points is not None:
+                return projected_x, projected_y, penalty_points, priority
+    return None, None, None, priority
+
+
+##  fitMap agrees with checkShape for every cell
+def test_fitMap():
+    ar = Arrange(20, 20, 10, 10)
+    ar.centerFirst()
+    shape_arr = gimmeShapeArray()
+    ar.place(2, 3, shape_arr)
+    ar.place(-6, -4, shape_arr)
+
+    fit_map = ar.fitMap(shape_arr)
+    for y in range(20):
+        for x in range(20):
+            fits = ar.checkShape(x - 10, y - 10, shape_arr) is not None
+            assert fit_map[y][x] == fits
+
+
+##  bestSpot finds the same spots as trying out all cells one by one
+def test_bestSpot_sameAsOneByOne():
+    ar = Arrange(40, 40, 20, 20)
+    ar.centerFirst()
+    shape_arr = gimmeShapeArray()
+
+    for i in range(20):
+        best_spot = ar.bestSpot(shape_arr)
+        assert tuple(best_spot) == bestSpotOneByOne(ar, shape_arr)
+        if best_spot.x is None:
+            break
+        ar.place(best_spot.x, best_spot.y, shape_arr)
+
+
+##  bestSpot with start priority and step
+def test_bestSpot_startPrioStep():
+    ar = Arrange(30, 30, 15, 15)
+    ar.centerFirst()
+    shape_arr = gimmeShapeArray()
+    ar.place(0, 0, shape_arr)
+
+    start_prio = ar._priority_unique_values[3]
+    best_spot = ar.bestSpot(shape_arr, start_prio = start_prio, step = 4)
+    assert tuple(best_spot) == bestSpotOneByOne(ar, shape_arr, start_prio = start_prio, step = 4)
+
+
+##  bestSpot returns an empty suggestion if nothing fits
+def test_bestSpot_full():
+    ar = Arrange(10, 10, 5, 5)
+    ar.centerFirst()
+    ar._occupied = numpy.ones(ar.shape)
+    best_spot = ar.bestSpot(gimmeShapeArray())
+    assert best_spot.x is None
+    assert best_spot.y is None
+    assert best_spot.penalty_points is None
+
+
+##  Fill the polygon by intersecting the sides of all edges, like arrayFromPolygon used to do
+def arrayFromPolygonPerEdge(shape, vertices):
+    base_array = numpy.zeros(shape, dtype=float)
+    fill = numpy.ones(base_array.shape) * True
+    for k in range(vertices.shape[0]):
+        fill = numpy.all([fill, check(vertices[k - 1], vertices[k], base_array)], axis=0)
+    base_array[fill] = 1
+    return base_array
+
+
+##  Convex polygons with vertices on an ellipse, in "ShapeArray" coordinates
+def gimmeConvexPolygons():
+    random = numpy.random.RandomState(1)
+    polygons = []
+    for i in range(20):
+        angles = numpy.sort(random.uniform(0, 2 * numpy.pi, random.randint(3, 60)))
+        radius_x, radius_y = random.uniform(2, 40, 2)
+        vertices = numpy.zeros((len(angles), 2))
+        vertices[:, 0] = radius_x * numpy.cos(angles) + random.uniform(-30, 30)
+        vertices[:, 1] = radius_y * numpy.sin(angles) + random.uniform(-30, 30)
+        polygons.append(vertices)
+    polygons.append(numpy.array([[-10, -5], [-10, 5], [10, 5], [10, -5]], dtype=float))  # axis aligned
+    polygons.append(numpy.array([[-3, 1], [3, 1], [0, -3]], dtype=float))
+    return polygons
+
+
+##  Polygon -> array gives the same result as intersecting the sides of all edges, for convex polygons
+def test_arrayFromPolygon_sameAsPerEdge():
+    for vertices in gimmeConvexPolygons():
+        for ordered_vertices in (vertices, vertices[::-1]):
+            offset = numpy.floor(numpy.amin(ordered_vertices, axis=0))
+            shifted = ordered_vertices - offset
+            shape = [int(numpy.amax(shifted[:, 0])), int(numpy.amax(shifted[:, 1]))]
+            array = ShapeArray.arrayFromPolygon(shape, shifted)
+            assert array.dtype == numpy.uint8
+            assert numpy.array_equal(array, arrayFromPolygonPerEdge(shape, shifted))
+
+
+##  Polygon -> array for a non convex (L-shaped) polygon
+def test_arrayFromPolygon_nonConvex():
+    vertices = numpy.array([[0, 0], [0, 10], [4, 10], [4, 4], [10, 4], [10, 0]], dtype=float)
+    array = ShapeArray.arrayFromPolygon([11, 11], vertices)
+    assert array[2][8]  # in the horizontal leg
+    assert array[8][2]  # in the vertical leg
+    assert not array[8][8]  # in the notch
+    assert not array[5][5]  # just inside the notch
+    assert array[3][3]  # where the legs meet
+
+
+##  Polygon -> array for a polygon that crosses itself, which turns the same way at every vertex
+def test_arrayFromPolygon_pentagram():
+    angles = numpy.arange(5) * 4 * numpy.pi / 5  # Every second point of a pentagon.
+    vertices = numpy.zeros((5, 2))
+    vertices[:, 0] = 20 * numpy.cos(angles) + 20
+    vertices[:, 1] = 20 * numpy.sin(angles) + 20
+    assert not ShapeArray._isConvex(vertices)
+    assert ShapeArray._isConvex(vertices[[0, 3, 1, 4, 2]])  # The pentagon with the same points.
+
+    array = ShapeArray.arrayFromPolygon([41, 41], vertices)
+    assert numpy.array_equal(array, ShapeArray._fillScanline([41, 41], vertices))
+    assert array[37][20]  # in a point of the star
+    assert not array[20][20]  # in the middle, which the even-odd rule leaves out
+
+
+##  The coarse to fine search finds the same spots as the full search
+def test_HierarchicalArrange_sameAsArrange():
+    shapes = [ShapeArray.fromPolygon(vertices[::-1] * 1.3) for vertices in gimmeConvexPolygons()[::4]]
+    shapes.append(gimmeShapeArray())
+    ar = Arrange(97, 60, 30, 48)
+    ar.centerFirst()
+    hierarchical_ar = HierarchicalArrange(97, 60, 30, 48)
+    hierarchical_ar.centerFirst()
+
+    for i in range(30):
+        shape_arr = shapes[i % len(shapes)]
+        assert numpy.any(shape_arr.arr)
+        best_spot = hierarchical_ar.bestSpot(shape_arr)
+        assert tuple(best_spot) == tuple(ar.bestSpot(shape_arr))
+        if best_spot.x is not None:
+            ar.place(best_spot.x, best_spot.y, shape_arr)
+            hierarchical_ar.place(best_spot.x, best_spot.y, shape_arr)
+
+
+##  Placing many copies at once gives the same spots as placing them one by one
+@pytest.mark.parametrize("step", [1, 3])
+def test_placeMany_sameAsOneByOne(step):
+    vertices = gimmeConvexPolygons()[9][::-1] * 0.6
+    offset_shape_arr = ShapeArray.fromPolygon(vertices * 1.2)
+    hull_shape_arr = ShapeArray.fromPolygon(vertices)
+    ar = Arrange(60, 50, 25, 30)
+    ar.centerFirst()
+    ar.place(0, 0, gimmeShapeArray())
+    many_ar = Arrange(60, 50, 25, 30)
+    many_ar.centerFirst()
+    many_ar.place(0, 0, gimmeShapeArray())
+
+    spots = []
+    for i in range(100):
+        best_spot = ar.bestSpot(offset_shape_arr, start_prio = ar._last_priority, step = step)
+        ar._last_priority = best_spot.priority
+        if best_spot.x is None:
+            break
+        spots.append([best_spot.x, best_spot.y])
+        ar.place(best_spot.x, best_spot.y, hull_shape_arr)
+
+    many_spots = many_ar.placeMany(offset_shape_arr, hull_shape_arr, 100, step = step)
+    assert 0 < len(spots) < 100
+    assert many_spots.tolist() == spots
+    assert numpy.array_equal(many_ar._occupied, ar._occupied)
+    assert many_ar._last_priority == ar._last_priority
+
+
+##  placeMany stops at count
+def test_placeMany_count():
+    ar = Arrange(30, 30, 15, 15)
+    ar.centerFirst()
+    assert ar.placeMany(gimmeShapeArray(), gimmeShapeArray(), 0).shape == (0, 2)
+    spots = ar.placeMany(gimmeShapeArray(), gimmeShapeArray(), 3)
+    assert spots.shape == (3, 2)
+    assert spots[0].tolist() == [0, 0]
+
+
+##  Rotating a quarter turn around the Y axis maps x onto -z
+def test_rotatePoints():
+    points = numpy.array([[1.0, 0.0], [0.0, 2.0]])
+    rotated = ShapeArray.rotatePoints(points, numpy.pi / 2)
+    assert numpy.allclose(rotated, [[0.0, -1.0], [2.0, 0.0]])
+
+
+##  A long object that only fits across the build plate is rotated
+def test_bestRotatedSpot():
+    ar = Arrange(30, 10, 5, 15)  # 30 deep, 10 wide
+    ar.centerFirst()
+    vertices = numpy.array([[10, 3], [10, -3], [-10, -3], [-10, 3]])  # 20 wide, 6 deep
+    rotated_shapes = []
+    for angle in (0, numpy.pi / 2):
+        shape_arr = ShapeArray.fromPolygon(ShapeArray.rotatePoints(vertices, angle))
+        rotated_shapes.append((angle, shape_arr, shape_arr))
+    assert numpy.all([numpy.any(shape_arr.arr) for _, shape_arr, _ in rotated_shapes])
+    assert ar.bestSpot(rotated_shapes[0][1]).x is None
+
+    angle, best_spot, hull_shape_arr = ar.bestRotatedSpot(rotated_shapes)
+    assert angle == numpy.pi / 2
+    assert best_spot.x is not None
+    assert hull_shape_arr is rotated_shapes[1][2]
+
+
+##  Check a shape by testing every cell of the shape, like checkShape used to do
+def checkShapePerCell(ar, x, y, shape_arr):
+    offset_x = x + ar._offset_x + shape_arr.offset_x
+    offset_y = y + ar._offset_y + shape_arr.offset_y
+    total = 0
+    for shape_y, shape_x in zip(*numpy.nonzero(shape_arr.arr == 1)):
+        grid_y, grid_x = offset_y + shape_y, offset_x + shape_x
+        if offset_x < 0 or offset_y < 0 or grid_y >= ar.shape[0] or grid_x >= ar.shape[1] or ar._occupied[grid_y][grid_x]:
+            return None
+        total += ar._priority[grid_y][grid_x]
+    return total
+
+
+##  The packed rows give the same occupied cells as the unpacked grid, also around the byte boundaries
+def test_occupiedRegion_place():
+    ar = Arrange(37, 29, 15, 12)
+    ar.centerFirst()
+    shapes = [ShapeArray.fromPolygon(vertices[::-1] * 0.4) for vertices in gimmeConvexPolygons()[:6]]
+    for i, (x, y) in enumerate([(0, 0), (-10, 3), (12, -9), (-14, -12), (14, 16)]):
+        ar.place(x, y, shapes[i % len(shapes)])
+        occupied = ar._occupied
+        for y0, y1, x0, x1 in [(0, 37, 0, 29), (3, 20, 7, 9), (10, 11, 8, 16), (0, 37, 13, 29), (30, 37, 0, 1)]:
+            assert numpy.array_equal(ar._occupiedRegion(y0, y1, x0, x1), occupied[y0:y1, x0:x1])
+            if numpy.any(occupied[y0:y1, x0:x1]):
+                assert ar._mayBeOccupied(y0, y1, x0, x1)
+
+
+##  The hierarchical arranger unpacks only the window it checks, with the cells outside the grid occupied
+def test_occupiedWindow():
+    ar = HierarchicalArrange(37, 29, 15, 12)
+    ar.centerFirst()
+    for vertices in gimmeConvexPolygons()[:4]:
+        ar.place(0, 0, ShapeArray.fromPolygon(vertices[::-1] * 0.4))
+    occupied = ar._occupied
+    for y0, y1, x0, x1 in [(0, 37, 0, 29), (-3, 12, -5, 10), (30, 45, 20, 35), (5, 9, 7, 17)]:
+        assert numpy.array_equal(ar._occupiedWindow(y0, y1, x0, x1), HierarchicalArrange._window(occupied, y0, y1, x0, x1))
+
+
+##  checkShape with the bounding box precheck gives the same results as testing every cell
+def test_checkShape_sameAsPerCell():
+    ar = Arrange(37, 29, 15, 12)
+    ar.centerFirst()
+    ar.place(3, -2, ShapeArray.fromPolygon(gimmeConvexPolygons()[2][::-1] * 0.5))
+    full_shape_arr = ShapeArray(numpy.ones((4, 3), dtype = numpy.uint8), -1, -2)
+    for shape_arr in [gimmeShapeArray(), full_shape_arr]:
+        for y in range(-ar._offset_y - 5, ar.shape[0] - ar._offset_y + 5):
+            for x in range(-ar._offset_x - 5, ar.shape[1] - ar._offset_x + 5):
+                assert ar.checkShape(x, y, shape_arr) == checkShapePerCell(ar, x, y, shape_arr)
+
+
+##  Just enough of a scene node for ShapeArray.fromNode
+class FakeTransformation:
+    def __init__(self, x, z):
+        self._data = numpy.identity(4)
+        self._data[0][3] = x
+        self._data[2][3] = z
+
+
+class FakeNode:
+    def __init__(self, points, x, z):
+        self._transformation = FakeTransformation(x, z)
+        self._hull = Polygon(numpy.array(points, dtype = numpy.float64) + [x, z])
+
+    def callDecoration(self, name):
+        if name == "getConvexHull":
+            return self._hull
+        return None
+
+
+##  Nodes with the same hull share their ShapeArrays, until the hull of a node changes
+def test_fromNode_cache():
+    points = [[10, 5], [10, -5], [-10, -5], [-10, 5]]
+    node = FakeNode(points, 20.3, -13.7)
+    same_node = FakeNode(points, -41.1, 7.9)
+    other_node = FakeNode([[5, 5], [5, -5], [-5, -5], [-5, 5]], 20.3, -13.7)
+
+    offset_shape_arr, hull_shape_arr = ShapeArray.fromNode(node, min_offset = 4)
+    assert ShapeArray.fromNode(same_node, min_offset = 4)[1] is hull_shape_arr
+    assert ShapeArray.fromNode(other_node, min_offset = 4)[1] is not hull_shape_arr
+    assert ShapeArray.fromNode(node, min_offset = 2)[0] is not offset_shape_arr
+    assert numpy.any(hull_shape_arr.arr)
+
+    ShapeArray.invalidateNode(node)
+    new_offset_shape_arr, new_hull_shape_arr = ShapeArray.fromNode(same_node, min_offset = 4)
+    assert new_hull_shape_arr is not hull_shape_arr
+    assert numpy.array_equal(new_hull_shape_arr.arr, hull_shape_arr.arr)
+
+
+##  The cache does not keep the nodes alive
+def test_fromNode_cache_deletedNode():
+    node = FakeNode([[3, 3], [3, -3], [-3, -3], [-3, 3]], 7.1, 2.2)
+    ShapeArray.fromNode(node, min_offset = 4)
+    assert node in ShapeArray._node_cache_keys
+
+    node_reference = weakref.ref(node)
+    del node
+    gc.collect()
+    assert node_reference() is None
+    ShapeArray.invalidateNode(None)
+
+
+##  A node that is printed one at a time, with a head that reaches further to one side
+class FakeHeadNode(FakeNode):
+    head = Polygon(numpy.array([[-20, 10], [10, 10], [10, -10], [-20, -10]], dtype = numpy.float64))
+
+    def callDecoration(self, name, *args):
+        if name == "getConvexHullHead":
+            return self.addConvexHullHead(self._hull)
+        if name == "getConvexHullBoundary":
+            return self._hull
+        if name == "addConvexHullHead":
+            return self.addConvexHullHead(*args)
+        return super().callDecoration(name)
+
+    def addConvexHullHead(self, convex_hull):
+        return convex_hull.getMinkowskiHull(self.head)
+
+
+##  When printing one at a time, the node is rotated but the head around it is not
+def test_fromNode_rotated_head():
+    points = [[10, 3], [10, -3], [-10, -3], [-10, 3]]
+    node = FakeHeadNode(points, 20, -14)
+    offset_shape_arr, hull_shape_arr = ShapeArray.fromNode(node, min_offset = 4, angle = numpy.pi / 2)
+
+    rotated_points = numpy.array([[3, -10], [-3, -10], [-3, 10], [3, 10]], dtype = numpy.float64)  # A quarter turn, see test_rotatePoints
+    expected_points = Polygon(rotated_points).getMinkowskiHull(FakeHeadNode.head).getPoints()
+    expected_shape_arr = ShapeArray.fromPolygon(expected_points)
+    assert numpy.array_equal(hull_shape_arr.arr, expected_shape_arr.arr)
+    assert (hull_shape_arr.offset_x, hull_shape_arr.offset_y) == (expected_shape_arr.offset_x, expected_shape_arr.offset_y)
+
+    # Rotating the node together with its head gives a different shape.
+    head_points = node.callDecoration("getConvexHullHead").getPoints() - [20, -14]
+    assert not numpy.array_equal(hull_shape_arr.arr, ShapeArray.fromPolygon(ShapeArray.rotatePoints(head_points, numpy.pi / 2)).arr)
+
+
+##  A copy of an arranger is independent of the original
+def test_copy():
+    ar = Arrange(30, 30, 15, 15)
+    ar.centerFirst()
+    ar.place(0, 0, gimmeShapeArray())
+    ar_copy = ar.copy(HierarchicalArrange)
+    assert isinstance(ar_copy, HierarchicalArrange)
+    assert numpy.array_equal(ar_copy._occupied, ar._occupied)
+    assert numpy.array_equal(ar_copy._priority, ar._priority)
+
+    ar_copy.place(5, 5, gimmeShapeArray())
+    assert ar_copy.checkShape(5, 5, gimmeShapeArray()) is None
+    assert ar.checkShape(5, 5, gimmeShapeArray()) is not None
+
+
+##  Removing an object by counting the objects per cell gives the same grid as never placing it
+def test_setGrid_remove():
+    shapes = [ShapeArray.fromPolygon(vertices[::-1] * 0.5) for vertices in gimmeConvexPolygons()[:3]]
+    positions = [(0, 0), (4, -3), (-6, 2)]
+    base = Arrange(40, 30, 15, 20)
+    base.centerFirst()
+
+    coverage = numpy.zeros(base.shape, dtype = numpy.int32)
+    areas = []
+    for (x, y), shape_arr in zip(positions, shapes):
+        min_y, max_y, min_x, max_x, mask = base.placedArea(x, y, shape_arr)
+        coverage[min_y:max_y, min_x:max_x] += mask
+        areas.append((min_y, max_y, min_x, max_x, mask))
+    min_y, max_y, min_x, max_x, mask = areas[1]
+    coverage[min_y:max_y, min_x:max_x] -= mask
+    ar = base.copy()
+    ar.setGrid(coverage > 0, numpy.where(coverage > 0, 999, base._priority))
+
+    expected = base.copy()
+    expected.place(*positions[0], shapes[0])
+    expected.place(*positions[2], shapes[2])
+    assert numpy.array_equal(ar._occupied, expected._occupied)
+    assert numpy.array_equal(ar._priority, expected._priority)
+    assert numpy.array_equal(ar._occupied_bits, expected._occupied_bits)
+
+
+##  ShapeArray.rasterize marks the same cells as placing the polygons in an arranger
+def test_rasterize_sameAsPlace():
+    polygons = [v[::-1] for v in gimmeConvexPolygons()]
+    ar = Arrange(120, 140, 70, 60)
+    for vertices in polygons:
+        ar.place(0, 0, ShapeArray.fromPolygon(vertices))
+
+    grid = ShapeArray.rasterize(polygons, ar.shape, 70, 60)
+    # place() never marks the last row and column of the grid
+    assert numpy.array_equal(grid[:-1, :-1], ar._occupied[:-1, :-1] != 0)
+    assert numpy.any(grid)
@@ -0,0 +1,182 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import numpy
+import pytest
+
+from UM.Math.Polygon import Polygon
+from UM.Signal import Signal
+
+import cura.Arrange
+import cura.ArrangeManager
+from cura.Arrange import Arrange
+from cura.ArrangeManager import ArrangeManager
+
+
+class MockGlobalStack:
+    def __init__(self):
+        self.propertyChanged = Signal()
+
+    def getProperty(self, key, property_name):
+        return {
+            "machine_width": 100,
+            "machine_depth": 80,
+            "print_mode": "regular",
+            "machine_head_with_fans_polygon": [[-20, 10], [10, 10], [10, -10], [-20, -10]]
+        }.get(key)
+
+
+class MockApplication:
+    def __init__(self):
+        self.globalContainerStackChanged = Signal()
+        self._global_container_stack = MockGlobalStack()
+
+    def getGlobalContainerStack(self):
+        return self._global_container_stack
+
+
+class MockPreferences:
+    def __init__(self):
+        self.preferenceChanged = Signal()
+
+    def getValue(self, key):
+        return False
+
+
+##  Just enough of a scene node for the manager: a convex hull and children
+class MockNode:
+    def __init__(self, parent, points = None):
+        self._parent = parent
+        self._children = []
+        if parent is not None:
+            parent._children.append(self)
+        self._hull = Polygon(numpy.array(points, dtype = numpy.float32)) if points is not None else None
+
+    def getParent(self):
+        return self._parent
+
+    def getChildren(self):
+        return self._children
+
+    def getAllChildren(self):
+        children = []
+        for child in self._children:
+            children.append(child)
+            children.extend(child.getAllChildren())
+        return children
+
+    def removeChild(self, child):
+        self._children.remove(child)
+        child._parent = None
+
+    def moveTo(self, points):
+        self._hull = Polygon(numpy.array(points, dtype = numpy.float32))
+
+    def callDecoration(self, name):
+        if name == "isSliceable":
+            return self._hull is not None
+        if name == "getConvexHull":
+            return self._hull
+        return None
+
+
+class MockScene:
+    def __init__(self):
+        self.sceneChanged = Signal()
+        self._root = MockNode(None)
+
+    def getRoot(self):
+        return self._root
+
+
+class MockBuildVolume:
+    def __init__(self):
+        self.disallowedAreasChanged = Signal()
+        self.margin = 0
+        self.mask = numpy.zeros((80, 100), dtype = bool)
+
+    def getDisallowedAreasMask(self, width, depth):
+        return self.mask
+
+
+def square(x, y, size = 10):
+    return [[x + size, y], [x, y], [x, y + size], [x + size, y + size]]
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    application = MockApplication()
+    preferences = MockPreferences()
+    for module in (cura.Arrange, cura.ArrangeManager):
+        monkeypatch.setattr(module.Application, "getInstance", lambda: application)
+        monkeypatch.setattr(module.Preferences, "getInstance", lambda: preferences)
+    build_volume = MockBuildVolume()
+    monkeypatch.setattr(Arrange, "build_volume", build_volume)
+    return ArrangeManager(MockScene(), build_volume)
+
+
+##  The arranger of the manager has the same grid as an arranger created with all nodes
+def assertSameAsCreate(manager):
+    nodes = [node for node in manager._scene.getRoot().getAllChildren() if node.callDecoration("isSliceable")]
+    arranger = manager.getArranger()
+    expected = Arrange.create(fixed_nodes = nodes)
+    assert numpy.array_equal(arranger._occupied, expected._occupied)
+    assert numpy.array_equal(arranger._priority, expected._priority)
+    assert numpy.array_equal(arranger._occupied_bits, expected._occupied_bits)
+
+
+##  Adding, moving and removing nodes gives the same grid as creating the arranger again
+def test_getArranger_addMoveRemove(manager):
+    scene = manager._scene
+    first = MockNode(scene.getRoot(), square(-30, -20))
+    assertSameAsCreate(manager)
+
+    group = MockNode(scene.getRoot())
+    second = MockNode(group, square(5, 5))
+    third = MockNode(group, square(8, 10, size = 15))  # overlaps the second node
+    scene.sceneChanged.emit(scene.getRoot())
+    assertSameAsCreate(manager)
+
+    second.moveTo(square(-10, 20))
+    scene.sceneChanged.emit(second)
+    assertSameAsCreate(manager)
+
+    # Moving the group moves its children
+    second.moveTo(square(-5, 25))
+    third.moveTo(square(10, 15, size = 15))
+    scene.sceneChanged.emit(group)
+    assertSameAsCreate(manager)
+
+    scene.getRoot().removeChild(first)
+    scene.sceneChanged.emit(scene.getRoot())
+    assertSameAsCreate(manager)
+
+
+##  Only the nodes that changed are rasterized again
+def test_getArranger_onlyDirtyNodes(manager, monkeypatch):
+    scene = manager._scene
+    first = MockNode(scene.getRoot(), square(-30, -20))
+    second = MockNode(scene.getRoot(), square(5, 5))
+    manager.getArranger()
+
+    read_nodes = []
+    fixed_node_points = Arrange.fixedNodePoints
+    monkeypatch.setattr(Arrange, "fixedNodePoints", lambda node: read_nodes.append(node) or fixed_node_points(node))
+    second.moveTo(square(10, 5))
+    scene.sceneChanged.emit(second)
+    manager.getArranger()
+    assert read_nodes == [second]
+
+
+##  The grid is built again when the disallowed areas change
+def test_getArranger_disallowedAreasChanged(manager):
+    scene = manager._scene
+    MockNode(scene.getRoot(), square(-30, -20))
+    manager.getArranger()
+
+    build_volume = manager._build_volume
+    build_volume.mask = numpy.zeros((80, 100), dtype = bool)
+    build_volume.mask[:5, :] = True
+    build_volume.disallowedAreasChanged.emit()
+    assertSameAsCreate(manager)
+    assert manager.getArranger()._occupied[:5, :].all()
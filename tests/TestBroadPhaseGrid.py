@@ -0,0 +1,41 @@
+import numpy
+
+from UM.Math.Polygon import Polygon
+
+from cura.BroadPhaseGrid import BroadPhaseGrid
+
+
+##  Only the items with overlapping boxes are returned, also across cells
+def test_query():
+    grid = BroadPhaseGrid(cell_size = 10)
+    grid.insert("a", (0, 0, 5, 5))
+    grid.insert("b", (8, 8, 25, 12))
+    grid.insert("c", (-30, -30, -25, -25))
+
+    assert grid.query((4, 4, 9, 9)) == {"a", "b"}
+    assert grid.query((20, 11, 21, 40)) == {"b"}
+    assert grid.query((6, 0, 7, 7)) == set()
+    assert grid.query((-100, -100, 100, 100)) == {"a", "b", "c"}
+
+
+##  Moving and removing items
+def test_insertMovesAndRemove():
+    grid = BroadPhaseGrid(cell_size = 10)
+    grid.insert("a", (0, 0, 5, 5))
+    grid.insert("a", (50, 50, 55, 55))
+    assert len(grid) == 1
+    assert grid.query((0, 0, 5, 5)) == set()
+    assert grid.query((52, 52, 53, 53)) == {"a"}
+
+    grid.remove("a")
+    assert "a" not in grid
+    assert grid.query((-100, -100, 100, 100)) == set()
+    assert grid._cells == {}
+
+
+##  Bounding box of a number of polygons
+def test_boxOfPolygons():
+    square = Polygon(numpy.array([[0, 0], [0, 2], [2, 2], [2, 0]], numpy.float32))
+    triangle = Polygon(numpy.array([[-1, 1], [1, 5], [3, 1]], numpy.float32))
+    assert BroadPhaseGrid.boxOfPolygons(square, None, triangle) == (-1, 0, 3, 5)
+    assert BroadPhaseGrid.boxOfPolygons(None) is None
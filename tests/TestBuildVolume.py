@@ -0,0 +1,457 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import numpy
+import pytest
+
+from UM.Math.AxisAlignedBox import AxisAlignedBox
+from UM.Math.Polygon import Polygon
+from UM.Math.Vector import Vector
+from UM.Signal import Signal
+
+import cura.BuildVolume
+from cura.BuildVolume import BuildVolume
+from cura.DuplicatedNode import DuplicatedNode
+
+
+##  Stack that keeps track of the settings that are read from it
+class MockStack:
+    def __init__(self, stack_id, values, read_settings = None):
+        self.propertyChanged = Signal()
+        self._id = stack_id
+        self.values = values
+        self.metadata = {}
+        self.read_settings = read_settings if read_settings is not None else set()
+
+    def getId(self):
+        return self._id
+
+    def getProperty(self, key, property_name):
+        if property_name != "value":
+            return None
+        self.read_settings.add((self, key))
+        return self.values.get(key)
+
+    def getMetaDataEntry(self, key, default = None):
+        self.read_settings.add((self, "metadata " + key))
+        return self.metadata.get(key, default)
+
+
+class MockExtruderManager:
+    def __init__(self, global_stack, extruders):
+        self._global_stack = global_stack
+        self._extruders = extruders
+        self.used_extruders = extruders
+        self.extruderIds = {str(position): extruder.getId() for position, extruder in enumerate(extruders)}
+
+    def getMachineExtruders(self, machine_id):
+        return self._extruders
+
+    def getActiveExtruderStacks(self):
+        return self._extruders
+
+    def getActiveExtruderStack(self):
+        return self._extruders[0]
+
+    def getUsedExtruderStacks(self):
+        return self.used_extruders
+
+    def getResolveOrValue(self, key):
+        return self._global_stack.getProperty(key, "value")
+
+    def getAllExtruderSettings(self, key, property_name):
+        return [extruder.getProperty(key, property_name) for extruder in self._extruders]
+
+
+class MockContainerRegistry:
+    def __init__(self, stacks):
+        self._stacks = stacks
+
+    def findContainerStacks(self, id):
+        return [stack for stack in self._stacks if stack.getId() == id]
+
+
+class MockScene:
+    def __init__(self):
+        self.sceneChanged = Signal()
+
+
+class MockController:
+    def __init__(self):
+        self._scene = MockScene()
+
+    def getScene(self):
+        return self._scene
+
+
+class MockMachineManager:
+    def __init__(self):
+        self.activeQualityChanged = Signal()
+        self.activeStackChanged = Signal()
+
+
+class MockApplication:
+    def __init__(self):
+        self.globalContainerStackChanged = Signal()
+        self.engineCreatedSignal = Signal()
+        self._controller = MockController()
+        self._machine_manager = MockMachineManager()
+
+    def getGlobalContainerStack(self):
+        return None  # The tests give the build volume a stack of their own
+
+    def getController(self):
+        return self._controller
+
+    def getMachineManager(self):
+        return self._machine_manager
+
+
+class MockTimer:
+    def __init__(self):
+        self.timeout = Signal()
+
+    def setInterval(self, interval):
+        pass
+
+    def setSingleShot(self, single_shot):
+        pass
+
+    def start(self):
+        pass
+
+
+class MockPrintModeManager:
+    duplicated_nodes = []
+
+    @classmethod
+    def getInstance(cls):
+        return cls
+
+    @classmethod
+    def getDuplicatedNodes(cls):
+        return cls.duplicated_nodes
+
+
+##  Just enough of a scene node for the boundary check: a bounding box, a convex hull and children
+class MockNode:
+    def __init__(self, parent = None, points = None, group = False):
+        self._parent = parent
+        self._children = []
+        if parent is not None:
+            parent._children.append(self)
+        self._group = group
+        self._outside_buildarea = None
+        self.moveTo(points)
+
+    def moveTo(self, points):
+        if points is None:
+            self._hull = None
+            self._bbox = None
+            return
+        points = numpy.array(points, dtype = numpy.float32)
+        self._hull = Polygon(points)
+        minimum = numpy.amin(points, axis = 0)
+        maximum = numpy.amax(points, axis = 0)
+        self._bbox = AxisAlignedBox(minimum = Vector(minimum[0], 0, minimum[1]), maximum = Vector(maximum[0], 10, maximum[1]))
+
+    def getParent(self):
+        return self._parent
+
+    def getAllChildren(self):
+        children = []
+        for child in self._children:
+            children.append(child)
+            children.extend(child.getAllChildren())
+        return children
+
+    def getBoundingBox(self):
+        return self._bbox
+
+    def callDecoration(self, name):
+        if name == "isGroup":
+            return self._group
+        if name == "isSliceable":
+            return self._hull is not None and not self._group
+        if name == "getConvexHull":
+            return self._hull
+        return None
+
+
+##  Twin of a node in mirror or duplication mode, without a scene or extruders
+class MockTwin(DuplicatedNode):
+    def __init__(self, node):
+        self.node = node
+        self._outside_buildarea = None
+
+    def getParent(self):
+        return None
+
+    def getAllChildren(self):
+        return []
+
+    def callDecoration(self, name):
+        return None
+
+
+@pytest.fixture
+def build_volume(monkeypatch):
+    application = MockApplication()
+    monkeypatch.setattr(cura.BuildVolume.Application, "getInstance", lambda: application)
+    monkeypatch.setattr(cura.BuildVolume, "Platform", lambda parent: None)
+    monkeypatch.setattr(cura.BuildVolume, "QTimer", MockTimer)
+    monkeypatch.setattr(cura.BuildVolume, "Message", lambda text: None)
+    monkeypatch.setattr(cura.BuildVolume, "PrintModeManager", MockPrintModeManager)
+    MockPrintModeManager.duplicated_nodes = []
+
+    result = BuildVolume()
+    result._global_container_stack = MockStack("global", {
+        "print_mode": "regular",
+        "machine_width": 200,
+        "machine_depth": 100
+    })
+    result._width = 200
+    result._depth = 100
+    result._volume_aabb = AxisAlignedBox(minimum = Vector(-100, 0, -50), maximum = Vector(100, 100, 50))
+    return result
+
+
+def square(x, y, size = 10):
+    return [[x + size, y], [x, y], [x, y + size], [x + size, y + size]]
+
+
+##  Twins take the result of their source node, but only if the source node was checked
+def test_updateNodeBoundaryCheck_twins(build_volume):
+    build_volume._global_container_stack.values["print_mode"] = "mirror"
+    checked = MockNode(points = square(-50, 0))
+    not_checked = MockNode(points = square(-50, 100))  # outside, but not checked
+    checked_twin = MockTwin(checked)
+    not_checked_twin = MockTwin(not_checked)
+    MockPrintModeManager.duplicated_nodes = [checked_twin, not_checked_twin]
+
+    checked_twin._outside_buildarea = True
+    not_checked._outside_buildarea = True
+    not_checked_twin._outside_buildarea = False
+    build_volume.updateNodeBoundaryCheck([checked, checked_twin, not_checked_twin])
+    assert checked._outside_buildarea is False
+    assert checked_twin._outside_buildarea is False
+    assert not_checked_twin._outside_buildarea is False
+
+    checked.moveTo(square(-50, 45))
+    build_volume.updateNodeBoundaryCheck([checked, not_checked])
+    assert checked_twin._outside_buildarea is True
+    assert not_checked_twin._outside_buildarea is True
+
+
+##  The result of the boundary check of a node is kept until its hull or bounding box, the build volume or the disallowed areas change
+def test_isOutsideBuildArea_cache(build_volume, monkeypatch):
+    checks = []
+    may_overlap = build_volume._mayOverlapDisallowedAreas
+    monkeypatch.setattr(build_volume, "_mayOverlapDisallowedAreas", lambda polygon: checks.append(polygon) or may_overlap(polygon))
+    build_volume.setDisallowedAreas([Polygon(numpy.array(square(20, 20), numpy.float32))])
+    build_volume_bounding_box = build_volume.getBoundingBox()
+    node = MockNode(points = square(0, 0))
+    assert build_volume._isOutsideBuildArea(node, build_volume_bounding_box) is False
+    assert len(checks) == 1
+
+    # When printing one at a time, the hull is a new polygon every time
+    node._hull = Polygon(numpy.array(square(0, 0), numpy.float32))
+    assert build_volume._isOutsideBuildArea(node, build_volume_bounding_box) is False
+    assert len(checks) == 1
+
+    node._hull = Polygon(numpy.array(square(15, 15), numpy.float32))
+    assert build_volume._isOutsideBuildArea(node, build_volume_bounding_box) is True
+    assert len(checks) == 2
+
+    node._bbox = node._bbox.set(top = 20)
+    assert build_volume._isOutsideBuildArea(node, build_volume_bounding_box) is True
+    assert len(checks) == 3
+
+    build_volume.setDisallowedAreas([])
+    assert build_volume._isOutsideBuildArea(node, build_volume_bounding_box) is False
+    assert len(checks) == 4
+
+    smaller_build_volume_bounding_box = build_volume_bounding_box.set(right = 5)
+    assert build_volume._isOutsideBuildArea(node, smaller_build_volume_bounding_box) is True
+    assert build_volume._isOutsideBuildArea(node, build_volume_bounding_box) is False
+    assert len(checks) == 5  # The node is outside the smaller box without looking at the areas.
+
+
+##  A changed node is checked with the outermost group around it and everything in that group, parents first
+def test_getNodesToCheck(build_volume):
+    root = MockNode()
+    single = MockNode(root, square(-50, 0))
+    group = MockNode(root, group = True)
+    child = MockNode(group, square(0, 0))
+    inner_group = MockNode(group, group = True)
+    inner_child = MockNode(inner_group, square(20, 0))
+
+    assert build_volume._getNodesToCheck([inner_child]) == [group, child, inner_group, inner_child]
+    assert build_volume._getNodesToCheck([single]) == [single]
+    assert build_volume._getNodesToCheck([child, single, group]) == [group, child, inner_group, inner_child, single]
+
+
+##  A machine with two extruders, with every setting that the disallowed areas are computed from
+@pytest.fixture
+def machine(build_volume, monkeypatch):
+    read_settings = set()
+    global_stack = MockStack("global", {
+        "machine_width": 200,
+        "machine_depth": 100,
+        "machine_center_is_zero": False,
+        "machine_extruder_count": 2,
+        "machine_disallowed_areas": [[[-100, -50], [-90, -50], [-90, -40], [-100, -40]]],
+        "machine_head_with_fans_polygon": [[-20, 10], [10, 10], [10, -10], [-20, -10]],
+        "print_mode": "regular",
+        "print_sequence": "all_at_once",
+        "adhesion_type": "brim",
+        "adhesion_extruder_nr": 0,
+        "support_infill_extruder_nr": 1,
+        "support_enable": True,
+        "support_offset": 0.2,
+        "skirt_gap": 3,
+        "skirt_line_count": 2,
+        "skirt_brim_line_width": 0.4,
+        "initial_layer_line_width_factor": 100,
+        "brim_line_count": 10,
+        "raft_margin": 15,
+        "draft_shield_enabled": True,
+        "draft_shield_dist": 4,
+        "ooze_shield_enabled": True,
+        "ooze_shield_dist": 2,
+        "infill_wipe_dist": 0.1,
+        "travel_avoid_other_parts": True,
+        "travel_avoid_distance": 0.625,
+        "prime_tower_enable": True,
+        "prime_tower_size": 10,
+        "prime_tower_position_x": 190,
+        "prime_tower_position_y": 90
+    }, read_settings)
+    extruders = []
+    for position, nozzle_offset_x, prime_x in ((0, 0, 10), (1, 18, 190)):
+        values = dict(global_stack.values)
+        values.update({
+            "machine_nozzle_offset_x": nozzle_offset_x,
+            "machine_nozzle_offset_y": 0,
+            "nozzle_disallowed_areas": [],
+            "prime_blob_enable": True,
+            "extruder_prime_pos_x": prime_x,
+            "extruder_prime_pos_y": 40
+        })
+        extruders.append(MockStack("extruder_%s" % position, values, read_settings))
+
+    extruder_manager = MockExtruderManager(global_stack, extruders)
+    container_registry = MockContainerRegistry([global_stack] + extruders)
+    monkeypatch.setattr(cura.BuildVolume.ExtruderManager, "getInstance", lambda: extruder_manager)
+    monkeypatch.setattr(cura.BuildVolume.ContainerRegistry, "getInstance", lambda: container_registry)
+    build_volume._global_container_stack = global_stack
+    build_volume._shape = "rectangular"
+    return extruder_manager
+
+
+def assertSameAreas(areas, expected_areas):
+    assert len(areas) == len(expected_areas)
+    for area, expected_area in zip(areas, expected_areas):
+        assert numpy.array_equal(area.getPoints(), expected_area.getPoints())
+
+
+##  Changing any setting that the disallowed areas are computed from changes the fingerprint
+def test_getDisallowedAreasFingerprint(build_volume, machine):
+    global_stack = build_volume._global_container_stack
+    used_extruders = machine.getUsedExtruderStacks()
+    read_settings = global_stack.read_settings
+
+    # Compute the areas in all kinds of situations, to read all settings.
+    for key, value in [(None, None), ("adhesion_type", "skirt"), ("adhesion_type", "raft"), ("adhesion_type", "none"),
+                       ("print_mode", "mirror"), ("print_mode", "duplication"), ("print_sequence", "one_at_a_time"),
+                       ("machine_center_is_zero", True), ("machine_extruder_count", 1), ("support_infill_extruder_nr", -1)]:
+        original_value = global_stack.values.get(key)
+        if key is not None:
+            global_stack.values[key] = value
+        for shape in ("rectangular", "elliptic"):
+            build_volume._shape = shape
+            for extruders in (used_extruders, used_extruders[:1]):
+                build_volume._computeDisallowedAreas(extruders)
+        if key is not None:
+            global_stack.values[key] = original_value
+    build_volume._shape = "rectangular"
+    assert len(read_settings) > 50
+
+    fingerprint = build_volume._getDisallowedAreasFingerprint(used_extruders)
+    for stack, key in sorted(read_settings, key = lambda setting: (setting[0].getId(), setting[1])):
+        if key.startswith("metadata "):
+            stack.metadata[key[len("metadata "):]] = "changed"
+            assert build_volume._getDisallowedAreasFingerprint(used_extruders) != fingerprint, key
+            del stack.metadata[key[len("metadata "):]]
+        else:
+            original_value = stack.values.get(key)
+            stack.values[key] = "changed"
+            assert build_volume._getDisallowedAreasFingerprint(used_extruders) != fingerprint, (stack.getId(), key)
+            stack.values[key] = original_value
+    assert build_volume._getDisallowedAreasFingerprint(used_extruders) == fingerprint
+
+    assert build_volume._getDisallowedAreasFingerprint(used_extruders[:1]) != fingerprint
+    for attribute, value in (("_width", 300), ("_depth", 300), ("_shape", "elliptic")):
+        original_value = getattr(build_volume, attribute)
+        setattr(build_volume, attribute, value)
+        assert build_volume._getDisallowedAreasFingerprint(used_extruders) != fingerprint, attribute
+        setattr(build_volume, attribute, original_value)
+
+
+##  Disallowed areas from the cache are the same as when they are computed again
+def test_updateDisallowedAreas_cache(build_volume, machine, monkeypatch):
+    global_stack = build_volume._global_container_stack
+    global_stack.values["print_mode"] = "duplication"
+    build_volume._updateDisallowedAreas()
+    global_stack.values["adhesion_type"] = "raft"
+    build_volume._updateDisallowedAreas()
+
+    computed = []
+    compute = build_volume._computeDisallowedAreas
+    monkeypatch.setattr(build_volume, "_computeDisallowedAreas", lambda used_extruders: computed.append(used_extruders) or compute(used_extruders))
+    global_stack.values["adhesion_type"] = "brim"
+    build_volume._updateDisallowedAreas()
+    assert computed == []
+    cached_areas = build_volume.getDisallowedAreas()
+    cached_error_areas = list(build_volume._error_areas)
+    cached_margin = build_volume.margin
+
+    build_volume._computeDisallowedAreas(machine.getUsedExtruderStacks())
+    assertSameAreas(cached_areas, build_volume.getDisallowedAreas())
+    assertSameAreas(cached_error_areas, build_volume._error_areas)
+    assert cached_margin == build_volume.margin
+
+
+##  The raster of the disallowed areas never rules out a hull that overlaps an area
+#   The hulls touch the areas from all sides, across the boundaries of the cells of the raster, also
+#   in the first row and column of the raster and at fractional coordinates.
+def test_mayOverlapDisallowedAreas(build_volume):
+    areas = [
+        Polygon(numpy.array([[-100, -50], [-100, 50], [-97, 47], [-97, -47]], numpy.float32)),  # first column
+        Polygon(numpy.array([[100, -50], [-100, -50], [-97, -47], [97, -47]], numpy.float32)),  # first row
+        Polygon(numpy.array([[-30, -20], [-20, -20], [-20, -10], [-30, -10]], numpy.float32)),
+        Polygon(numpy.array([[10.5, 5.25], [20.3, 5.25], [20.3, 15.7], [10.5, 15.7]], numpy.float32)),
+        Polygon(numpy.array([[40.1, 20.6], [47.85, 30.3], [35.45, 33.9]], numpy.float32)),
+        Polygon.approximatedCircle(4.3).translate(-60.7, 25.2)
+    ]
+    build_volume.setDisallowedAreas(areas)
+
+    overlapping = 0
+    ruled_out = 0
+    for area in areas:
+        for corner_x, corner_y in area.getPoints():
+            for size in (0.3, 1.5):
+                # Around the corner, and just touching it
+                xs = list(numpy.arange(corner_x - 2.3, corner_x + 2.3, 0.55)) + [corner_x - size, corner_x]
+                ys = list(numpy.arange(corner_y - 2.3, corner_y + 2.3, 0.55)) + [corner_y - size, corner_y]
+                for x in xs:
+                    for y in ys:
+                        hull = Polygon(numpy.array(square(x, y, size), numpy.float32))
+                        may_overlap = build_volume._mayOverlapDisallowedAreas(hull)
+                        if any(hull.intersectsPolygon(other_area) is not None for other_area in areas):
+                            overlapping += 1
+                            assert may_overlap, (x, y, size)
+                        elif not may_overlap:
+                            ruled_out += 1
+    assert overlapping > 1000
+    assert ruled_out > 200  # The raster does rule out hulls near the areas.
@@ -0,0 +1,272 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import math
+import threading
+
+import numpy
+import pytest
+
+from UM.Math.Matrix import Matrix
+from UM.Math.Polygon import Polygon
+from UM.Signal import Signal
+
+import cura.ConvexHullDecorator
+from cura.ConvexHullDecorator import ConvexHullDecorator, ConvexHullSnapshot
+
+
+##  Mesh with just the convex hull vertices that the decorator asks for
+class MockMesh:
+    def __init__(self, vertices):
+        self._vertices = vertices
+
+    def getConvexHullTransformedVertices(self, transformation):
+        vertices = numpy.column_stack((self._vertices, numpy.ones(len(self._vertices))))
+        return vertices.dot(transformation.getData().T)[:, :3]
+
+
+def gimmeMesh():
+    return MockMesh(numpy.random.RandomState(11).uniform(-20, 20, (40, 3)))
+
+
+def translation(x, z):
+    data = numpy.identity(4)
+    data[0, 3] = x
+    data[2, 3] = z
+    return Matrix(data)
+
+
+##  The points of two hulls are the same, up to the rounding of the hulls to 0.1 mm
+def assertSameHull(hull, expected_hull):
+    points = numpy.array(sorted(map(tuple, hull.getPoints())))
+    expected_points = numpy.array(sorted(map(tuple, expected_hull.getPoints())))
+    assert points.shape == expected_points.shape
+    assert numpy.allclose(points, expected_points, atol = 0.1 + 1e-6)
+
+
+##  Moving a node moves the cached hull, which is the hull that would be computed
+def test_cachedMeshHull_translation():
+    mesh = gimmeMesh()
+    hull, cache = ConvexHullDecorator._computeMeshHull(mesh, translation(3.21, -7.5), 2)
+
+    moved_transform = translation(40.37, 12.04)
+    moved_hull, moved_cache = ConvexHullDecorator._cachedMeshHull(mesh, moved_transform, cache)
+    assertSameHull(moved_hull, ConvexHullDecorator._computeMeshHull(mesh, moved_transform, 2)[0])
+    assert ConvexHullDecorator._cachedMeshHull(mesh, moved_transform, moved_cache)[0] is moved_hull
+
+    # Another mesh is not in the cache
+    assert ConvexHullDecorator._cachedMeshHull(gimmeMesh(), moved_transform, cache) is None
+
+
+##  Moving a node many times does not add up the rounding
+def test_cachedMeshHull_manyTranslations():
+    mesh = gimmeMesh()
+    hull, cache = ConvexHullDecorator._computeMeshHull(mesh, translation(0, 0), 0)
+    for step in range(1, 101):
+        moved_hull, cache = ConvexHullDecorator._cachedMeshHull(mesh, translation(step * 0.04, step * -0.07), cache)
+    assert numpy.allclose(moved_hull.getPoints(), numpy.round(hull.getPoints() + [4, -7], 1))
+
+
+##  Rotating, scaling or mirroring a node computes the hull again
+def test_cachedMeshHull_otherTransformations():
+    mesh = gimmeMesh()
+    hull, cache = ConvexHullDecorator._computeMeshHull(mesh, translation(5, 5), 0)
+
+    angle = math.radians(30)
+    rotation = translation(5, 5).getData().copy()
+    rotation[[0, 0, 2, 2], [0, 2, 0, 2]] = [math.cos(angle), math.sin(angle), -math.sin(angle), math.cos(angle)]
+    scale = translation(5, 5).getData().copy()
+    scale[[0, 1, 2], [0, 1, 2]] = 1.5
+    mirror = translation(5, 5).getData().copy()
+    mirror[0, 0] = -1
+    for data in (rotation, scale, mirror):
+        assert ConvexHullDecorator._cachedMeshHull(mesh, Matrix(data), cache) is None
+
+
+##  The hull of a snapshot is computed from the snapshot alone, with the head when printing one at a time
+def test_computeConvexHull_snapshot():
+    snapshot = ConvexHullSnapshot()
+    snapshot.mesh = gimmeMesh()
+    snapshot.world_transform = translation(10, 20)
+    snapshot.hull_offset = 1
+    hull, mesh_cache = ConvexHullDecorator.computeConvexHull(snapshot)
+    expected_hull, _ = ConvexHullDecorator._computeMeshHull(snapshot.mesh, snapshot.world_transform, 1)
+    assertSameHull(hull, expected_hull)
+
+    # The next snapshot uses the cache of the decorator
+    snapshot.mesh_cache = mesh_cache
+    assert ConvexHullDecorator.computeConvexHull(snapshot) == (hull, mesh_cache)
+
+    snapshot.head = Polygon(numpy.array([[-5, 5], [5, 5], [5, -5], [-5, -5]], numpy.float32))
+    head_hull, _ = ConvexHullDecorator.computeConvexHull(snapshot)
+    assertSameHull(head_hull, hull.getMinkowskiHull(snapshot.head))
+
+
+class MockStack:
+    def __init__(self):
+        self.propertyChanged = Signal()
+        self.containersChanged = Signal()
+        self.values = {"print_sequence": "all_at_once", "machine_extruder_count": 1, "xy_offset": 0,
+                       "xy_offset_layer_0": 0, "mold_enabled": False, "mold_width": 0}
+
+    def getId(self):
+        return "stack"
+
+    def getProperty(self, key, property_name):
+        return self.values[key]
+
+
+class MockBuildVolume:
+    def __init__(self):
+        self.raftThicknessChanged = Signal()
+
+    def getRaftThickness(self):
+        return 0
+
+
+class MockController:
+    def __init__(self, root):
+        self.toolOperationStarted = Signal()
+        self.toolOperationStopped = Signal()
+        self._root = root
+
+    def isToolOperationActive(self):
+        return False
+
+    def getScene(self):
+        return self
+
+    def getRoot(self):
+        return self._root
+
+
+class MockApplication:
+    def __init__(self, root):
+        self.globalContainerStackChanged = Signal()
+        self.stack = MockStack()
+        self._build_volume = MockBuildVolume()
+        self._controller = MockController(root)
+
+    def getBuildVolume(self):
+        return self._build_volume
+
+    def getController(self):
+        return self._controller
+
+    def getGlobalContainerStack(self):
+        return self.stack
+
+
+class MockExtruderManager:
+    def getMachineExtruders(self, stack_id):
+        return []
+
+
+##  Scheduler that only remembers which decorators asked for a new hull
+class MockScheduler:
+    def __init__(self):
+        self.scheduled = []
+
+    def schedule(self, decorator):
+        self.scheduled.append(decorator)
+
+    def cancel(self, decorator):
+        pass
+
+
+class MockNode:
+    def __init__(self, parent = None, mesh = None, position = (0, 0)):
+        self.transformationChanged = Signal()
+        self.parentChanged = Signal()
+        self._parent = parent
+        self._children = []
+        self._mesh = mesh
+        self._position = position
+        self.decorators = []
+        if parent is not None:
+            parent._children.append(self)
+
+    def getParent(self):
+        return self._parent
+
+    def getChildren(self):
+        return self._children
+
+    def getMeshData(self):
+        return self._mesh
+
+    def getWorldTransformation(self):
+        return translation(*self._position)
+
+    def callDecoration(self, function, *args):
+        if function == "isGroup":
+            return self._mesh is None and bool(self._children)
+        for decorator in self.decorators:
+            if hasattr(decorator, function):
+                return getattr(decorator, function)(*args)
+        return None
+
+
+@pytest.fixture
+def application(monkeypatch):
+    application = MockApplication(MockNode())
+    monkeypatch.setattr(cura.ConvexHullDecorator.Application, "getInstance", lambda: application)
+    monkeypatch.setattr(cura.ConvexHullDecorator.ExtruderManager, "getInstance", lambda: MockExtruderManager())
+    scheduler = MockScheduler()
+    monkeypatch.setattr(cura.ConvexHullDecorator.ConvexHullScheduler, "getInstance", lambda: scheduler)
+    monkeypatch.setattr(cura.ConvexHullDecorator.ConvexHullNode, "ConvexHullNode", lambda node, hull, thickness, root: None)
+    return application
+
+
+def gimmeDecoratedNode(parent, mesh = None, position = (0, 0)):
+    node = MockNode(parent, mesh, position)
+    decorator = ConvexHullDecorator()
+    node.decorators.append(decorator)
+    decorator.setNode(node)
+    return node, decorator
+
+
+##  Run the scheduled jobs on a worker thread, like the ConvexHullScheduler does
+def publishHulls(decorators):
+    snapshots = [decorator.takeConvexHullSnapshot() for decorator in decorators]
+    results = []
+    worker = threading.Thread(target = lambda: results.extend(ConvexHullDecorator.computeConvexHull(snapshot) for snapshot in snapshots))
+    worker.start()
+    worker.join()
+    for decorator, (hull, mesh_cache) in zip(decorators, results):
+        decorator.setConvexHull(hull, mesh_cache)
+
+
+##  After a setting changed, the mesh hulls are only computed on the worker thread
+#   The hulls that are asked for in the meantime are the ones that were published last.
+def test_settingChanged_noMeshHullOnMainThread(application, monkeypatch):
+    group, group_decorator = gimmeDecoratedNode(application.getController().getRoot())
+    mesh = gimmeMesh()
+    node, decorator = gimmeDecoratedNode(application.getController().getRoot(), mesh, (10, 20))
+    child, child_decorator = gimmeDecoratedNode(group, gimmeMesh(), (-30, 5))
+    decorators = [group_decorator, decorator, child_decorator]
+    publishHulls(decorators)
+    old_hull = decorator.getConvexHull()
+    old_group_hull = group_decorator.getConvexHull()
+
+    compute_threads = []
+    compute_mesh_hull = ConvexHullDecorator._computeMeshHull
+    def recordThread(mesh, world_transform, hull_offset):
+        compute_threads.append(threading.current_thread())
+        return compute_mesh_hull(mesh, world_transform, hull_offset)
+    monkeypatch.setattr(ConvexHullDecorator, "_computeMeshHull", staticmethod(recordThread))
+
+    application.stack.values["xy_offset"] = 2
+    for decorator_ in decorators:
+        decorator_._onSettingValueChanged("xy_offset", "value")
+    assert decorator.getConvexHull() is old_hull
+    assert group_decorator.getConvexHull() is old_group_hull
+    assert child_decorator._compute2DConvexHull() is not None
+    assert compute_threads == []
+
+    publishHulls(decorators)
+    assert compute_threads
+    assert threading.current_thread() not in compute_threads
+    assertSameHull(decorator.getConvexHull(), compute_mesh_hull(mesh, translation(10, 20), 2)[0])
+    child_hull = child_decorator.getConvexHull()
+    assertSameHull(group_decorator.getConvexHull(), child_hull.getConvexHull().getMinkowskiHull(Polygon(numpy.array([[-2, -2], [-2, 2], [2, 2], [2, -2]], numpy.float32))))
@@ -0,0 +1,129 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import pytest
+
+from UM.Signal import Signal
+
+import cura.ConvexHullScheduler
+from cura.ConvexHullScheduler import ConvexHullScheduler
+
+
+##  Timer that only fires when the test says so
+class MockTimer:
+    def __init__(self):
+        self.timeout = Signal()
+        self.active = False
+
+    def setInterval(self, interval):
+        pass
+
+    def setSingleShot(self, single_shot):
+        pass
+
+    def start(self):
+        self.active = True
+
+    def fire(self):
+        self.active = False
+        self.timeout.emit()
+
+
+##  Job that only runs and finishes when the test says so
+class MockJob:
+    def __init__(self, requests):
+        self.finished = Signal()
+        self.requests = requests
+        self._results = []
+        MockJob.jobs.append(self)
+
+    def start(self):
+        pass
+
+    def finish(self):
+        for decorator, generation, snapshot in self.requests:
+            hull, mesh_cache = decorator.computeConvexHull(snapshot)
+            self._results.append((decorator, generation, hull, mesh_cache))
+        self.finished.emit(self)
+
+    def getResult(self):
+        return self._results
+
+    jobs = []
+
+
+##  Decorator that counts the snapshots and hulls
+class MockDecorator:
+    def __init__(self):
+        self.snapshots = 0
+        self.hulls = []
+
+    def takeConvexHullSnapshot(self):
+        self.snapshots += 1
+        return self.snapshots
+
+    def computeConvexHull(self, snapshot):
+        return "hull %s" % snapshot, None
+
+    def setConvexHull(self, hull, mesh_cache):
+        self.hulls.append(hull)
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    monkeypatch.setattr(cura.ConvexHullScheduler, "QTimer", MockTimer)
+    monkeypatch.setattr(cura.ConvexHullScheduler, "ConvexHullJob", MockJob)
+    MockJob.jobs = []
+    return ConvexHullScheduler()
+
+
+##  Requests for the same decorator are computed once, in one job for all decorators
+def test_schedule_coalesce(scheduler):
+    first = MockDecorator()
+    second = MockDecorator()
+    for _ in range(3):
+        scheduler.schedule(first)
+        scheduler.schedule(second)
+    scheduler._start_timer.fire()
+
+    assert len(MockJob.jobs) == 1
+    assert [request[0] for request in MockJob.jobs[0].requests] == [first, second]
+    MockJob.jobs[0].finish()
+    assert first.hulls == ["hull 1"]
+    assert second.hulls == ["hull 1"]
+    assert scheduler._generations == {}
+
+
+##  The hull of a decorator that changed while the job ran is dropped, it is computed again
+def test_schedule_olderGeneration(scheduler):
+    decorator = MockDecorator()
+    scheduler.schedule(decorator)
+    scheduler._start_timer.fire()
+    scheduler.schedule(decorator)  # Waits for the running job.
+    assert not scheduler._start_timer.active
+
+    MockJob.jobs[0].finish()
+    assert decorator.hulls == []
+    assert scheduler._start_timer.active
+
+    scheduler._start_timer.fire()
+    MockJob.jobs[1].finish()
+    assert decorator.hulls == ["hull 2"]
+
+
+##  Cancelled decorators are forgotten, also when their job is running
+def test_cancel(scheduler):
+    waiting = MockDecorator()
+    running = MockDecorator()
+    scheduler.schedule(running)
+    scheduler._start_timer.fire()
+    scheduler.schedule(waiting)
+
+    scheduler.cancel(waiting)
+    scheduler.cancel(running)
+    assert scheduler._pending == {}
+    assert scheduler._generations == {}
+
+    MockJob.jobs[0].finish()
+    assert running.hulls == []
+    assert len(MockJob.jobs) == 1
@@ -0,0 +1,99 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import numpy
+
+from UM.Math.Matrix import Matrix
+
+import cura.DuplicatedNode
+from cura.ConvexHullDecorator import ConvexHullDecorator
+from cura.DuplicatedNode import DuplicatedNode
+
+
+class MockGlobalStack:
+    def __init__(self, print_mode):
+        self._print_mode = print_mode
+
+    def getProperty(self, key, property_name):
+        return {
+            "print_mode": self._print_mode,
+            "machine_width": 210
+        }.get(key)
+
+
+class MockApplication:
+    def __init__(self, print_mode):
+        self._global_container_stack = MockGlobalStack(print_mode)
+
+    def getGlobalContainerStack(self):
+        return self._global_container_stack
+
+
+##  Mesh with just the convex hull vertices that the decorator asks for
+class MockMesh:
+    def __init__(self, vertices):
+        self._vertices = vertices
+
+    def getConvexHullTransformedVertices(self, transformation):
+        vertices = numpy.column_stack((self._vertices, numpy.ones(len(self._vertices))))
+        return vertices.dot(transformation.getData().T)[:, :3]
+
+
+def gimmeMesh():
+    return MockMesh(numpy.random.RandomState(13).uniform(-20, 20, (40, 3)))
+
+
+##  Position of the source node, with some rotation so the hull is not symmetric by accident
+def gimmeSourceTransform():
+    data = numpy.identity(4)
+    data[[0, 0, 2, 2], [0, 2, 0, 2]] = [0.8, 0.6, -0.6, 0.8]
+    data[0, 3] = -31.4
+    data[2, 3] = 12.7
+    return data
+
+
+##  A twin of which only transformSourceHull is used, so it does not need a scene or extruders
+def gimmeTwin(monkeypatch, print_mode):
+    application = MockApplication(print_mode)
+    monkeypatch.setattr(cura.DuplicatedNode.Application, "getInstance", lambda: application)
+    return DuplicatedNode.__new__(DuplicatedNode)
+
+
+def signedArea(points):
+    return numpy.sum(points[:, 0] * numpy.roll(points[:, 1], -1) - numpy.roll(points[:, 0], -1) * points[:, 1]) / 2
+
+
+##  The hulls have the same points, up to the rounding of the hulls to 0.1 mm, in the same direction
+def assertSameHull(hull, expected_hull):
+    points = numpy.array(sorted(map(tuple, hull.getPoints())))
+    expected_points = numpy.array(sorted(map(tuple, expected_hull.getPoints())))
+    assert points.shape == expected_points.shape
+    assert numpy.allclose(points, expected_points, atol = 0.1 + 1e-6)
+    assert numpy.sign(signedArea(hull.getPoints())) == numpy.sign(signedArea(expected_hull.getPoints()))
+
+
+##  The twin in mirror mode has the hull of the mesh mirrored in x
+def test_transformSourceHull_mirror(monkeypatch):
+    mesh = gimmeMesh()
+    source_hull, _ = ConvexHullDecorator._computeMeshHull(mesh, Matrix(gimmeSourceTransform()), 0)
+
+    twin_transform = numpy.diag([-1.0, 1.0, 1.0, 1.0]).dot(gimmeSourceTransform())
+    expected_hull, _ = ConvexHullDecorator._computeMeshHull(mesh, Matrix(twin_transform), 0)
+    assertSameHull(gimmeTwin(monkeypatch, "mirror").transformSourceHull(source_hull), expected_hull)
+
+
+##  The twin in duplication mode has the hull of the mesh moved by half the width of the machine
+def test_transformSourceHull_duplication(monkeypatch):
+    mesh = gimmeMesh()
+    source_hull, _ = ConvexHullDecorator._computeMeshHull(mesh, Matrix(gimmeSourceTransform()), 0)
+
+    twin_transform = gimmeSourceTransform()
+    twin_transform[0, 3] += 105
+    expected_hull, _ = ConvexHullDecorator._computeMeshHull(mesh, Matrix(twin_transform), 0)
+    assertSameHull(gimmeTwin(monkeypatch, "duplication").transformSourceHull(source_hull), expected_hull)
+
+
+##  There is no twin hull when there are no twins
+def test_transformSourceHull_regular(monkeypatch):
+    source_hull, _ = ConvexHullDecorator._computeMeshHull(gimmeMesh(), Matrix(gimmeSourceTransform()), 0)
+    assert gimmeTwin(monkeypatch, "regular").transformSourceHull(source_hull) is None
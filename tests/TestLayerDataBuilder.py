@@ -0,0 +1,107 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import numpy
+import pytest
+
+from cura.LayerDataBuilder import LayerDataBuilder
+from cura.LayerPolygon import LayerPolygon
+
+##  Layer numbers as the engine sends them, with the raft layers below 0
+layer_ids = list(range(-3, 10))
+material_color_map = numpy.random.RandomState(2).rand(2, 4).astype(numpy.float32)
+
+
+##  The colors of the line types come from the theme, which there is none of here
+@pytest.fixture(autouse = True)
+def color_map(monkeypatch):
+    monkeypatch.setattr(LayerPolygon, "_LayerPolygon__color_map", numpy.random.RandomState(0).rand(11, 4).astype(numpy.float32))
+
+
+##  Adds random polygons to a layer, the same polygons every time for the same seed
+def addPolygons(builder, layer_id, seed):
+    random = numpy.random.RandomState(seed)
+    builder.addLayer(layer_id)
+    builder.setLayerHeight(layer_id, layer_id)
+    for extruder in range(3):
+        point_count = random.randint(2, 20)
+        line_types = random.randint(0, 11, (point_count, 1)).astype("u1")
+        points = random.rand(point_count + 1, 3).astype("f4")
+        line_widths = random.rand(point_count, 1).astype("f4")
+        polygon = LayerPolygon(extruder % 2, line_types, points, line_widths, numpy.zeros((point_count, 1), "f4"))
+        polygon.buildCache()
+        builder.getLayer(layer_id).polygons.append(polygon)
+
+
+##  The layer data built in one go, with the layers renumbered from 0 beforehand
+def gimmeOneShotBuilder():
+    builder = LayerDataBuilder()
+    for layer_id in layer_ids:
+        addPolygons(builder, layer_id - layer_ids[0], layer_id - layer_ids[0])
+    return builder
+
+
+##  Vertices and indices of all layers built into one mesh, running the offsets from layer to layer
+def buildWithRunningOffsets(builder):
+    layers = [builder.getLayer(layer_id) for layer_id in sorted(builder.getLayers())]
+    vertex_count = sum(layer.lineMeshVertexCount() for layer in layers)
+    index_count = sum(layer.lineMeshElementCount() for layer in layers)
+    vertices = numpy.empty((vertex_count, 3), numpy.float32)
+    colors = numpy.empty((vertex_count, 4), numpy.float32)
+    line_dimensions = numpy.empty((vertex_count, 2), numpy.float32)
+    extruders = numpy.empty((vertex_count), numpy.float32)
+    line_types = numpy.empty((vertex_count), numpy.float32)
+    indices = numpy.empty((index_count, 2), numpy.int32)
+
+    vertex_offset = 0
+    index_offset = 0
+    for layer in layers:
+        vertex_offset, index_offset = layer.build(vertex_offset, index_offset, vertices, colors, line_dimensions, extruders, line_types, indices)
+    return vertices, indices.flatten()
+
+
+def assertSameLayerData(layer_data, expected_layer_data):
+    assert numpy.array_equal(layer_data.getVertices(), expected_layer_data.getVertices())
+    assert numpy.array_equal(layer_data.getIndices(), expected_layer_data.getIndices())
+    assert numpy.array_equal(layer_data.getColors(), expected_layer_data.getColors())
+    for name in ("line_dimensions", "extruders", "colors", "line_types"):
+        assert numpy.array_equal(layer_data.getAttribute(name)["value"], expected_layer_data.getAttribute(name)["value"])
+    assert layer_data.getElementCounts() == expected_layer_data.getElementCounts()
+    assert sorted(layer_data.getLayers()) == sorted(expected_layer_data.getLayers())
+
+
+##  Building the layers one by one, and building the layer data in between, gives the same layer data as building it in one go
+def test_build_incremental():
+    builder = LayerDataBuilder()
+    # The layers don't come in in order.
+    for layer_id in [0, 1, -3, 2, -2, -1] + layer_ids[6:]:
+        addPolygons(builder, layer_id, layer_id - layer_ids[0])
+        builder.buildLayer(layer_id)
+        if layer_id in (-3, -1, 4):  # Shown while the rest of the layers come in.
+            builder.build(material_color_map, 0.5, -layer_ids[0])
+    layer_data = builder.build(material_color_map, 0.5, -layer_ids[0])
+
+    one_shot_builder = gimmeOneShotBuilder()
+    expected_layer_data = one_shot_builder.build(material_color_map, 0.5)
+    assertSameLayerData(layer_data, expected_layer_data)
+    assert sorted(layer_data.getLayers()) == list(range(len(layer_ids)))
+
+    expected_vertices, expected_indices = buildWithRunningOffsets(gimmeOneShotBuilder())
+    assert numpy.array_equal(layer_data.getVertices(), expected_vertices)
+    assert numpy.array_equal(layer_data.getIndices(), expected_indices)
+
+
+##  Layers that get more polygons after they were built are built again
+def test_build_layerChanged():
+    # The polygons of the last layer are added after that layer was built.
+    builder = LayerDataBuilder()
+    for layer_id in layer_ids[:-1]:
+        addPolygons(builder, layer_id, layer_id - layer_ids[0])
+        builder.buildLayer(layer_id)
+    builder.addLayer(layer_ids[-1])
+    builder.buildLayer(layer_ids[-1])
+    builder.build(material_color_map)
+    addPolygons(builder, layer_ids[-1], layer_ids[-1] - layer_ids[0])
+    layer_data = builder.build(material_color_map, 1.0, -layer_ids[0])
+
+    assertSameLayerData(layer_data, gimmeOneShotBuilder().build(material_color_map))
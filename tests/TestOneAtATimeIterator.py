@@ -0,0 +1,133 @@
+import numpy
+
+from UM.Math.Polygon import Polygon
+from UM.Scene.SceneNode import SceneNode
+from UM.Scene.SceneNodeDecorator import SceneNodeDecorator
+
+from cura.OneAtATimeIterator import OneAtATimeIterator
+
+head_polygon = Polygon(numpy.array([[-20, 10], [10, 10], [10, -10], [-20, -10]], numpy.float32))
+
+
+##  The hulls that ConvexHullDecorator gives for one at a time printing, for a square part
+class HullDecorator(SceneNodeDecorator):
+    def __init__(self, x, y = 0):
+        super().__init__()
+        self.moveTo(x, y)
+
+    ##  Move the part, which gives it new hulls like ConvexHullDecorator does
+    def moveTo(self, x, y = 0):
+        self._hull = Polygon(numpy.array([[x, y], [x, y + 10], [x + 10, y + 10], [x + 10, y]], numpy.float32))
+        self._head_full = self._hull.getMinkowskiHull(head_polygon)
+
+    def getConvexHull(self):
+        return self._hull
+
+    def getConvexHullBoundary(self):
+        return self._hull
+
+    def getConvexHullHeadFull(self):
+        return self._head_full
+
+
+##  The depth first search that OneAtATimeIterator used to do, to compare with
+def searchOrder(hit_map):
+    count = hit_map.shape[0]
+    todo_list = [([], list(range(count)))]
+    while todo_list:
+        order, todo = todo_list.pop()
+        for node in todo:
+            if any(hit_map[node][other] for other in order):
+                continue
+            if any(hit_map[other][node] for other in todo if other != node):
+                continue
+            new_todo = [other for other in todo if other != node]
+            if not new_todo:
+                return order + [node]
+            todo_list.append((order + [node], new_todo))
+    return []
+
+
+##  Random hit map without cycles: every node only blocks nodes with a higher rank
+def gimmeHitMap(count, random):
+    rank = random.permutation(count)
+    hit_map = (random.uniform(size = (count, count)) < 0.2) & (rank[:, numpy.newaxis] > rank[numpy.newaxis, :])
+    return hit_map
+
+
+##  The topological sort finds the same order as the depth first search
+def test_findOrder_sameAsSearch():
+    random = numpy.random.RandomState(3)
+    for count in [2, 3, 5, 8, 12]:
+        for _ in range(10):
+            hit_map = gimmeHitMap(count, random)
+            order = OneAtATimeIterator._findOrder(hit_map)
+            assert order == searchOrder(hit_map)
+            assert sorted(order) == list(range(count))
+
+
+##  Every node is printed after the nodes that it can not be printed before
+def test_findOrder_valid():
+    hit_map = gimmeHitMap(200, numpy.random.RandomState(4))
+    order = OneAtATimeIterator._findOrder(hit_map)
+    position = {index: place for place, index in enumerate(order)}
+    for j, i in zip(*numpy.nonzero(hit_map)):
+        assert position[j] < position[i]
+
+
+##  Nodes that wait for each other in a cycle can not be ordered
+def test_findOrder_cycle():
+    hit_map = numpy.zeros((4, 4), dtype = bool)
+    hit_map[0, 1] = hit_map[1, 2] = hit_map[2, 0] = True
+    assert OneAtATimeIterator._findOrder(hit_map) == []
+    assert searchOrder(hit_map) == []
+
+
+##  The hit map of a scene is updated for the nodes that moved
+def test_computeHitMap_moved():
+    root = SceneNode()
+    for x in [0, 25, 50]:
+        SceneNode(root).addDecorator(HullDecorator(x))
+    nodes = root.getChildren()
+    iterator = OneAtATimeIterator(root)
+
+    # The head only reaches the part on the left
+    expected = numpy.zeros((3, 3), dtype = bool)
+    expected[1, 0] = expected[2, 1] = True
+    assert numpy.array_equal(iterator._computeHitMap(nodes), expected)
+    assert list(iterator) == [nodes[2], nodes[1], nodes[0]]
+
+    nodes[2].callDecoration("moveTo", 100)
+    expected[2, 1] = False
+    assert numpy.array_equal(OneAtATimeIterator(root)._computeHitMap(nodes), expected)
+
+    nodes[0].callDecoration("moveTo", 125)
+    expected = numpy.zeros((2, 2), dtype = bool)
+    expected[1, 0] = True
+    assert numpy.array_equal(OneAtATimeIterator(root)._computeHitMap([nodes[2], nodes[0]]), expected)
+
+
+##  The hit map as OneAtATimeIterator._checkHit used to make it, with Polygon.intersectsPolygon
+def checkHitMap(nodes):
+    hit_map = numpy.zeros((len(nodes), len(nodes)), dtype = bool)
+    for j, head_node in enumerate(nodes):
+        for i, node in enumerate(nodes):
+            if i != j:
+                hit_map[j][i] = node.callDecoration("getConvexHullBoundary").intersectsPolygon(head_node.callDecoration("getConvexHullHeadFull")) is not None
+    return hit_map
+
+
+##  A head that only touches a part, along an edge or in a corner, hits that part
+def test_computeHitMap_touching():
+    root = SceneNode()
+    # The heads reach 20 mm to the left of each part, and 10 mm to the right, front and back.
+    for x, y in [(0, 0), (30, 0), (60, 0), (90, 20), (80, -50)]:
+        SceneNode(root).addDecorator(HullDecorator(x, y))
+    nodes = root.getChildren()
+
+    expected = numpy.zeros((5, 5), dtype = bool)
+    expected[1, 0] = expected[2, 1] = expected[3, 2] = True
+    hit_map = OneAtATimeIterator(root)._computeHitMap(nodes)
+    assert numpy.array_equal(hit_map, expected)
+    assert numpy.array_equal(hit_map, checkHitMap(nodes))
+    assert list(OneAtATimeIterator(root)) == [nodes[index] for index in searchOrder(expected)]
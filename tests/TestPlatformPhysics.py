@@ -0,0 +1,194 @@
+# Copyright (c) 2017 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import numpy
+import pytest
+
+from UM.Math.Polygon import Polygon
+from UM.Signal import Signal
+
+import cura.PlatformPhysics
+from cura.ConvexHullNode import ConvexHullNode
+from cura.PlatformPhysics import PlatformPhysics
+
+
+##  Just enough of a scene node for the physics: a convex hull and children
+class MockNode:
+    def __init__(self, parent, points = None, group = False):
+        self._parent = parent
+        self._children = []
+        if parent is not None:
+            parent._children.append(self)
+        self._hull = Polygon(numpy.array(points, dtype = numpy.float32)) if points is not None else None
+        self._group = group
+        self._outside_buildarea = False
+
+    def getParent(self):
+        return self._parent
+
+    def getChildren(self):
+        return self._children
+
+    def getAllChildren(self):
+        children = []
+        for child in self._children:
+            children.append(child)
+            children.extend(child.getAllChildren())
+        return children
+
+    def getBoundingBox(self):
+        return self._hull
+
+    def isEnabled(self):
+        return True
+
+    def getDecorator(self, decorator_type):
+        return decorator_type  # Every node has all decorators already.
+
+    def callDecoration(self, name):
+        if name == "isGroup":
+            return True if self._group else None
+        if name == "getConvexHull":
+            return self._hull
+        return None
+
+
+class MockScene:
+    def __init__(self):
+        self.sceneChanged = Signal()
+        self._root = MockNode(None)
+
+    def getRoot(self):
+        return self._root
+
+
+class MockController:
+    def __init__(self):
+        self.toolOperationStarted = Signal()
+        self.toolOperationStopped = Signal()
+        self._scene = MockScene()
+
+    def getScene(self):
+        return self._scene
+
+
+class MockBuildVolume:
+    def __init__(self):
+        self.checked_nodes = set()
+
+    def updateNodeBoundaryCheck(self, nodes = None):
+        self.checked_nodes = set(nodes)
+
+
+class MockApplication:
+    def __init__(self):
+        self._build_volume = MockBuildVolume()
+
+    def getBuildVolume(self):
+        return self._build_volume
+
+
+class MockPreferences:
+    def addPreference(self, key, default_value):
+        pass
+
+    def getValue(self, key):
+        return key == "physics/automatic_push_free"
+
+
+class MockTimer:
+    def __init__(self):
+        self.timeout = Signal()
+
+    def setInterval(self, interval):
+        pass
+
+    def setSingleShot(self, single_shot):
+        pass
+
+    def start(self):
+        pass
+
+
+##  Records the nodes that are pushed, without moving them
+class MockOperation:
+    def __init__(self, node, translation):
+        self._node = node
+
+    def push(self):
+        MockOperation.pushed_nodes.append(self._node)
+
+    pushed_nodes = []
+
+
+@pytest.fixture
+def physics(monkeypatch):
+    application = MockApplication()
+    preferences = MockPreferences()
+    monkeypatch.setattr(cura.PlatformPhysics.Application, "getInstance", lambda: application)
+    monkeypatch.setattr(cura.PlatformPhysics.Preferences, "getInstance", lambda: preferences)
+    monkeypatch.setattr(cura.PlatformPhysics, "QTimer", MockTimer)
+    # Only nodes of the exact type SceneNode are simulated.
+    monkeypatch.setattr(cura.PlatformPhysics, "SceneNode", MockNode)
+    monkeypatch.setattr(cura.PlatformPhysics.PlatformPhysicsOperation, "PlatformPhysicsOperation", MockOperation)
+    MockOperation.pushed_nodes = []
+    return PlatformPhysics(MockController(), None)
+
+
+def square(x, y, size = 10):
+    return [[x + size, y], [x, y], [x, y + size], [x + size, y + size]]
+
+
+##  Nodes that are new or changed are dirty, and so are their parents and children
+def test_collectDirtyNodes(physics):
+    scene = physics._controller.getScene()
+    root = scene.getRoot()
+    group = MockNode(root, square(0, 0, size = 30), group = True)
+    first = MockNode(group, square(0, 0))
+    second = MockNode(group, square(20, 20))
+    other = MockNode(root, square(-50, -50))
+    scene_order, dirty_nodes = physics._collectDirtyNodes(root)
+    assert dirty_nodes == {group, first, second, other}
+    assert physics._collectDirtyNodes(root)[1] == set()
+
+    scene.sceneChanged.emit(first)
+    assert physics._collectDirtyNodes(root)[1] == {first, group}
+
+    scene.sceneChanged.emit(group)
+    assert physics._collectDirtyNodes(root)[1] == {group, first, second}
+
+    # Removed nodes leave the grid
+    root._children.remove(other)
+    assert physics._collectDirtyNodes(root)[1] == set()
+    assert other not in physics._grid
+
+
+##  A new convex hull of a node makes that node dirty
+def test_collectDirtyNodes_convexHullNode(physics):
+    scene = physics._controller.getScene()
+    root = scene.getRoot()
+    node = MockNode(root, square(0, 0))
+    MockNode(root, square(-50, -50))
+    physics._collectDirtyNodes(root)
+
+    hull_node = ConvexHullNode.__new__(ConvexHullNode)
+    hull_node._node = node
+    scene.sceneChanged.emit(hull_node)
+    assert physics._collectDirtyNodes(root)[1] == {node}
+
+
+##  Only the nodes that changed are pushed, other nodes that overlap are left alone
+def test_onChangeTimerFinished_onlyDirtyNodes(physics, monkeypatch):
+    monkeypatch.setattr(cura.PlatformPhysics.random, "shuffle", lambda nodes: None)  # Push in scene order.
+    scene = physics._controller.getScene()
+    root = scene.getRoot()
+    moved = MockNode(root, square(0, 0))
+    near = MockNode(root, square(5, 5))
+    MockNode(root, square(-50, -50))
+    MockNode(root, square(-45, -45))
+    physics._collectDirtyNodes(root)
+
+    scene.sceneChanged.emit(moved)
+    physics._onChangeTimerFinished()
+    assert MockOperation.pushed_nodes == [moved]
+    assert cura.PlatformPhysics.Application.getInstance().getBuildVolume().checked_nodes == {moved, near}
@@ -0,0 +1,108 @@
+import numpy
+
+from UM.Math.Polygon import Polygon
+
+from cura.PolygonOverlap import PolygonOverlap
+
+
+def square(x, y, size):
+    return Polygon(numpy.array([[x, y], [x, y + size], [x + size, y + size], [x + size, y]], numpy.float32))
+
+
+##  The vectors are the ones of Polygon.intersectsPolygon, NaN where it returns None
+def assertSameAsIntersectsPolygon(first, second, vectors):
+    for polygon, other, vector in zip(first, second, vectors):
+        expected = polygon.intersectsPolygon(other)
+        if expected is None:
+            assert numpy.all(numpy.isnan(vector))
+        else:
+            assert numpy.allclose(vector, expected, atol = 1e-5)
+
+
+##  The vector moves the first polygon out of the second one over the shortest distance
+def test_minimumTranslationVectors():
+    first = [square(0, 0, 10), square(0, 0, 10), square(0, 0, 10)]
+    second = [square(8, 1, 10), square(1, -9, 10), square(20, 0, 10)]
+    vectors = PolygonOverlap.minimumTranslationVectors(first, second)
+
+    assert numpy.allclose(vectors[0], [-2.1, 0])
+    assert numpy.allclose(vectors[1], [0, 1.1])
+    assert numpy.all(numpy.isnan(vectors[2]))
+    assertSameAsIntersectsPolygon(first, second, vectors)
+
+
+##  Polygons that touch in an edge or a corner overlap, like they do for Polygon.intersectsPolygon
+def test_minimumTranslationVectors_touching():
+    rectangle = Polygon(numpy.array([[10, 2], [10, 6], [25, 6], [25, 2]], numpy.float32))
+    first = [square(0, 0, 10)] * 6 + [rectangle] * 2
+    second = [square(10, 0, 10), square(10, 10, 10), square(0, -10, 10), square(-10, 3, 10), square(10.5, 0, 10), square(3, 10, 2), square(0, 0, 10), square(25, 6, 1)]
+    vectors = PolygonOverlap.minimumTranslationVectors(first, second)
+
+    assert numpy.all(numpy.isnan(vectors[4]))
+    assert not numpy.any(numpy.isnan(numpy.delete(vectors, 4, axis = 0)))
+    assertSameAsIntersectsPolygon(first, second, vectors)
+    assertSameAsIntersectsPolygon(second, first, PolygonOverlap.minimumTranslationVectors(second, first))
+
+
+##  A polygon inside another one overlaps it, either way around
+def test_minimumTranslationVectors_containing():
+    pentagon = Polygon(numpy.array([[-2, 4], [4, 9], [6, 1], [5, -3], [0, -4]], numpy.float32))
+    first = [square(0, 0, 10), square(2, 3, 4), square(0, 0, 10), pentagon, square(-10, -10, 30)]
+    second = [square(2, 3, 4), square(0, 0, 10), square(0, 0, 10), square(-10, -10, 30), pentagon]
+    vectors = PolygonOverlap.minimumTranslationVectors(first, second)
+
+    assert not numpy.any(numpy.isnan(vectors))
+    assertSameAsIntersectsPolygon(first, second, vectors)
+
+
+##  Random polygons give the same vectors as Polygon.intersectsPolygon
+#   Only the squares touch each other. Whether polygons that touch along a slanted edge overlap
+#   depends on rounding, in Polygon.intersectsPolygon as well.
+def test_minimumTranslationVectors_sameAsIntersectsPolygon():
+    random = numpy.random.RandomState(3)
+    polygons = [Polygon(numpy.array(random.uniform(0, 20, (random.randint(3, 8), 2)), numpy.float32)).getConvexHull() for i in range(40)]
+    polygons += [square(x, y, 5) for x in range(0, 20, 5) for y in range(0, 20, 5)]
+    first = [a for a in polygons for b in polygons]
+    second = [b for a in polygons for b in polygons]
+    vectors = PolygonOverlap.minimumTranslationVectors(first, second)
+
+    assert numpy.any(numpy.isnan(vectors[:, 0])) and not numpy.all(numpy.isnan(vectors[:, 0]))
+    assertSameAsIntersectsPolygon(first, second, vectors)
+
+
+##  Moving the first polygon by its vector separates the polygons
+def test_minimumTranslationVectors_separates():
+    triangle = Polygon(numpy.array([[0, 0], [5, 10], [10, 0]], numpy.float32))
+    others = [square(3, 3, 6), Polygon(numpy.array([[-2, 4], [4, 9], [6, 1], [5, -3], [0, -4]], numpy.float32))]
+    vectors = PolygonOverlap.minimumTranslationVectors([triangle, triangle], others)
+    assert not numpy.any(numpy.isnan(vectors))
+
+    moved = [Polygon(triangle.getPoints() + vector * 1.001) for vector in vectors]
+    assert numpy.all(numpy.isnan(PolygonOverlap.minimumTranslationVectors(moved, others)))
+
+
+##  Offsets and polygons without points
+def test_minimumTranslationVectors_offsetAndEmpty():
+    vectors = PolygonOverlap.minimumTranslationVectors(
+        [square(0, 0, 10), square(0, 0, 10), square(0, 0, 10), None],
+        [square(20, 0, 10), square(12, 0, 10), Polygon(numpy.zeros((0, 2))), square(0, 0, 10)],
+        offset = [[15, 0], [0, 0], [0, 0], [0, 0]])
+
+    assert numpy.allclose(vectors[0], [-5.1, 0])
+    assert numpy.all(numpy.isnan(vectors[1:]))
+
+
+##  The overlap matrix agrees with the minimum translation vectors of every pair
+def test_overlapMatrix():
+    random = numpy.random.RandomState(5)
+    first = [Polygon(numpy.array([[x, y], [x + 4, y + 9], [x + 10, y]], numpy.float32)) for x, y in random.uniform(0, 40, (12, 2))]
+    second = [square(x, y, size) for x, y, size in random.uniform(0, 40, (9, 3))] + [None]
+    second[0] = square(first[0].getPoints()[2][0], first[0].getPoints()[2][1], 5)  # Only touches the corner of a triangle.
+    matrix = PolygonOverlap.overlapMatrix(first, second)
+
+    pairs = [(a, b) for a in first for b in second]
+    vectors = PolygonOverlap.minimumTranslationVectors([a for a, _ in pairs], [b for _, b in pairs])
+    assert matrix.shape == (12, 10)
+    assert matrix[0][0]
+    assert numpy.array_equal(matrix.ravel(), ~numpy.isnan(vectors[:, 0]))
+    assert numpy.any(matrix) and not numpy.all(matrix)